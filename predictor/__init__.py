@@ -1,45 +1,228 @@
+import numpy
 from http import HTTPStatus
 from django.conf import settings
-from predictor.client import LBDPredictorApiClient, LBDPredictorLocalClient
+from asgiref.sync import async_to_sync
+from predictor.breaker import predictor_breaker
+from predictor.client import LBDPredictorApiClient, LBDPredictorLocalClient, AsyncLBDPredictorApiClient
 
 
-def predict_lbd_probability(user, data, model):
+def get_lbd_predictor(user):
+    """
+    Gets the LBD predictor (API or local, according to the predictor configuration).
+
+    :param user: user model instance
+    :type user: User instance
+    :return: LBD predictor
+    :rtype: LBDPredictorApiClient or LBDPredictorLocalClient
+    """
+    if getattr(settings, 'PREDICTOR_CONFIGURATION', {}).get('use_api_predictor', False) is True:
+        return LBDPredictorApiClient(user)
+    return LBDPredictorLocalClient()
+
+
+def predict_lbd_probability(user, data, model, predictor=None):
     """
     Predicts the LBD probability via the Predictor API.
 
+    The feature values can be a single feature vector (a single probability is returned) or an (n, d)
+    feature matrix (an array of n probabilities is returned, with NaN for the rows that failed).
+
     :param user: user model instance
     :type user: User instance
     :param data: data to be used for the prediction
     :type data: data supported by the API
     :param model: model identifier to be used
     :type model: str
-    :return: predicted LBD probability
-    :rtype: float
+    :param predictor: LBD predictor to be used (prepared according to the configuration if not set)
+    :type predictor: LBDPredictorApiClient or LBDPredictorLocalClient, optional
+    :return: predicted LBD probability (probabilities)
+    :rtype: float (numpy.ndarray)
     """
 
     # Prepare the LBD predictor using the provided user instance
-    if getattr(settings, 'PREDICTOR_CONFIGURATION', {}).get('use_api_predictor', False) is True:
-        predictor = LBDPredictorApiClient(user)
-    else:
-        predictor = LBDPredictorLocalClient()
+    predictor = predictor or get_lbd_predictor(user)
 
-    # Validate if there are data to be used for the prediction
+    # Get the number of the rows (None for a single feature vector)
     labels, values = data
+    n_rows = len(values) if numpy.ndim(values) == 2 else None
+
+    # Prepare the probabilities
+    probabilities = numpy.full(n_rows, numpy.nan) if n_rows is not None else None
+
+    # Validate if there are data to be used for the prediction
     if values.size == 0:
-        return None
+        return probabilities
+
+    # Short-circuit the prediction if the predictor API is failing (circuit breaker is open)
+    breaker = get_lbd_predictor_breaker(predictor)
+    if breaker and not breaker.allow():
+        return probabilities
 
     # Predict the LBD probability via the LBD predictor using the provided data and model identifier
-    response, status_code = predictor.predict_proba(data=data, model=model)
+    response = predictor.predict_proba(data=data, model=model)
+
+    # Record the result of the prediction (circuit breaker)
+    if breaker:
+        breaker.record(response)
+
+    # Return the predicted LBD probability (probabilities)
+    return get_lbd_probability_from_response(response, n_rows)
+
+
+def get_lbd_probability_from_response(response, n_rows=None):
+    """
+    Gets the LBD probability (probabilities) from the predictor response.
+
+    :param response: predictor response (None if the prediction could not be prepared)
+    :type response: tuple (data/error_info, status_code)
+    :param n_rows: number of the rows of the feature matrix (None for a single feature vector)
+    :type n_rows: int, optional
+    :return: predicted LBD probability (probabilities, NaN for the rows that failed)
+    :rtype: float (numpy.ndarray)
+    """
+
+    # Prepare the probabilities
+    probabilities = numpy.full(n_rows, numpy.nan) if n_rows is not None else None
+
+    # Get the response and the status code
+    response, status_code = response if response else (None, None)
+
+    # Get the predicted data
+    predicted = response.get('predicted') if status_code == HTTPStatus.OK and response else None
+    if predicted is None:
+        return probabilities
+
+    # Get the LBD probability (single feature vector)
+    if n_rows is None:
+        return round(float(predicted[0, 1]) * 100, 2)
+
+    # Get the LBD probabilities (feature matrix; the failed rows stay NaN)
+    if len(predicted) == n_rows:
+        failed = set(response.get('failed', ()))
+        for i, probability in enumerate(predicted[:, 1]):
+            if i not in failed and not numpy.isnan(probability):
+                probabilities[i] = round(float(probability) * 100, 2)
+
+    # Return the predicted LBD probabilities
+    return probabilities
+
+
+def predict_lbd_probabilities(user, data, model):
+    """
+    Predicts the LBD probabilities for multiple feature vectors via the Predictor API.
+
+    The feature vectors sharing the same feature labels are stacked into a single 2-D feature matrix,
+    so the predictor is called once per distinct set of feature labels (once in the common case). The
+    calls of the predictor API are run concurrently.
 
-    # Get the LBD probability
-    if status_code == HTTPStatus.OK:
-        probability = response.get('predicted') if response else None
-        probability = round(float(probability[0, 1]) * 100, 2) if probability is not None else None
+    :param user: user model instance
+    :type user: User instance
+    :param data: data to be used for the prediction (one item per feature vector)
+    :type data: list of tuples (feature labels, feature values)
+    :param model: model identifier to be used
+    :type model: str
+    :return: predicted LBD probabilities (None for the vectors that could not be predicted)
+    :rtype: list
+    """
+
+    # Prepare the LBD predictor using the provided user instance
+    predictor = get_lbd_predictor(user)
+
+    # Prepare the probabilities
+    probabilities = [None] * len(data)
+
+    # Group the feature vectors by the feature labels (skip the vectors with no data)
+    groups = {}
+    for i, (labels, values) in enumerate(data):
+        if values.size != 0:
+            groups.setdefault((tuple(labels), values.size), []).append(i)
+
+    # Stack the feature vectors of every group into a feature matrix
+    matrices = [
+        (list(labels), numpy.vstack([data[i][1] for i in indices]))
+        for (labels, _), indices in groups.items()
+    ]
+
+    # Predict the LBD probabilities via the LBD predictor (single call per group; the groups are predicted
+    # concurrently via the predictor API)
+    if isinstance(predictor, LBDPredictorApiClient) and len(matrices) > 1:
+        responses = predict_lbd_probabilities_concurrently(user, matrices, model)
+        predicted_matrices = [
+            get_lbd_probability_from_response(response, len(values))
+            for response, (_, values) in zip(responses, matrices)
+        ]
     else:
-        probability = None
+        predicted_matrices = [
+            predict_lbd_probability(user, matrix, model, predictor=predictor)
+            for matrix in matrices
+        ]
+
+    for indices, predicted in zip(groups.values(), predicted_matrices):
+
+        # Get the LBD probabilities (None for the failed rows)
+        for i, probability in zip(indices, predicted):
+            probabilities[i] = None if numpy.isnan(probability) else float(probability)
+
+    # Return the predicted LBD probabilities
+    return probabilities
+
+
+def get_lbd_predictor_breaker(predictor):
+    """
+    Gets the circuit breaker of the LBD predictor (only the predictor API calls are guarded).
+
+    :param predictor: LBD predictor
+    :type predictor: LBDPredictorApiClient or LBDPredictorLocalClient
+    :return: circuit breaker (None for the local predictor)
+    :rtype: CircuitBreaker
+    """
+    return predictor_breaker if isinstance(predictor, LBDPredictorApiClient) else None
+
+
+def predict_lbd_probabilities_concurrently(user, data, model):
+    """
+    Predicts the LBD probabilities for multiple data concurrently via the asynchronous Predictor API client
+    (usable from the synchronous code).
+
+    Every call is gated by the circuit breaker. If the breaker is not closed, a single trial call is sent
+    first (half-open), and the other calls are sent only if it closed the breaker.
+
+    :param user: user model instance
+    :type user: User instance
+    :param data: data to be used for the predictions (one item per prediction)
+    :type data: list of data supported by the API
+    :param model: model identifier to be used
+    :type model: str
+    :return: (data/error_info, status_code) per prediction (None if the prediction could not be prepared or
+             if it was short-circuited)
+    :rtype: list
+    """
+    client = AsyncLBDPredictorApiClient(user)
+
+    # Prepare the responses
+    responses = [None] * len(data)
+    indices = list(range(len(data)))
+
+    # Send the trial call first if the breaker is not closed (short-circuit all the calls if not allowed)
+    if predictor_breaker.get_state() != predictor_breaker.CLOSED:
+        if not predictor_breaker.allow():
+            return responses
+        responses[0] = async_to_sync(client.predict_proba_many)(data[:1], model)[0]
+        predictor_breaker.record(responses[0])
+        indices = indices[1:]
+
+    # Predict the other LBD probabilities concurrently (the calls not allowed by the breaker are short-circuited)
+    indices = [i for i in indices if predictor_breaker.allow()]
+    if indices:
+        predicted = async_to_sync(client.predict_proba_many)([data[i] for i in indices], model)
+
+        # Record the results of the predictions (circuit breaker)
+        for i, response in zip(indices, predicted):
+            predictor_breaker.record(response)
+            responses[i] = response
 
-    # Return the predicted LBD probability
-    return probability
+    # Return the responses
+    return responses
 
 
 def sign_up_predictor_user(user=None, predictor=None):
@@ -0,0 +1,142 @@
+import time
+import logging
+from http import HTTPStatus
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Get the module-level logger instance
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker(object):
+    """
+    Class implementing the circuit breaker of the predictor API.
+
+    The breaker trips (opens) after the configured number of consecutive failures (connection errors,
+    timeouts, server errors). While it is open, the predictions are short-circuited (not called at all);
+    after the reset timeout, a single trial call is let through (half-open) and its result closes the
+    breaker or opens it again. The state is kept in the Django cache, so it is shared by the processes.
+    """
+
+    # Define the breaker states
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    # Define the breaker cache prefix
+    CACHE_BREAKER_PREFIX = 'predictor_breaker'
+
+    def __init__(self, name='predictor', failure_threshold=3, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def get_cache_key(self, suffix):
+        """Gets the breaker cache key"""
+        return f'{self.CACHE_BREAKER_PREFIX}_{self.name}_{suffix}'
+
+    @staticmethod
+    def is_failure(response):
+        """
+        Checks if the predictor response is a failure of the predictor (transport failures: connection
+        errors, timeouts, server errors), not of the predicted data or of the user (e.g. failed sign-up).
+
+        :param response: predictor response (None if the prediction could not be prepared)
+        :type response: tuple (data/error_info, status_code)
+        :return: True if the response is a failure, False otherwise
+        :rtype: bool
+        """
+        status_code = response[1] if response else None
+        return status_code is not None and (status_code == HTTPStatus.NOT_FOUND or status_code >= 500)
+
+    def get_opened_on(self):
+        """Gets the time the breaker opened (None if it is closed)"""
+        return cache.get(self.get_cache_key('opened_on'))
+
+    def get_failures(self):
+        """Gets the number of the consecutive failures"""
+        return cache.get(self.get_cache_key('failures')) or 0
+
+    def get_state(self):
+        """Gets the breaker state (closed, open or half_open)"""
+        opened_on = self.get_opened_on()
+        if opened_on is None:
+            return self.CLOSED
+        return self.OPEN if time.time() - opened_on < self.reset_timeout else self.HALF_OPEN
+
+    def is_open(self):
+        """Checks if the breaker is open (the predictions are short-circuited)"""
+        return self.get_state() == self.OPEN
+
+    def allow(self):
+        """
+        Checks if the prediction is allowed (the breaker is closed, or it is half-open and the trial call
+        has not been let through yet).
+
+        :return: True if the prediction is allowed, False otherwise
+        :rtype: bool
+        """
+        state = self.get_state()
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN:
+            return cache.add(self.get_cache_key('trial'), True, timeout=self.reset_timeout)
+        return False
+
+    def record(self, response):
+        """
+        Records the predictor response (closes the breaker on success, counts the failures otherwise). The
+        predictions that could not be prepared (e.g. the user failed to sign up) are not recorded.
+
+        :param response: predictor response (None if the prediction could not be prepared)
+        :type response: tuple (data/error_info, status_code)
+        :return: None
+        :rtype: None type
+        """
+        if not response:
+            return
+        if self.is_failure(response):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_success(self):
+        """Records the successful call (closes the breaker)"""
+        opened_on = self.get_opened_on()
+        if opened_on is not None:
+            logger.info(f'Circuit breaker {self.name} closed')
+        if opened_on is not None or self.get_failures():
+            self.reset()
+
+    def record_failure(self):
+        """Records the failed call (opens the breaker after the consecutive failures)"""
+
+        # Count the consecutive failures
+        key = self.get_cache_key('failures')
+        cache.add(key, 0, timeout=None)
+        failures = cache.incr(key)
+
+        # Open the breaker (or open it again after the failed trial call)
+        if failures >= self.failure_threshold or self.get_state() == self.HALF_OPEN:
+            cache.set(self.get_cache_key('opened_on'), time.time(), timeout=None)
+            cache.delete(self.get_cache_key('trial'))
+            logger.warning(f'Circuit breaker {self.name} opened after {failures} consecutive failures')
+
+    def get_statistics(self):
+        """Gets the statistics of the breaker (state, failures, opened on, threshold, reset timeout)"""
+        return {
+            'state': self.get_state(),
+            'failures': self.get_failures(),
+            'opened_on': self.get_opened_on(),
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout': self.reset_timeout
+        }
+
+    def reset(self):
+        """Resets the breaker (closes it)"""
+        cache.delete_many([self.get_cache_key(key) for key in ('failures', 'opened_on', 'trial')])
+
+
+# Define the circuit breaker of the predictor API (shared by the processes)
+predictor_breaker = CircuitBreaker(**getattr(settings, 'PREDICTOR_CONFIGURATION').get('breaker', {}))
@@ -1,82 +1,121 @@
-import os
-import pickle
+import numpy
+import asyncio
 from http import HTTPStatus
+from django.db import connections
 from django.conf import settings
-from predictor_api_client import PredictorApiClient
+from concurrent.futures import ThreadPoolExecutor
+from predictor.tokens import PredictorTokenManager
+from predictor.registry import model_registry
+from predictor.transport import PredictorApiClientPool
 
 
-# File path
-this_path = os.path.dirname(os.path.abspath(__file__))
+def predict_by_rows(predict_row, feature_values):
+    """
+    Predicts the (n, d) feature matrix row by row.
+
+    :param predict_row: prediction of a single-row (1, d) matrix (returns None if the prediction failed)
+    :type predict_row: callable
+    :param feature_values: feature matrix
+    :type feature_values: numpy.ndarray
+    :return: (predicted rows with NaN for the failed rows (None if all failed), indices of the failed rows)
+    :rtype: tuple (numpy.ndarray, list)
+    """
+
+    # Predict the rows
+    rows = [predict_row(feature_values[i:i + 1]) for i in range(len(feature_values))]
+    rows = [numpy.asarray(row, dtype=float)[0] if row is not None and numpy.size(row) else None for row in rows]
+
+    # Get the failed rows
+    failed = [i for i, row in enumerate(rows) if row is None]
+    if len(failed) == len(rows):
+        return None, failed
+
+    # Prepare the predicted rows (NaN for the failed rows)
+    shape = next(row for row in rows if row is not None).shape
+    predicted = numpy.full((len(rows), ) + shape, numpy.nan)
+    for i, row in enumerate(rows):
+        if row is not None:
+            predicted[i] = row
+
+    # Return the predicted rows and the failed rows
+    return predicted, failed
 
 
 class LBDPredictorLocalClient(object):
     """Class implementing the LBD Predictor local client"""
 
-    # Define the predictor settings
-    model_storage = 'models'
-
-    # TODO: use when real model(s) is(/are) serialized
-    # @classmethod
-    # def _prepare(cls, model):
-    #     with open(os.path.join(this_path, cls.model_storage, f'{model}.pkl'), 'rb') as f:
-    #         return pickle.load(f)
+    # Define the registry of the predictor models (loaded once per process)
+    registry = model_registry
 
     @classmethod
     def _prepare(cls, model):
-        from predictor.dummy import DummyPredictor
-        return DummyPredictor()
+        return cls.registry.get(model)
 
     def predict(self, data, model):
         """
         Predicts the LBD class via the local predictor.
 
-        :param data: data to be used for the prediction
+        :param data: data to be used for the prediction (feature values: vector or (n, d) matrix)
         :type data: data supported by the predictor
         :param model: model identifier to be used
         :type model: str
         :return: (data/error_info, status_code)
         :rtype: tuple
         """
-
-        # Prepare the prediction
-        predictor = self._prepare(model)
-
-        # Get feature labels and values
-        feature_labels, feature_values = data
-
-        # Run the predictor
-        try:
-            predicted = predictor.predict(feature_values)
-        except Exception as e:
-            return None, HTTPStatus.INTERNAL_SERVER_ERROR
-        else:
-            return {'predicted': predicted}, HTTPStatus.OK
+        return self._run(model, 'predict', data)
 
     def predict_proba(self, data, model):
         """
         Predicts the LBD probability via the local predictor.
 
-        :param data: data to be used for the prediction
+        :param data: data to be used for the prediction (feature values: vector or (n, d) matrix)
         :type data: data supported by the predictor
         :param model: model identifier to be used
         :type model: str
         :return: (data/error_info, status_code)
         :rtype: tuple
         """
+        return self._run(model, 'predict_proba', data)
+
+    @classmethod
+    def _run(cls, model, method, data):
+        """
+        Runs the predictor method. The (n, d) matrices that cannot be predicted at once are predicted
+        row by row, so that only the failed rows are reported ('failed', NaN in 'predicted').
+        """
 
         # Prepare the prediction
-        predictor = self._prepare(model)
+        try:
+            method = getattr(cls._prepare(model), method)
+        except Exception as e:
+            return None, HTTPStatus.INTERNAL_SERVER_ERROR
 
         # Get feature labels and values
         feature_labels, feature_values = data
 
         # Run the predictor
         try:
-            predicted = predictor.predict_proba(feature_values)
+            predicted = method(feature_values)
         except Exception as e:
-            return None, HTTPStatus.INTERNAL_SERVER_ERROR
+            if numpy.ndim(feature_values) != 2:
+                return None, HTTPStatus.INTERNAL_SERVER_ERROR
         else:
-            return {'predicted': predicted}, HTTPStatus.OK
+            if numpy.ndim(feature_values) != 2:
+                return {'predicted': predicted}, HTTPStatus.OK
+            return {'predicted': predicted, 'failed': []}, HTTPStatus.OK
+
+        # Run the predictor row by row (isolate the failed rows)
+        def predict_row(row):
+            try:
+                return method(row)
+            except Exception as e:
+                return None
+
+        # Return the predicted rows
+        predicted, failed = predict_by_rows(predict_row, feature_values)
+        if predicted is None:
+            return {'failed': failed}, HTTPStatus.INTERNAL_SERVER_ERROR
+        return {'predicted': predicted, 'failed': failed}, HTTPStatus.OK
 
 
 class LBDPredictorApiClient(object):
@@ -91,11 +130,22 @@ class LBDPredictorApiClient(object):
     verify = getattr(settings, 'PREDICTOR_CONFIGURATION').get('verify')
     timeout = getattr(settings, 'PREDICTOR_CONFIGURATION').get('timeout')
 
+    # Define the process-wide pool of the predictor API clients (keep-alive connections per host, port and user)
+    pool = PredictorApiClientPool(**getattr(settings, 'PREDICTOR_CONFIGURATION').get('pool', {}))
+
+    # Define the manager of the access tokens (cached with expiry, refreshed single-flight per user)
+    tokens = PredictorTokenManager(**getattr(settings, 'PREDICTOR_CONFIGURATION').get('tokens', {}))
+
     def __init__(self, user):
         """Constructor method"""
 
-        # Set the predictor API client
-        self.client = PredictorApiClient(host=self.host, port=self.port, verify=self.verify, timeout=self.timeout)
+        # Set the predictor API client (pooled)
+        self.client = self.pool.get(
+            host=self.host,
+            port=self.port,
+            user=user.pk,
+            verify=self.verify,
+            timeout=tuple(self.timeout) if isinstance(self.timeout, list) else self.timeout)
 
         # Set the user model instance
         self.user = user
@@ -105,15 +155,11 @@ class LBDPredictorApiClient(object):
         # Check and validate the sign-up of the user
         if not self.user.predictor_registered:
             _, status_code = self.sign_up()
-            return True if status_code == HTTPStatus.OK else False
+            if status_code != HTTPStatus.OK:
+                return False
 
-        # Check if the user is logged-in already and if not, call the log-in
-        if not self.user.predictor_access_token:
-            _, status_code = self.log_in()
-            return True if status_code == HTTPStatus.OK else False
-
-        # Return the default positive response if all is well
-        return True
+        # Get the valid access token (log-in the user or refresh the expiring access token if needed)
+        return self.tokens.get_access_token(self.user, self.client) is not None
 
     def sign_up(self):
         """Signs-up a user in the predictor API"""
@@ -124,51 +170,50 @@ class LBDPredictorApiClient(object):
         # Update the user credentials
         if status_code == HTTPStatus.OK:
             self.user.predictor_registered = True
-            self.user.save()
+            self.user.save(update_fields=['predictor_registered'])
 
         # Return the response and the status code
         return response, status_code
 
     def log_in(self):
-        """Logs-in a user in the predictor API"""
-
-        # Log in the user
-        response, status_code = self.client.log_in(**self.user.get_predictor_authentication_credentials())
-
-        # Update the user credentials
-        if status_code == HTTPStatus.OK:
-            self.user.predictor_access_token = self.client.access_token
-            self.user.predictor_refresh_token = self.client.refresh_token
-            self.user.save()
-
-        # Return the response and the status code
-        return response, status_code
+        """Logs-in a user in the predictor API (single-flight per user)"""
+        return self.tokens.log_in(self.user, self.client, access_token=self.user.predictor_access_token)
 
     def refresh_access_token(self):
-        """Refreshes an access token in the predictor API"""
-
-        # Refresh the user access token
-        response, status_code = self.client.refresh_access_token(self.user.get_predictor_refresh_token())
-
-        # Update the user credentials
-        if status_code == HTTPStatus.OK:
-            self.user.predictor_access_token = self.client.access_token
-            self.user.save()
-
-        # Return the response and the status code
-        return response, status_code
+        """Refreshes an access token in the predictor API (single-flight per user)"""
+        return self.tokens.refresh(self.user, self.client, access_token=self.user.predictor_access_token)
 
     def predict(self, data, model):
         """
         Predicts the LBD class via the predictor API.
 
-        :param data: data to be used for the prediction
+        :param data: data to be used for the prediction (feature values: vector or (n, d) matrix)
         :type data: data supported by the API
         :param model: model identifier to be used
         :type model: str
         :return: (data/error_info, status_code)
         :rtype: tuple
         """
+        return self._run(model, 'predict', data)
+
+    def predict_proba(self, data, model):
+        """
+        Predicts the LBD probability via the predictor API.
+
+        :param data: data to be used for the prediction (feature values: vector or (n, d) matrix)
+        :type data: data supported by the API
+        :param model: model identifier to be used
+        :type model: str
+        :return: (data/error_info, status_code)
+        :rtype: tuple
+        """
+        return self._run(model, 'predict_proba', data)
+
+    def _run(self, model, method, data, access_token=None):
+        """
+        Runs the predictor API method. The (n, d) matrices rejected by the API as a whole (client error)
+        are predicted row by row, so that only the failed rows are reported ('failed', NaN in 'predicted').
+        """
 
         # Prepare the prediction
         if not self._prepare():
@@ -178,54 +223,169 @@ class LBDPredictorApiClient(object):
         feature_labels, feature_values = data
 
         # Run the predictor
-        response, status_code = self.client.predict(
-            access_token=self.user.get_predictor_access_token(),
-            refresh_token=self.user.get_predictor_refresh_token(),
-            model_identifier=model,
-            feature_values=feature_values,
-            feature_labels=feature_labels)
+        response, status_code = self._call(model, method, feature_labels, feature_values, access_token=access_token)
 
-        # Update the user credentials
+        # Return the response and the status code (vector)
+        if numpy.ndim(feature_values) != 2:
+            return response, status_code
+
+        # Return the response and the status code (matrix predicted at once)
         if status_code == HTTPStatus.OK:
-            if self.client.access_token and self.client.access_token != self.user.predictor_access_token:
-                self.user.predictor_access_token = self.client.access_token
-                self.user.save()
+            if len(response.get('predicted', [])) == len(feature_values):
+                return dict(response, failed=[]), status_code
+            return {'failed': list(range(len(feature_values)))}, HTTPStatus.INTERNAL_SERVER_ERROR
+
+        # Return the response and the status code (matrix not predicted due to other than data errors)
+        if not (HTTPStatus.BAD_REQUEST <= status_code < HTTPStatus.INTERNAL_SERVER_ERROR) or \
+                status_code in self.log_in_required_errors or len(feature_values) < 2:
+            return response, status_code
+
+        # Run the predictor row by row (isolate the failed rows)
+        def predict_row(row):
+            row_response, row_status_code = self._call(model, method, feature_labels, row, access_token=access_token)
+            return row_response.get('predicted') if row_status_code == HTTPStatus.OK else None
+
+        # Return the predicted rows
+        predicted, failed = predict_by_rows(predict_row, feature_values)
+        if predicted is None:
+            return response, status_code
+        return {'predicted': predicted, 'failed': failed}, HTTPStatus.OK
+
+    def _call(self, model, method, feature_labels, feature_values, access_token=None):
+        """
+        Calls the predictor API method (the predicted data are returned as {'predicted': data}). The rejected
+        access token is refreshed and retried once, unless the access token is given (retried by the caller).
+        """
+        retries = 1 if access_token is None else 0
+
+        # Run the predictor (refresh the rejected access token, single-flight per user)
+        for attempt in range(retries + 1):
+            token = access_token or self.tokens.get_access_token(self.user, self.client)
+            response, status_code = getattr(self.client, method)(
+                access_token=token,
+                refresh_token=None,
+                model_identifier=model,
+                feature_values=feature_values,
+                feature_labels=feature_labels)
+            if status_code not in self.log_in_required_errors or attempt == retries:
+                break
+            self.tokens.refresh(self.user, self.client, access_token=token)
+
+        # Wrap the predicted data (the same form as of the local client)
+        if status_code == HTTPStatus.OK and not isinstance(response, dict):
+            response = {'predicted': numpy.asarray(response)}
 
         # Return the response and the status code
         return response, status_code
 
-    def predict_proba(self, data, model):
+
+class AsyncLBDPredictorApiClient(LBDPredictorApiClient):
+    """
+    Class implementing the asynchronous LBD Predictor API client.
+
+    The predictions run concurrently (bounded by the maximum concurrency) on the pooled keep-alive HTTP client,
+    so N predictions cost roughly one round-trip latency instead of N. The predictions rejected due to the
+    access token (log_in_required_errors) are retried with the exponential backoff (the token is refreshed
+    single-flight per user, so the concurrent predictions share one refresh), and the predictions that exceed
+    the timeout are reported as timed out (504, as by the synchronous transport).
+    """
+
+    # Define the asynchronous predictor settings
+    max_concurrency = getattr(settings, 'PREDICTOR_CONFIGURATION').get('async', {}).get('max_concurrency', 8)
+    call_timeout = getattr(settings, 'PREDICTOR_CONFIGURATION').get('async', {}).get('timeout', 10)
+    retries = getattr(settings, 'PREDICTOR_CONFIGURATION').get('async', {}).get('retries', 2)
+    backoff = getattr(settings, 'PREDICTOR_CONFIGURATION').get('async', {}).get('backoff', 0.1)
+
+    # Define the executor of the blocking HTTP calls (shared by the process)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='predictor')
+
+    async def predict(self, data, model):
         """
-        Predicts the LBD probability via the predictor API.
+        Predicts the LBD class via the predictor API (asynchronously).
+
+        :param data: data to be used for the prediction (feature values: vector or (n, d) matrix)
+        :type data: data supported by the API
+        :param model: model identifier to be used
+        :type model: str
+        :return: (data/error_info, status_code)
+        :rtype: tuple
+        """
+        return await self._run_async(model, 'predict', data)
+
+    async def predict_proba(self, data, model):
+        """
+        Predicts the LBD probability via the predictor API (asynchronously).
 
-        :param data: data to be used for the prediction
+        :param data: data to be used for the prediction (feature values: vector or (n, d) matrix)
         :type data: data supported by the API
         :param model: model identifier to be used
         :type model: str
         :return: (data/error_info, status_code)
         :rtype: tuple
         """
+        return await self._run_async(model, 'predict_proba', data)
+
+    async def predict_proba_many(self, data, model):
+        """
+        Predicts the LBD probabilities for multiple data via the predictor API (concurrently).
+
+        :param data: data to be used for the predictions (one item per prediction)
+        :type data: list of data supported by the API
+        :param model: model identifier to be used
+        :type model: str
+        :return: (data/error_info, status_code) per prediction (None if the prediction could not be prepared)
+        :rtype: list
+        """
+
+        # Prepare the prediction (sign-up, log-in) once for all the predictions
+        if not await self._execute(self._prepare):
+            return [None] * len(data)
+
+        # Run the predictions concurrently (bounded by the maximum concurrency)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return list(await asyncio.gather(
+            *(self._run_async(model, 'predict_proba', item, semaphore=semaphore, prepared=True) for item in data)))
+
+    async def _run_async(self, model, method, data, semaphore=None, prepared=False):
 
         # Prepare the prediction
-        if not self._prepare():
+        if not prepared and not await self._execute(self._prepare):
             return None
 
-        # Get feature labels and values
-        feature_labels, feature_values = data
+        # Prepare the concurrency limit
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
 
-        # Run the predictor
-        response, status_code = self.client.predict_proba(
-            access_token=self.user.get_predictor_access_token(),
-            refresh_token=self.user.get_predictor_refresh_token(),
-            model_identifier=model,
-            feature_values=feature_values,
-            feature_labels=feature_labels)
+        # Run the predictor with the access token (the token is returned to be refreshed if rejected)
+        def run():
+            access_token = self.tokens.get_access_token(self.user, self.client)
+            return access_token, self._run(model, method, data, access_token=access_token)
 
-        # Update the user credentials
-        if status_code == HTTPStatus.OK:
-            if self.client.access_token and self.client.access_token != self.user.predictor_access_token:
-                self.user.predictor_access_token = self.client.access_token
-                self.user.save()
+        # Run the predictor (retry the rejected access token with the exponential backoff)
+        for attempt in range(self.retries + 1):
 
-        # Return the response and the status code
-        return response, status_code
+            # Run the predictor (the timed out call keeps its executor thread, so the executor bounds the calls)
+            try:
+                async with semaphore:
+                    access_token, response = await asyncio.wait_for(self._execute(run), self.call_timeout)
+            except asyncio.TimeoutError:
+                return {"message": "Timeout."}, HTTPStatus.GATEWAY_TIMEOUT
+
+            # Return the response and the status code (unless the access token was rejected)
+            if not response or response[1] not in self.log_in_required_errors or attempt == self.retries:
+                return response
+
+            # Refresh the rejected access token (single-flight per user) and back off
+            await self._execute(self.tokens.refresh, self.user, self.client, access_token)
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _execute(self, function, *args):
+        """Executes the blocking function in the executor (the database connections of the thread are closed)"""
+
+        def execute():
+            try:
+                return function(*args)
+            finally:
+                connections.close_all()
+
+        # Execute the blocking function
+        return await asyncio.get_running_loop().run_in_executor(self.executor, execute)
@@ -7,12 +7,12 @@ class DummyPredictor(object):
     """Class implementing the Dummy Predictor"""
 
     def predict(self, X):
-        return self.predict_proba(X)[0, 1]
+        return self.predict_proba(X)[:, 1] if np.ndim(X) == 2 else self.predict_proba(X)[0, 1]
 
     def predict_proba(self, X):
-        a = random.random()
+        a = np.array([random.random() for _ in range(X.shape[0] if np.ndim(X) == 2 else 1)])
         b = 1 - a
-        return np.array([a, b]).reshape(1, -1)
+        return np.column_stack((a, b))
 
 
 if __name__ == '__main__':
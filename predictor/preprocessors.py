@@ -1,3 +1,4 @@
+import numpy
 from predictor.transformers import NominalFeatureTransformer, OrdinalFeatureTransformer, NumericalFeatureTransformer
 
 
@@ -29,3 +30,131 @@ def preprocess_feature(feature_value, feature_label, model):
 
     # Preprocess the feature
     return preprocessor.transform(feature_value, feature_label, model=model)
+
+
+class FeatureEncodingPlan(object):
+    """
+    Class implementing compiled feature encoding plan (replaces the per-feature preprocessing).
+
+    The plan is compiled once per model configuration: it fixes the output column layout (labels), the
+    one-hot indices of the nominal features and the ordinal mappings of the ordinal features, so that
+    the features are encoded directly into a preallocated vector (or a row of a feature matrix).
+    """
+
+    # Define the compiled plans (key: model)
+    plans = {}
+
+    # Define the compiled labels of the concatenated plans (key: tuple of models)
+    concatenated_labels = {}
+
+    def __init__(self, model):
+        self.model = model
+
+        # Prepare the output column layout and the encoding steps: (feature, type, start, stop, mapping)
+        self.labels = []
+        self.steps = []
+
+        for feature_label in model.CONFIGURATION.get_predictor_feature_names():
+            feature_type = model.CONFIGURATION.get_feature_type(feature_label)
+            start = len(self.labels)
+
+            # Compile the one-hot indices (nominal), ordinal mapping (ordinal) or nothing (numerical)
+            if feature_type == 'nominal':
+                categories = model.CONFIGURATION.get_feature_options(feature_label)
+                mapping = {}
+                for i, category in enumerate(categories):
+                    mapping.setdefault(category, []).append(start + i)
+                self.labels += [f'{feature_label}_{category}' for category in categories]
+            elif feature_type == 'ordinal':
+                mapping = {c: i for i, c in enumerate(model.CONFIGURATION.get_feature_order(feature_label), 1)}
+                self.labels.append(feature_label)
+            else:
+                mapping = None
+                self.labels.append(feature_label)
+
+            self.steps.append((feature_label, feature_type, start, len(self.labels), mapping))
+
+        # Get the number of the output columns
+        self.size = len(self.labels)
+
+    @classmethod
+    def compile(cls, model):
+        """Returns the compiled encoding plan of the model (compiled once per model)"""
+        if model not in cls.plans:
+            cls.plans[model] = cls(model)
+        return cls.plans[model]
+
+    def encode(self, features, out):
+        """
+        Encodes the features into the preallocated output vector.
+
+        :param features: features (mapping: feature label-value)
+        :type features: dict
+        :param out: output vector (of the plan size)
+        :type out: numpy.ndarray
+        :return: output column ranges of the features missing in the input features
+        :rtype: list of tuples (start, stop)
+        """
+
+        # Prepare the missing column ranges
+        missing = []
+
+        for feature_label, feature_type, start, stop, mapping in self.steps:
+
+            # Skip the missing features
+            if feature_label not in features:
+                missing.append((start, stop))
+                continue
+
+            # Encode the feature
+            value = features[feature_label]
+            if feature_type == 'nominal':
+                out[start:stop] = 0
+                for i in mapping.get(value, ()):
+                    out[i] = 1
+            elif feature_type == 'ordinal':
+                value = mapping.get(value)
+                out[start] = numpy.nan if value is None else value
+            elif feature_type == 'numerical':
+                out[start] = numpy.nan if value is None else value
+            else:
+                raise KeyError(feature_type)
+
+        # Return the missing column ranges
+        return missing
+
+    @classmethod
+    def encode_many(cls, items):
+        """
+        Encodes the features of multiple models (concatenated in the given order).
+
+        :param items: models and their features (mapping: feature label-value)
+        :type items: list of tuples (model, dict)
+        :return: feature labels, feature values
+        :rtype: tuple (list, numpy.ndarray)
+        """
+
+        # Get the compiled plans and the output column layout
+        plans = [cls.compile(model) for model, _ in items]
+        key = tuple(plan.model for plan in plans)
+        if key not in cls.concatenated_labels:
+            cls.concatenated_labels[key] = [label for plan in plans for label in plan.labels]
+        labels = cls.concatenated_labels[key]
+
+        # Encode the features into the preallocated vector
+        values = numpy.empty(len(labels), dtype=float)
+        missing = []
+        offset = 0
+        for plan, (_, features) in zip(plans, items):
+            for start, stop in plan.encode(features, values[offset:offset + plan.size]):
+                missing.append((offset + start, offset + stop))
+            offset += plan.size
+
+        # Return the labels and values (without the columns of the missing features)
+        if not missing:
+            return list(labels), values
+
+        keep = numpy.ones(len(labels), dtype=bool)
+        for start, stop in missing:
+            keep[start:stop] = False
+        return [label for label, k in zip(labels, keep) if k], values[keep]
@@ -1,4 +1,5 @@
 import numpy
+import hashlib
 
 
 def process_features(session):
@@ -18,3 +19,18 @@ def process_features(session):
 
     # Return the features
     return feature_labels, feature_values
+
+
+def hash_features(features):
+    """Gets the hash of the features for prediction (feature labels and values)"""
+
+    # Get the feature labels and values
+    feature_labels, feature_values = features
+
+    # Hash the feature labels and values
+    digest = hashlib.sha1()
+    digest.update('\x1f'.join(feature_labels).encode('utf-8'))
+    digest.update(numpy.ascontiguousarray(feature_values, dtype=float).tobytes())
+
+    # Return the hash
+    return digest.hexdigest()
@@ -0,0 +1,173 @@
+import os
+import time
+import pickle
+import joblib
+import logging
+import threading
+import tracemalloc
+from django.conf import settings
+from django.utils import timezone
+
+
+# Get the module-level logger instance
+logger = logging.getLogger(__name__)
+
+# File path
+this_path = os.path.dirname(os.path.abspath(__file__))
+
+
+class ModelRegistry(object):
+    """
+    Class implementing the registry of the predictor models (warm in-process model loading).
+
+    Each model identifier is loaded once per process from the model storage ({model}.joblib with the
+    large arrays memory-mapped, or {model}.pkl), and reloaded when the model file changes. The model
+    files are loaded only if enabled in the predictor configuration (use_model_files, as unpickling runs
+    the code of the file); otherwise, and for the models with no model file, the dummy predictor is used.
+    """
+
+    # Define the model storage and the supported model files (in the order of preference)
+    model_storage = os.path.join(this_path, 'models')
+    model_extensions = ('.joblib', '.pkl')
+
+    # Define the model files flag (True to load the model files; False to use the dummy predictor)
+    use_model_files = getattr(settings, 'PREDICTOR_CONFIGURATION').get('use_model_files', False)
+
+    # Define the memory-mapping mode of the large arrays of the *.joblib models (None to load into memory)
+    mmap_mode = 'r'
+
+    def __init__(self):
+        self.models = {}
+        self.lock = threading.Lock()
+        self.hits_lock = threading.Lock()
+
+    def get_model_path(self, model):
+        """Gets the path to the model file (None if there is no model file or if the model files are disabled)"""
+        if not self.use_model_files:
+            return None
+        for extension in self.model_extensions:
+            path = os.path.join(self.model_storage, f'{model}{extension}')
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def get(self, model):
+        """
+        Gets the predictor model (loaded once, reloaded if the model file changed).
+
+        :param model: model identifier
+        :type model: str
+        :return: predictor model
+        :rtype: object-like
+        """
+
+        # Get the version of the model file
+        path = self.get_model_path(model)
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            path, stat = None, None
+        version = (path, stat.st_mtime_ns, stat.st_size) if stat else (None, None, None)
+
+        # Get the loaded model (if the model file did not change)
+        entry = self.models.get(model)
+        if entry and entry['version'] == version:
+            self.count_hit(entry)
+            return entry['predictor']
+
+        with self.lock:
+
+            # Check the loaded model again (it might have been loaded by another thread)
+            entry = self.models.get(model)
+            if entry and entry['version'] == version:
+                self.count_hit(entry)
+                return entry['predictor']
+
+            # Load the model
+            predictor, load_time, memory = self.load(path)
+
+            # Log the loading statistics
+            logger.info(f'Loaded the predictor model {model} from {path or "dummy predictor"}: '
+                        f'{load_time:.3f}s, {memory / 1024 ** 2:.1f} MiB')
+
+            # Register the model
+            self.models[model] = {
+                'predictor': predictor,
+                'version': version,
+                'loaded_on': timezone.now(),
+                'load_time': load_time,
+                'memory': memory,
+                'hits': 1,
+                'loads': entry['loads'] + 1 if entry else 1
+            }
+
+        # Return the model
+        return predictor
+
+    def count_hit(self, entry):
+        """Counts the hit of the loaded model (not blocked by the loading of the other models)"""
+        with self.hits_lock:
+            entry['hits'] += 1
+
+    def load(self, path):
+        """
+        Loads the predictor model from the model file.
+
+        :param path: path to the model file (None to use the dummy predictor)
+        :type path: str
+        :return: (predictor model, load time in seconds, memory allocated by the loading in bytes)
+        :rtype: tuple
+        """
+
+        # Start tracing the memory allocations (if not traced already)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        allocated = tracemalloc.get_traced_memory()[0]
+        t = time.perf_counter()
+
+        try:
+            if not path:
+                from predictor.dummy import DummyPredictor
+                predictor = DummyPredictor()
+            elif path.endswith('.joblib'):
+                predictor = joblib.load(path, mmap_mode=self.mmap_mode)
+            else:
+                with open(path, 'rb') as f:
+                    predictor = pickle.load(f)
+            load_time = time.perf_counter() - t
+            memory = max(0, tracemalloc.get_traced_memory()[0] - allocated)
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+
+        # Return the loaded model and the loading statistics
+        return predictor, load_time, memory
+
+    def get_statistics(self):
+        """
+        Gets the statistics of the loaded models.
+
+        :return: statistics per model identifier (path, loaded on, load time, memory, hits, loads)
+        :rtype: dict
+        """
+        return {
+            model: {
+                'path': entry['version'][0],
+                'loaded_on': entry['loaded_on'],
+                'load_time': entry['load_time'],
+                'memory': entry['memory'],
+                'hits': entry['hits'],
+                'loads': entry['loads']
+            }
+            for model, entry in self.models.items()
+        }
+
+    def clear(self):
+        """Clears the loaded models"""
+        with self.lock:
+            self.models.clear()
+
+
+# Define the registry of the predictor models (per process)
+model_registry = ModelRegistry()
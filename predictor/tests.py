@@ -0,0 +1,206 @@
+import json
+import time
+import pickle
+import socket
+import numpy
+import tempfile
+import threading
+import json_tricks
+from pathlib import Path
+from http import HTTPStatus
+from importlib import metadata
+from unittest import mock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from predictor import predict_lbd_probabilities_concurrently
+from predictor.breaker import predictor_breaker
+from predictor.client import AsyncLBDPredictorApiClient
+from predictor.dummy import DummyPredictor
+from predictor.registry import ModelRegistry
+from predictor.transport import PooledPredictorApiClient, PredictorApiClientPool
+
+
+class PredictorApiHandler(BaseHTTPRequestHandler):
+    """Class implementing the local stand-in of the predictor API (keep-alive HTTP/1.1)"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status_code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        # Log in the user
+        if self.path == '/login':
+            return self.send_json(HTTPStatus.OK, {'access_token': 'access', 'refresh_token': 'refresh'})
+
+        # Predict (delayed to simulate a slow predictor)
+        time.sleep(self.server.delay)
+        return self.send_json(HTTPStatus.OK, {'predicted': json_tricks.dumps(numpy.array([[0.3, 0.7]]))})
+
+
+class PooledPredictorApiClientTests(SimpleTestCase):
+    """Tests of the keep-alive transport of the predictor API client (against a local stand-in of the API)"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PredictorApiHandler)
+        self.server.connections, self.server.delay = 0, 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = PooledPredictorApiClient(host='http://127.0.0.1', port=str(self.server.server_port), timeout=1)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def predict_proba(self, client):
+        return client.predict_proba(
+            access_token='access',
+            refresh_token=None,
+            model_identifier='model',
+            feature_values=numpy.array([1.0, 2.0]),
+            feature_labels=['a', 'b'])
+
+    def test_keep_alive_connection_is_reused(self):
+        self.assertEqual(self.client.log_in('user', 'password')[1], HTTPStatus.OK)
+        for _ in range(3):
+            predicted, status_code = self.predict_proba(self.client)
+            self.assertEqual(status_code, HTTPStatus.OK)
+            numpy.testing.assert_allclose(predicted, [[0.3, 0.7]])
+
+        # All the requests are sent via a single connection
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.client.get_statistics(), {'connections': 1, 'requests': 4})
+
+    def test_timeout_is_gateway_timeout(self):
+        self.client.timeout, self.server.delay = 0.1, 0.5
+        self.assertEqual(self.predict_proba(self.client), ({'message': 'Timeout.'}, HTTPStatus.GATEWAY_TIMEOUT))
+
+    def test_connection_error_is_not_found(self):
+        # Get a port with no API listening on it
+        with socket.socket() as closed:
+            closed.bind(('127.0.0.1', 0))
+            port = closed.getsockname()[1]
+
+        # The API is not reachable
+        client = PooledPredictorApiClient(host='http://127.0.0.1', port=str(port), timeout=1)
+        self.assertEqual(client.log_in('user', 'password'), ({'message': 'Connection error.'}, HTTPStatus.NOT_FOUND))
+        self.assertEqual(self.predict_proba(client), ({'message': 'Connection error.'}, HTTPStatus.NOT_FOUND))
+        client.close()
+
+    def test_pool_reuses_and_evicts_clients(self):
+        pool = PredictorApiClientPool(max_clients=2)
+        client = pool.get('http://127.0.0.1', '5000', user=1)
+        self.assertIs(pool.get('http://127.0.0.1', '5000', user=1), client)
+        pool.get('http://127.0.0.1', '5000', user=2)
+        pool.get('http://127.0.0.1', '5000', user=3)
+        self.assertIsNot(pool.get('http://127.0.0.1', '5000', user=1), client)
+
+        # Statistics of the pool
+        statistics = pool.get_statistics()
+        self.assertEqual((statistics['hits'], statistics['misses'], statistics['clients']), (1, 4, 2))
+
+    def test_library_version_is_pinned(self):
+        # The transport overrides the private methods of the pinned version of the library
+        requirements = (Path(__file__).resolve().parent.parent / 'requirements.txt').read_text().split()
+        self.assertIn(f'predictor-api-client=={metadata.version("predictor-api-client")}', requirements)
+
+
+class ConcurrentPredictionBreakerTests(SimpleTestCase):
+    """Tests of the circuit breaker gating the concurrent predictions"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = mock.Mock(pk=1)
+        self.data = [(['a', 'b'], numpy.array([[1.0, 2.0]]))] * 4
+        self.calls = []
+
+    def predict(self, status_code):
+        """Predicts the LBD probabilities with the predictor API responding with the status code"""
+        async def predict_proba_many(client, data, model):
+            self.calls.append(len(data))
+            return [({'predicted': numpy.array([[0.3, 0.7]])}, status_code)] * len(data)
+
+        with mock.patch.object(AsyncLBDPredictorApiClient, 'predict_proba_many', predict_proba_many):
+            return predict_lbd_probabilities_concurrently(self.user, self.data, 'model')
+
+    def open_breaker(self, half_open=False):
+        """Opens the breaker (half-open after the reset timeout)"""
+        opened_on = time.time() - (predictor_breaker.reset_timeout + 1 if half_open else 0)
+        cache.set(predictor_breaker.get_cache_key('opened_on'), opened_on, timeout=None)
+
+    def test_closed_breaker_lets_all_calls_through(self):
+        self.assertEqual(len([r for r in self.predict(HTTPStatus.OK) if r]), 4)
+        self.assertEqual(self.calls, [4])
+
+    def test_open_breaker_short_circuits_all_calls(self):
+        self.open_breaker()
+        self.assertEqual(self.predict(HTTPStatus.OK), [None] * 4)
+        self.assertEqual(self.calls, [])
+
+    def test_half_open_breaker_sends_single_trial_call(self):
+        self.open_breaker(half_open=True)
+
+        # The failed trial call opens the breaker again (the other calls are short-circuited)
+        responses = self.predict(HTTPStatus.SERVICE_UNAVAILABLE)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(responses[1:], [None] * 3)
+        self.assertEqual(predictor_breaker.get_state(), predictor_breaker.OPEN)
+
+        # The successful trial call closes the breaker (the other calls follow)
+        self.calls = []
+        self.open_breaker(half_open=True)
+        self.assertEqual(len([r for r in self.predict(HTTPStatus.OK) if r]), 4)
+        self.assertEqual(self.calls, [1, 3])
+        self.assertEqual(predictor_breaker.get_state(), predictor_breaker.CLOSED)
+
+
+class ModelRegistryTests(SimpleTestCase):
+    """Tests of the registry of the predictor models"""
+
+    def setUp(self):
+        storage = tempfile.TemporaryDirectory()
+        self.addCleanup(storage.cleanup)
+        with open(f'{storage.name}/model.pkl', 'wb') as f:
+            pickle.dump({'model': 'pickled'}, f)
+
+        # Prepare the registry with the model storage
+        self.registry = ModelRegistry()
+        self.registry.model_storage = storage.name
+
+    def test_model_files_are_disabled_by_default(self):
+        self.assertFalse(ModelRegistry.use_model_files)
+        self.assertIsInstance(self.registry.get('model'), DummyPredictor)
+
+    def test_model_files_are_loaded_if_enabled(self):
+        self.registry.use_model_files = True
+        self.assertEqual(self.registry.get('model'), {'model': 'pickled'})
+        self.assertIsInstance(self.registry.get('other'), DummyPredictor)
+
+    def test_hits_are_counted_concurrently(self):
+        def get():
+            for _ in range(500):
+                self.registry.get('model')
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        statistics = self.registry.get_statistics()['model']
+        self.assertEqual((statistics['hits'], statistics['loads']), (4000, 1))
@@ -0,0 +1,223 @@
+import json
+import time
+import base64
+import threading
+from http import HTTPStatus
+from django.core.cache import cache
+
+
+class PredictorTokenManager(object):
+    """
+    Class implementing the manager of the predictor API tokens.
+
+    The access tokens are cached (Django cache) together with their expiry, so they are shared by the
+    threads/processes, refreshed proactively (shortly before they expire), and refreshed (logged-in)
+    single-flight per user: the concurrent refreshes wait for the one in flight and reuse its token.
+    The tokens are written into the user table only when they change (update_fields-scoped writes).
+    """
+
+    # Define the token cache prefix
+    CACHE_TOKEN_PREFIX = 'predictor_token'
+
+    # Define the HTTP error codes requiring the log-in (the refresh token is not valid anymore)
+    log_in_required_errors = [401, 422]
+
+    def __init__(self, access_token_ttl=900, refresh_margin=30, lock_timeout=10, poll_interval=0.05):
+        self.access_token_ttl = access_token_ttl
+        self.refresh_margin = refresh_margin
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get_token_cache_key(self, user):
+        """Gets the token cache key"""
+        return f'{self.CACHE_TOKEN_PREFIX}_{user.pk}'
+
+    def get_lock_cache_key(self, user):
+        """Gets the refresh lock cache key (the refresh in flight across the processes)"""
+        return f'{self.CACHE_TOKEN_PREFIX}_{user.pk}_lock'
+
+    def get_user_lock(self, user):
+        """Gets the refresh lock of the user (the refresh in flight within the process)"""
+        with self.lock:
+            return self.locks.setdefault(user.pk, threading.Lock())
+
+    def get_expiry(self, access_token):
+        """
+        Gets the expiry of the access token (the 'exp' claim of the JWT access tokens, or the configured
+        time-to-live of the access tokens if the expiry can not be read from the token).
+
+        :param access_token: access token
+        :type access_token: str
+        :return: expiry (UNIX timestamp)
+        :rtype: float
+        """
+        try:
+            payload = access_token.split('.')[1]
+            payload = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+            return float(payload['exp'])
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+            return time.time() + self.access_token_ttl
+
+    def is_expiring(self, tokens):
+        """Checks if the cached access token is expiring (to be refreshed proactively)"""
+        return tokens['expires_on'] - time.time() <= self.refresh_margin
+
+    def get_cached_tokens(self, user):
+        """Gets the cached tokens ({'access_token', 'expires_on'})"""
+        return cache.get(self.get_token_cache_key(user))
+
+    def set_cached_tokens(self, user, access_token):
+        """Sets the cached tokens (until the access token expires)"""
+        tokens = {'access_token': access_token, 'expires_on': self.get_expiry(access_token)}
+        cache.set(self.get_token_cache_key(user), tokens, timeout=max(1, int(tokens['expires_on'] - time.time())))
+        return tokens
+
+    def set_tokens(self, user, access_token, refresh_token=None):
+        """
+        Sets the tokens of the user (cached, and stored if changed).
+
+        :param user: user model instance
+        :type user: User instance
+        :param access_token: access token
+        :type access_token: str
+        :param refresh_token: refresh token (None if not changed)
+        :type refresh_token: str, optional
+        """
+
+        # Cache the access token
+        self.set_cached_tokens(user, access_token)
+
+        # Update the user credentials (only the changed fields)
+        update_fields = []
+        if access_token != user.predictor_access_token:
+            user.predictor_access_token = access_token
+            update_fields.append('predictor_access_token')
+        if refresh_token and refresh_token != user.predictor_refresh_token:
+            user.predictor_refresh_token = refresh_token
+            update_fields.append('predictor_refresh_token')
+        if update_fields:
+            user.save(update_fields=update_fields)
+
+    def get_access_token(self, user, client):
+        """
+        Gets the valid access token of the user (logs-in the user if there is no access token, and
+        refreshes the access token proactively if it is expiring).
+
+        :param user: user model instance
+        :type user: User instance
+        :param client: predictor API client
+        :type client: PredictorApiClient
+        :return: access token (None if the user could not be logged-in)
+        :rtype: str
+        """
+
+        # Get the cached access token (or cache the stored one)
+        tokens = self.get_cached_tokens(user)
+        if not tokens and user.predictor_access_token:
+            tokens = self.set_cached_tokens(user, user.predictor_access_token)
+
+        # Return the valid access token
+        if tokens and not self.is_expiring(tokens):
+            return tokens['access_token']
+
+        # Log-in the user or refresh the expiring access token
+        if not tokens:
+            response, status_code = self.log_in(user, client)
+        else:
+            response, status_code = self.refresh(user, client, access_token=tokens['access_token'])
+
+        # Return the new access token
+        return response.get('access_token') if status_code == HTTPStatus.OK else None
+
+    def log_in(self, user, client, access_token=None):
+        """
+        Logs-in the user (single-flight per user).
+
+        :param user: user model instance
+        :type user: User instance
+        :param client: predictor API client
+        :type client: PredictorApiClient
+        :param access_token: access token to be replaced (the log-in is skipped if it was replaced already)
+        :type access_token: str, optional
+        :return: (data/error_info, status_code)
+        :rtype: tuple
+        """
+        return self._single_flight(user, access_token, lambda: self._log_in(user, client))
+
+    def refresh(self, user, client, access_token=None):
+        """
+        Refreshes the access token of the user (single-flight per user). The user is logged-in if the
+        refresh token is missing or not valid anymore.
+
+        :param user: user model instance
+        :type user: User instance
+        :param client: predictor API client
+        :type client: PredictorApiClient
+        :param access_token: access token to be replaced (the refresh is skipped if it was replaced already)
+        :type access_token: str, optional
+        :return: (data/error_info, status_code)
+        :rtype: tuple
+        """
+        return self._single_flight(user, access_token, lambda: self._refresh(user, client))
+
+    def _log_in(self, user, client):
+
+        # Log in the user
+        response, status_code = client.log_in(**user.get_predictor_authentication_credentials())
+
+        # Update the user credentials
+        if status_code == HTTPStatus.OK:
+            self.set_tokens(user, response.get('access_token'), refresh_token=response.get('refresh_token'))
+
+        # Return the response and the status code
+        return response, status_code
+
+    def _refresh(self, user, client):
+
+        # Log in the user if there is no refresh token
+        if not user.get_predictor_refresh_token():
+            return self._log_in(user, client)
+
+        # Refresh the user access token
+        response, status_code = client.refresh_access_token(user.get_predictor_refresh_token())
+
+        # Log in the user if the refresh token is not valid anymore
+        if status_code in self.log_in_required_errors:
+            return self._log_in(user, client)
+
+        # Update the user credentials
+        if status_code == HTTPStatus.OK:
+            self.set_tokens(user, response.get('access_token'), refresh_token=response.get('refresh_token'))
+
+        # Return the response and the status code
+        return response, status_code
+
+    def _single_flight(self, user, access_token, call):
+
+        # Serialize the refreshes of the user within the process
+        with self.get_user_lock(user):
+            deadline = time.monotonic() + self.lock_timeout
+
+            while True:
+
+                # Reuse the access token refreshed by the refresh in flight (if any)
+                tokens = self.get_cached_tokens(user)
+                if tokens and tokens['access_token'] != access_token and not self.is_expiring(tokens):
+                    return {'access_token': tokens['access_token']}, HTTPStatus.OK
+
+                # Acquire the refresh lock across the processes
+                if cache.add(self.get_lock_cache_key(user), True, timeout=self.lock_timeout):
+                    break
+
+                # Wait for the refresh in flight
+                if time.monotonic() > deadline:
+                    return {'message': 'Token refresh timeout.'}, HTTPStatus.GATEWAY_TIMEOUT
+                time.sleep(self.poll_interval)
+
+            # Refresh the access token (log-in the user)
+            try:
+                return call()
+            finally:
+                cache.delete(self.get_lock_cache_key(user))
@@ -0,0 +1,232 @@
+import numpy
+import requests
+import threading
+from http import HTTPStatus
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from predictor_api_client import PredictorApiClient
+from predictor_api_client.common.exceptions import (
+    NoModelIdentifierForPredictionError,
+    NoFeatureValuesForPredictionError,
+    UnsupportedModelIdentifierForPredictionError,
+    UnsupportedFeatureValuesForPredictionError,
+    UnsupportedFeatureLabelsForPredictionError
+)
+from predictor_api_client.utils.headers import (
+    get_header_with_authentication_credentials,
+    get_header_with_access_token,
+    get_header_with_refresh_token
+)
+
+
+class PooledPredictorApiClient(PredictorApiClient):
+    """
+    Class implementing the Predictor API client with the keep-alive HTTP transport.
+
+    All the requests are sent via a single requests.Session with a bounded connection pool (instead of
+    the module-level requests.post calls), so the connections (TCP+TLS) are reused across the calls. The library
+    exposes no transport hook, so the endpoints mirror the ones of the pinned predictor-api-client (1.0.0) and
+    reuse its private response helpers: upgrading the library requires re-checking them.
+    """
+
+    def __init__(self, host=None, port=None, verify=None, timeout=None, max_connections=10):
+        super(PooledPredictorApiClient, self).__init__(host=host, port=port, verify=verify, timeout=timeout)
+
+        # Set the request verification (the disabled verification is not overridden by the default)
+        self.verify = self.verify if verify is None else verify
+
+        # Set the keep-alive session with the bounded connection pool
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def post(self, url, **kwargs):
+        """Sends the POST request via the keep-alive session"""
+        return self.session.post(url=url, verify=self.verify, timeout=self.timeout, **kwargs)
+
+    def close(self):
+        """Closes the keep-alive session (and its connections)"""
+        self.session.close()
+
+    def get_statistics(self):
+        """Gets the statistics of the connection pool (number of connections opened and requests sent)"""
+        pools = self.adapter.poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        return {
+            'connections': sum(pool.num_connections for pool in pools),
+            'requests': sum(pool.num_requests for pool in pools)
+        }
+
+    # --------- #
+    # Endpoints #
+    # --------- #
+
+    def sign_up(self, username, password):
+        try:
+            body = get_header_with_authentication_credentials(username, password)
+            response = self.post(self.signup_endpoint, json=body)
+        except requests.ConnectionError:
+            return {"message": "Connection error."}, HTTPStatus.NOT_FOUND
+        else:
+            return self._prepare_authentication_response(response)
+
+    def log_in(self, username, password):
+        try:
+            body = get_header_with_authentication_credentials(username, password)
+            response = self.post(self.login_endpoint, json=body)
+        except requests.ConnectionError:
+            return {"message": "Connection error."}, HTTPStatus.NOT_FOUND
+        else:
+            return self._prepare_authorization_response(response)
+
+    def refresh_access_token(self, refresh_token):
+        try:
+            response = self.post(self.refresh_endpoint, headers=get_header_with_refresh_token(refresh_token))
+        except requests.ConnectionError:
+            return {"message": "Connection error."}, HTTPStatus.NOT_FOUND
+        else:
+            return self._prepare_authorization_response(response)
+
+    def _predict(
+            self,
+            endpoint,
+            access_token,
+            refresh_token,
+            model_identifier,
+            feature_values,
+            feature_labels=None):
+
+        # Validate the input arguments
+        if not model_identifier:
+            raise NoModelIdentifierForPredictionError(f"Missing: <model_identifier>")
+        if feature_values is None:
+            raise NoFeatureValuesForPredictionError(f"Missing: <feature_values>")
+        if not isinstance(model_identifier, str):
+            raise UnsupportedModelIdentifierForPredictionError("Unsupported type: <model_identifier>")
+        if not isinstance(feature_values, numpy.ndarray):
+            raise UnsupportedFeatureValuesForPredictionError("Unsupported type: <feature_values>")
+        if not isinstance(feature_labels, (list, tuple, type(None))):
+            raise UnsupportedFeatureLabelsForPredictionError("Unsupported type: <feature_labels>")
+
+        # Prepare the prediction data
+        data = self._prepare_prediction_data(
+            model_identifier=model_identifier,
+            feature_values=feature_values,
+            feature_labels=feature_labels)
+
+        # Call the prediction endpoint (refresh the access token and re-call the same endpoint if required; the
+        # refresh is left to the caller if there is no refresh token)
+        try:
+            response = self.post(endpoint, json=data, headers=get_header_with_access_token(access_token))
+            if response.status_code not in self.refresh_required_errors or not refresh_token:
+                return self._prepare_prediction_response(data, response, endpoint)
+        except requests.Timeout:
+            return {"message": "Timeout."}, HTTPStatus.GATEWAY_TIMEOUT
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            if not refresh_token:
+                return {"message": "Connection error."}, HTTPStatus.NOT_FOUND
+
+        # Refresh the access token
+        response, status_code = self.refresh_access_token(refresh_token)
+        if status_code != HTTPStatus.OK:
+            return response, status_code
+
+        # Re-call the prediction endpoint
+        try:
+            headers = get_header_with_access_token(response.get("access_token"))
+            response = self.post(endpoint, json=data, headers=headers)
+        except requests.Timeout:
+            return {"message": "Timeout."}, HTTPStatus.GATEWAY_TIMEOUT
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            return {"message": "Connection error."}, HTTPStatus.NOT_FOUND
+        return self._prepare_prediction_response(data, response, endpoint)
+
+
+class PredictorApiClientPool(object):
+    """
+    Class implementing the process-wide pool of the Predictor API clients (one per host, port and user).
+
+    The pool is bounded (the least recently used clients are closed and evicted), and it counts the
+    hits (client reused) and misses (client created).
+    """
+
+    def __init__(self, max_clients=32, max_connections=10):
+        self.max_clients = max_clients
+        self.max_connections = max_connections
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, host, port, user, verify=None, timeout=None):
+        """
+        Gets the pooled Predictor API client.
+
+        :param host: host of the predictor API
+        :type host: str
+        :param port: port of the predictor API
+        :type port: str
+        :param user: user identifier (e.g. primary key of the user)
+        :type user: hashable
+        :param verify: request verification
+        :type verify: bool, optional
+        :param timeout: timeout in seconds (or (connect timeout, read timeout))
+        :type timeout: float or tuple, optional
+        :return: pooled Predictor API client
+        :rtype: PooledPredictorApiClient
+        """
+        key = (host, port, user)
+
+        with self.lock:
+
+            # Get the pooled client
+            client = self.clients.get(key)
+            if client:
+                self.hits += 1
+                self.clients.move_to_end(key)
+                return client
+
+            # Create the client
+            self.misses += 1
+            client = self.clients[key] = PooledPredictorApiClient(
+                host=host,
+                port=port,
+                verify=verify,
+                timeout=timeout,
+                max_connections=self.max_connections)
+
+            # Evict the least recently used clients
+            while len(self.clients) > self.max_clients:
+                self.clients.popitem(last=False)[1].close()
+                self.evictions += 1
+
+        # Return the client
+        return client
+
+    def get_statistics(self):
+        """Gets the statistics of the pool (hits, misses, evictions, clients, connections, requests)"""
+        with self.lock:
+            clients = list(self.clients.values())
+            statistics = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'clients': len(clients)
+            }
+
+        # Add the statistics of the connection pools
+        for client in clients:
+            for key, value in client.get_statistics().items():
+                statistics[key] = statistics.get(key, 0) + value
+
+        # Return the statistics
+        return statistics
+
+    def clear(self):
+        """Closes and evicts all the clients"""
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
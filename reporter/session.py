@@ -3,9 +3,11 @@ from fpdf import FPDF
 from datetime import datetime
 from django.conf import settings
 from visualizer.modalities import save_most_differentiating_features_and_table
-from subjects.models import examinations
+from subjects.models import NormativeData, examinations
 from subjects.models_formatters import FeaturesFormatter
+from subjects.models_utils import compute_difference_from_norm
 from subjects.views_predictors import ExaminationSessionLBDPredictor
+from .utils import save_report
 
 
 class SessionPDFReport(FPDF):
@@ -59,7 +61,7 @@ def create_report(request, subject, session):
     pdf.cell(w=60, h=pdf.ch, txt='Number of examinations: ', ln=0)
     pdf.cell(w=60, h=pdf.ch, txt=str(subject.examination_sessions.count()), ln=1)
     pdf.cell(w=60, h=pdf.ch, txt='Probability of preDLB: ', ln=0)
-    pdf.cell(w=60, h=pdf.ch, txt=str(lbd_probability or ''), ln=1)
+    pdf.cell(w=60, h=pdf.ch, txt=str(lbd_probability) if lbd_probability is not None else '', ln=1)
 
     # --
     # Other pages: most differentiating features
@@ -71,6 +73,9 @@ def create_report(request, subject, session):
         for modality, _, model in examinations
     ]
 
+    # Get the normative stratum of the subject (sex and age band at the examination)
+    stratum = NormativeData.get_stratum(session)
+
     # Add the examination data on separate pages of the report
     for modality_label, modality_model, modality_data in examination_data:
 
@@ -85,7 +90,7 @@ def create_report(request, subject, session):
         pdf.ln(pdf.ch)
 
         # Get the normative data for the modality
-        norm_data = getattr(settings, 'NORM_CONFIGURATION')[modality_label]
+        norm_table = NormativeData.get_table(modality_label)
 
         # Get the computation data
         if modality_data:
@@ -94,8 +99,9 @@ def create_report(request, subject, session):
             comp_data = None
 
         # Add the most differentiating features for the modality
-        if comp_data and norm_data:
-            graph_path = save_most_differentiating_features_and_table(comp_data, norm_data, modality_label, top_n=10)
+        if comp_data and norm_table:
+            comparison = compute_difference_from_norm(comp_data, norm_table, stratum)
+            graph_path = save_most_differentiating_features_and_table(comparison, modality_label, top_n=10)
         else:
             graph_path = None
 
@@ -116,8 +122,8 @@ def create_report(request, subject, session):
         f'{subject.code}_session_{session.session_number}.pdf'
     )
 
-    # Save the generated report
-    pdf.output(output_path, 'F')
+    # Save the generated report (atomically)
+    save_report(pdf, output_path)
 
     # Return the path to the generated report
     return output_path
@@ -4,9 +4,11 @@ from datetime import datetime
 from django.conf import settings
 from visualizer.subject import save_evolution_of_predictions
 from visualizer.modalities import save_most_differentiating_features_and_table
-from subjects.models import examinations
+from subjects.models import NormativeData, examinations
 from subjects.models_formatters import FeaturesFormatter
+from subjects.models_utils import compute_difference_from_norm
 from subjects.views_predictors import SubjectLBDPredictor
+from .utils import measure, save_report
 
 
 class SubjectPDFReport(FPDF):
@@ -38,15 +40,19 @@ class SubjectPDFReport(FPDF):
             return f.read()
 
 
-def create_report(request, subject):
-    """Creates a PDF report"""
+def create_report(request, subject, output_dir=None, timings=None):
+    """Creates a PDF report (the examination sessions with their data can be prefetched)"""
 
     # Create a subject PDF report
     pdf = SubjectPDFReport()
 
+    # Get the examination sessions (prefetched if available)
+    sessions = list(subject.examination_sessions.all())
+
     # Predict the probability of preDLB for a subject
-    if not subject.lbd_probability:
-        subject.lbd_probability = SubjectLBDPredictor.predict_lbd_probability(request.user, subject)
+    if subject.lbd_probability is None:
+        with measure(timings, 'predict'):
+            subject.lbd_probability = SubjectLBDPredictor.predict_lbd_probability(request.user, subject)
 
     # --
     # First page: general information
@@ -69,9 +75,9 @@ def create_report(request, subject):
     pdf.cell(w=60, h=pdf.ch, txt='Organization: ', ln=0)
     pdf.cell(w=60, h=pdf.ch, txt=subject.organization.name, ln=1)
     pdf.cell(w=60, h=pdf.ch, txt='Number of examinations: ', ln=0)
-    pdf.cell(w=60, h=pdf.ch, txt=str(subject.examination_sessions.count()), ln=1)
+    pdf.cell(w=60, h=pdf.ch, txt=str(len(sessions)), ln=1)
     pdf.cell(w=60, h=pdf.ch, txt='Probability of preDLB: ', ln=0)
-    pdf.cell(w=60, h=pdf.ch, txt=str(subject.lbd_probability or ''), ln=1)
+    pdf.cell(w=60, h=pdf.ch, txt=str(subject.lbd_probability) if subject.lbd_probability is not None else '', ln=1)
 
     # --
     # Second page: evolution of preDLB probability
@@ -87,7 +93,8 @@ def create_report(request, subject):
     pdf.ln(pdf.ch)
 
     # Add the predicted preDLB probabilities
-    pdf.set_lbd_probability_graph(request.user, subject)
+    with measure(timings, 'graphs'):
+        pdf.set_lbd_probability_graph(request.user, subject)
     if pdf.lbd_path:
         pdf.image(pdf.lbd_path, x=25, y=None, w=160, h=0, type='png', link='')
 
@@ -96,16 +103,19 @@ def create_report(request, subject):
     # --
 
     # Get the last examination session
-    last_session = subject.examination_sessions.last()
+    last_session = sessions[-1] if sessions else None
     if not last_session:
         return ''
 
-    # Get the data per modality for the last examination session
+    # Get the data per modality for the last examination session (selected if available)
     examination_data = [
-        (modality, model, model.get_data(examination_session=last_session))
+        (modality, model, model.get_session_data(last_session))
         for modality, _, model in examinations
     ]
 
+    # Get the normative stratum of the subject (sex and age band at the examination)
+    stratum = NormativeData.get_stratum(last_session)
+
     # Add the examination data on separate pages of the report
     for modality_label, modality_model, modality_data in examination_data:
 
@@ -120,7 +130,7 @@ def create_report(request, subject):
         pdf.ln(pdf.ch)
 
         # Get the normative data for the modality
-        norm_data = getattr(settings, 'NORM_CONFIGURATION')[modality_label]
+        norm_table = NormativeData.get_table(modality_label)
 
         # Get the computation data
         if modality_data:
@@ -129,8 +139,10 @@ def create_report(request, subject):
             comp_data = None
 
         # Add the most differentiating features for the modality
-        if comp_data and norm_data:
-            graph_path = save_most_differentiating_features_and_table(comp_data, norm_data, modality_label, top_n=10)
+        if comp_data and norm_table:
+            with measure(timings, 'graphs'):
+                comparison = compute_difference_from_norm(comp_data, norm_table, stratum)
+                graph_path = save_most_differentiating_features_and_table(comparison, modality_label, top_n=10)
         else:
             graph_path = None
 
@@ -146,10 +158,11 @@ def create_report(request, subject):
     # --
 
     # Prepare the filepath to store the report into
-    output_path = os.path.join(getattr(settings, 'REPORTS_PATH'), f'{subject.code}.pdf')
+    output_path = os.path.join(output_dir or getattr(settings, 'REPORTS_PATH'), f'{subject.code}.pdf')
 
-    # Save the generated report
-    pdf.output(output_path, 'F')
+    # Save the generated report (atomically)
+    with measure(timings, 'write'):
+        save_report(pdf, output_path)
 
     # Return the path to the generated report
     return output_path
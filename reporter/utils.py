@@ -0,0 +1,47 @@
+import os
+import time
+import secrets
+from contextlib import contextmanager
+
+
+@contextmanager
+def measure(timings, stage):
+    """
+    Measures the time spent in a stage of the report generation (added to the timings of the stage).
+
+    :param timings: timings per stage in seconds (None to skip the measurement)
+    :type timings: dict
+    :param stage: stage name
+    :type stage: str
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0) + time.perf_counter() - start
+
+
+def save_report(pdf, output_path):
+    """
+    Saves the PDF report atomically (the report is written into a temporary file in the same directory
+    and then renamed, so the readers never see a partially written report).
+
+    :param pdf: PDF report
+    :type pdf: FPDF
+    :param output_path: path of the report
+    :type output_path: str
+    :return: path of the report
+    :rtype: str
+    """
+    temp_path = f'{output_path}.{secrets.token_hex(8)}.tmp'
+
+    try:
+        pdf.output(temp_path, 'F')
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    # Return the path of the report
+    return output_path
@@ -4,6 +4,8 @@ from .models import (
     Organization,
     Subject,
     ExaminationSession,
+    PredictionJob,
+    ImportJob,
     DataAcoustic,
     DataActigraphy,
     DataHandwriting,
@@ -18,6 +20,8 @@ admin.site.register(User)
 admin.site.register(Organization)
 admin.site.register(Subject)
 admin.site.register(ExaminationSession)
+admin.site.register(PredictionJob)
+admin.site.register(ImportJob)
 admin.site.register(DataAcoustic)
 admin.site.register(DataActigraphy)
 admin.site.register(DataHandwriting)
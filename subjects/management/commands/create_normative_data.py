@@ -1,106 +1,256 @@
+import os
 import json
+import django
+import time
+import warnings
 import numpy as np
-from pprint import pprint
-from datetime import datetime
-from collections import defaultdict
-from django.conf import settings
-from django.core.management.base import BaseCommand
-from subjects.models_formatters import FeaturesFormatter
-from subjects.models import Subject, Organization, ExaminationSession, DATA_TO_MODEL_CLASS_MAPPING
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.db import connections
+from django.core.management.base import BaseCommand, CommandError
+from subjects.models import NormativeSketch, DATA_TO_MODEL_CLASS_MAPPING
+from subjects.models_norms import TDigest
 
 
-# Set the organization to get the normative data for
-organization = Organization.objects.get(name='fnusa')
+# Define the output target storing the normative data in the database (published as a new version)
+DATABASE_OUTPUT = 'database'
 
-# Set the debugging mode
-debug = True
+# Define the number of shards per process (finer shards give smoother progress and load balancing)
+SHARDS_PER_PROCESS = 4
 
 
-class Command(BaseCommand):
-    help = 'Creates normative data from healthy subjects'
+def get_feature_columns():
+    """
+    Returns the columns of the feature matrix (numerical features of all the modalities).
 
-    def handle(self, *args, **kwargs):
-        """Handles the command: creates normative data from healthy subjects"""
+    :return: columns of the feature matrix
+    :rtype: list of tuples (modality, feature label)
+    """
+    return [
+        (modality, label)
+        for modality, model in DATA_TO_MODEL_CLASS_MAPPING.items()
+        for label in model.CONFIGURATION.get_available_feature_names()
+        if model.CONFIGURATION.is_feature_numerical(label)
+    ]
 
-        t1 = datetime.now()
-        print(f'Start: {t1}')
 
-        # Get the configuration of the features
-        features_config = getattr(settings, 'DATA_CONFIGURATION', {})['data']['session']
+def read_feature_matrix(subject_ids):
+    """
+    Reads the feature matrix of the subjects (one row per examination session, NaN for the missing values).
 
-        # Get the healthy subjects
-        healthy_subjects = Subject.get_subjects_filtered(organization=organization, search_phrase='HC')
+    :param subject_ids: subject IDs (shard of the cohort)
+    :type subject_ids: list of int
+    :return: subject IDs and strata (-1 for unknown) of the rows, and the feature matrix
+    :rtype: tuple (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
 
-        # Prepare the features buffer
-        features_buffer = []
+    # Get the columns of the feature matrix
+    columns = {column: index for index, column in enumerate(get_feature_columns())}
 
-        # Fill the features buffer
-        for i, subject in enumerate(healthy_subjects, 1):
-            for session in ExaminationSession.get_sessions(subject):
-                session_data = {}
+    # Prepare the rows of the feature matrix (per examination session)
+    rows = {}
 
-                for modality_type, modality_model in DATA_TO_MODEL_CLASS_MAPPING.items():
-                    session_data[modality_type] = {}
+    # Fill the rows of the feature matrix
+    for modality, model in DATA_TO_MODEL_CLASS_MAPPING.items():
+        for record in model.objects.filter(examination_session__subject_id__in=subject_ids) \
+                .select_related('examination_session__subject'):
+            session = record.examination_session
+            if session.pk not in rows:
+                stratum = NormativeSketch.get_stratum(session)
+                stratum = -1 if stratum is None else stratum
+                rows[session.pk] = (session.subject_id, stratum, np.full(len(columns), np.nan))
+            for label, value in NormativeSketch.get_numerical_features(model, record).items():
+                if (modality, label) in columns:
+                    rows[session.pk][2][columns[(modality, label)]] = value
 
-                    config = features_config[modality_type]['features_description']
+    # Return the subject IDs, the strata and the feature matrix
+    if not rows:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty((0, len(columns)))
+    subjects, strata, values = zip(*rows.values())
+    return np.asarray(subjects, dtype=int), np.asarray(strata, dtype=int), np.vstack(values)
 
-                    data = modality_model.get_data(examination_session=session)
-                    data = data if data else {}
-                    if not data:
-                        continue
 
-                    features = FeaturesFormatter(modality_model).prepare_computable(record=data)
-                    features = [
-                        feature for feature in features
-                        if config[feature[FeaturesFormatter.FEATURE_LABEL_FIELD]].get('type') == 'numerical'
-                    ]
+def compute_norms(matrix, columns):
+    """
+    Computes the normative data (medians and IQRs of all the features in a single vectorized pass).
 
-                    for feature in features:
-                        label = feature[FeaturesFormatter.FEATURE_LABEL_FIELD]
-                        value = feature[FeaturesFormatter.FEATURE_VALUE_FIELD]
-                        session_data[modality_type][label] = value
+    :param matrix: feature matrix (one row per examination session, NaN for the missing values)
+    :type matrix: numpy.ndarray
+    :param columns: columns of the feature matrix
+    :type columns: list of tuples (modality, feature label)
+    :return: normative data ({modality: {feature label: {'median', 'iqr', 'count'}}})
+    :rtype: dict
+    """
 
-                features_buffer.append(session_data)
+    # Compute the quartiles and the counts of the features (the features with no values are skipped)
+    counts = np.count_nonzero(~np.isnan(matrix), axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        q25, q50, q75 = np.nanpercentile(matrix, [25, 50, 75], axis=0) if len(matrix) else np.full((3, 0), np.nan)
 
-        # --
+    # Prepare the normative data
+    norms = {modality: {} for modality in DATA_TO_MODEL_CLASS_MAPPING.keys()}
 
-        # Prepare the normative data buffer
-        norms_buffer = {
-            modality_type: defaultdict(list)
-            for modality_type, _ in DATA_TO_MODEL_CLASS_MAPPING.items()
+    # Fill the normative data
+    for index in np.flatnonzero(counts):
+        modality, label = columns[index]
+        norms[modality][label] = {
+            'median': round(float(q50[index]), 6),
+            'iqr': round(float(q75[index] - q25[index]), 6),
+            'count': int(counts[index])
         }
 
-        # Fill the normative data buffer
-        for modality_type, _ in DATA_TO_MODEL_CLASS_MAPPING.items():
-            for element in features_buffer:
-                for feature_name, feature_value in element[modality_type].items():
-                    norms_buffer[modality_type][feature_name].append(feature_value)
+    # Return the normative data
+    return norms
 
-        # --
 
-        # Prepare the normative data
-        norms = {}
+def compute_strata_norms(strata, matrix, columns):
+    """
+    Computes the normative data of the strata (a vectorized pass per stratum).
+
+    :param strata: strata of the rows (-1 for unknown)
+    :type strata: numpy.ndarray
+    :param matrix: feature matrix (one row per examination session, NaN for the missing values)
+    :type matrix: numpy.ndarray
+    :param columns: columns of the feature matrix
+    :type columns: list of tuples (modality, feature label)
+    :return: normative data of the strata ({modality: {stratum: {feature label: {'median', 'iqr', 'count'}}}})
+    :rtype: dict
+    """
+    norms = {modality: {} for modality in DATA_TO_MODEL_CLASS_MAPPING.keys()}
+
+    for stratum in np.unique(strata[strata >= 0]):
+        for modality, stratum_norms in compute_norms(matrix[strata == stratum], columns).items():
+            if stratum_norms:
+                norms[modality][str(stratum)] = stratum_norms
+
+    # Return the normative data of the strata
+    return norms
+
+
+def compute_sketches(subjects, strata, matrix, columns, compression=None):
+    """
+    Computes the sketches per subject, modality and stratum from the feature matrix.
+
+    :param subjects: subject IDs of the rows
+    :type subjects: numpy.ndarray
+    :param strata: strata of the rows (-1 for unknown)
+    :type strata: numpy.ndarray
+    :param matrix: feature matrix (one row per examination session, NaN for the missing values)
+    :type matrix: numpy.ndarray
+    :param columns: columns of the feature matrix
+    :type columns: list of tuples (modality, feature label)
+    :param compression: compression of the sketches
+    :type compression: int, optional
+    :return: sketches ({(subject ID, modality, stratum): {feature label: sketch}})
+    :rtype: dict
+    """
+    sketches = {}
+
+    for subject_id, stratum in np.unique(np.column_stack((subjects, strata)), axis=0):
+        subject_matrix = matrix[(subjects == subject_id) & (strata == stratum)]
+        for index in np.flatnonzero(np.count_nonzero(~np.isnan(subject_matrix), axis=0)):
+            modality, label = columns[index]
+            key = (int(subject_id), modality, None if stratum < 0 else int(stratum))
+            sketches.setdefault(key, {})[label] = TDigest(compression).update(subject_matrix[:, index]).to_dict()
+
+    # Return the sketches
+    return sketches
+
 
-        # Compute the normative data
-        for modality_type, modality_features in norms_buffer.items():
-            norms[modality_type] = {}
+class Command(BaseCommand):
+    help = 'Creates normative data from healthy subjects'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organization',
+            default=NormativeSketch.CONFIGURATION.get('organization') or 'fnusa',
+            help='organization name of the subjects (the configured one, or fnusa by default)')
+        parser.add_argument(
+            '--cohort',
+            default=NormativeSketch.CONFIGURATION.get('cohort_filter', 'HC'),
+            help='code filter of the healthy subjects')
+        parser.add_argument(
+            '--output',
+            default='normative.json',
+            help=f'path of the *.json file, or "{DATABASE_OUTPUT}" to rebuild the normative sketches and publish '
+                 f'the normative data (the cohort should match the configured one, which is kept up-to-date)')
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='number of the worker processes (1 to read the features in the main process)')
+
+    def handle(self, *args, **kwargs):
+        """Handles the command: creates normative data from healthy subjects"""
+        if kwargs['processes'] < 1:
+            raise CommandError('The number of the worker processes must be positive')
+
+        t1 = time.perf_counter()
+
+        # Get the healthy subjects
+        subject_ids = list(
+            NormativeSketch.get_cohort(kwargs['organization'], kwargs['cohort'])
+            .order_by('pk')
+            .values_list('pk', flat=True))
+        if not subject_ids:
+            raise CommandError(f'No subjects matching the cohort filter: {kwargs["cohort"]}')
+
+        # Shard the subjects
+        shards = np.array_split(subject_ids, min(len(subject_ids), kwargs['processes'] * SHARDS_PER_PROCESS))
+        shards = [shard.tolist() for shard in shards]
+
+        # --
 
-            for feature_label, feature_values in modality_features.items():
-                values = np.array([x for x in feature_values if x is not None])
+        # Read the feature matrix (in the worker processes)
+        results, done = [], 0
+        if kwargs['processes'] == 1:
+            for shard in shards:
+                results.append(read_feature_matrix(shard))
+                done += len(shard)
+                self.stdout.write(f'Read features: {done}/{len(subject_ids)} subjects')
+        else:
+            # Set up Django in the worker processes before the tasks are unpickled (e.g. when spawned)
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=kwargs['processes'], initializer=django.setup) as executor:
+                futures = {executor.submit(read_feature_matrix, shard): shard for shard in shards}
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    done += len(futures[future])
+                    self.stdout.write(f'Read features: {done}/{len(subject_ids)} subjects')
 
-                norms[modality_type][feature_label] = {
-                    'median': round(float(np.median(values)), 6) if values.any() else None,
-                    'iqr': round(float(np.subtract(*np.percentile(values, [75, 25]))), 6) if values.any() else None
-                }
+        columns = get_feature_columns()
+        subjects = np.concatenate([result[0] for result in results])
+        strata = np.concatenate([result[1] for result in results])
+        matrix = np.vstack([result[2] for result in results])
+
+        t2 = time.perf_counter()
+        self.stdout.write(f'Read {len(matrix)} sessions x {len(columns)} features in {t2 - t1:.2f} s')
 
         # --
 
-        # Store the normative data as a *.json file
-        with open('normative.json', 'wt', encoding='utf-8') as f:
-            json.dump(norms, f)
+        # Compute the normative data (globally and per stratum)
+        norms = compute_norms(matrix, columns)
+        strata_norms = compute_strata_norms(strata, matrix, columns)
+
+        t3 = time.perf_counter()
+        self.stdout.write(
+            f'Computed {sum(map(len, norms.values()))} norms '
+            f'({len(np.unique(strata[strata >= 0]))} strata) in {t3 - t2:.2f} s')
+
+        # --
 
-        pprint(norms)
+        # Store the normative data
+        if kwargs['output'] == DATABASE_OUTPUT:
+            compression = NormativeSketch.CONFIGURATION.get('compression')
+            sketches = compute_sketches(subjects, strata, matrix, columns, compression)
+            data = NormativeSketch.replace_all(sketches, norms=norms, strata=strata_norms)
+            self.stdout.write(f'Published normative data (version: {data.pk}, sketches: {len(sketches)})')
+        else:
+            with open(kwargs['output'], 'wt', encoding='utf-8') as f:
+                json.dump(norms, f)
+            self.stdout.write(f'Stored normative data: {kwargs["output"]}')
 
-        t2 = datetime.now()
-        print(f'End: {str(t2)}')
-        print(f'Time difference: {str(t2 - t1)}')
+        t4 = time.perf_counter()
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {len(subject_ids)} subjects in {t4 - t1:.2f} s '
+            f'(read: {t2 - t1:.2f} s, compute: {t3 - t2:.2f} s, store: {t4 - t3:.2f} s)'))
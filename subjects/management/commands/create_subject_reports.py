@@ -1,44 +1,198 @@
-from datetime import datetime
-from django.core.management.base import BaseCommand
-from subjects.models import User, Subject, Organization
+import os
+import time
+import django
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.db import connections
+from django.db.models import Prefetch
+from django.core.management.base import BaseCommand, CommandError
+from subjects.models import User, Subject, ExaminationSession, Organization, DATA_TO_MODEL_CLASS_MAPPING
+from subjects.views_predictors import SubjectLBDPredictor, ExaminationSessionLBDPredictor
 from reporter.subject import create_report
+from reporter.utils import measure
 
 
-class FakeRequest:
-    def __init__(self, user_record):
-        self.user = user_record
+# Define the number of shards per process (finer shards give smoother progress and load balancing)
+SHARDS_PER_PROCESS = 4
 
+# Define the report generation stages (in the order of the timing breakdown)
+STAGES = ('predict', 'fetch', 'graphs', 'layout', 'write')
 
-# Set the organization to get the reports for
-organization = Organization.objects.get(name='fnusa')
 
-# Set the user to get the reports for
-user = User.objects.get(username='zolo')
+class ReportRequest(object):
+    """Class implementing the request of the reports (the user the reports are created for)"""
 
-# Fake the `request` object
-request = FakeRequest(user)
+    def __init__(self, user):
+        self.user = user
 
-# Set the debugging mode
-debug = True
+
+def get_subjects_for_reports(subject_ids):
+    """
+    Returns the subjects prepared for the reports (the organization, the examination sessions and
+    all their data are fetched in a constant number of queries).
+
+    :param subject_ids: subject IDs
+    :type subject_ids: list
+    :return: fetched subjects
+    :rtype: QuerySet
+    """
+    return Subject.objects \
+        .filter(pk__in=subject_ids) \
+        .select_related('organization') \
+        .prefetch_related(Prefetch(
+            'examination_sessions',
+            queryset=ExaminationSession.objects.select_related(
+                *(model._meta.model_name for model in DATA_TO_MODEL_CLASS_MAPPING.values()))))
+
+
+def create_reports(user_id, subject_ids, output_dir, probabilities):
+    """
+    Creates the reports of the subjects (shard of the subjects, run in a worker process).
+
+    :param user_id: ID of the user the reports are created for
+    :type user_id: int
+    :param subject_ids: subject IDs
+    :type subject_ids: list
+    :param output_dir: directory of the reports
+    :type output_dir: str
+    :param probabilities: predicted LBD probabilities of the subjects ({subject ID: LBD probability})
+    :type probabilities: dict
+    :return: number of the created reports, errors ([(subject code, error)]) and timings per stage [s]
+    :rtype: tuple (int, list, dict)
+    """
+    timings, errors, created = {}, [], 0
+
+    # Get the user and the subjects
+    with measure(timings, 'fetch'):
+        request = ReportRequest(User.objects.get(pk=user_id))
+        subjects = list(get_subjects_for_reports(subject_ids))
+
+    # Create the reports
+    for subject in subjects:
+        subject.lbd_probability = probabilities.get(subject.pk)
+        try:
+            with measure(timings, 'total'):
+                create_report(request, subject, output_dir=output_dir, timings=timings)
+            created += 1
+        except Exception as e:
+            errors.append((subject.code, str(e)))
+
+    # Close the connections of the worker process
+    connections.close_all()
+
+    # Return the number of the created reports, the errors and the timings
+    return created, errors, timings
 
 
 class Command(BaseCommand):
     help = 'Creates subject reports'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organization',
+            required=True,
+            help='organization name of the subjects')
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='username of the user the reports are created for (e.g. the predictions)')
+        parser.add_argument(
+            '--output-dir',
+            default=getattr(settings, 'REPORTS_PATH'),
+            help='directory of the reports (the reports path by default)')
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='number of the worker processes (1 to create the reports in the main process)')
+
     def handle(self, *args, **kwargs):
-        """Handles the command: creates normative data from healthy subjects"""
+        """Handles the command: creates the reports of the subjects of an organization"""
+        if kwargs['processes'] < 1:
+            raise CommandError('The number of the worker processes must be positive')
+
+        # Get the organization and the user
+        organization = Organization.objects.filter(name=kwargs['organization']).first()
+        if not organization:
+            raise CommandError(f'Organization does not exist: {kwargs["organization"]}')
+        user = User.objects.filter(username=kwargs['user']).first()
+        if not user:
+            raise CommandError(f'User does not exist: {kwargs["user"]}')
+
+        # Prepare the directory of the reports
+        os.makedirs(kwargs['output_dir'], exist_ok=True)
+
+        t1 = time.perf_counter()
+        timings = {}
+
+        # Get the subjects (with the latest sessions for the predictions)
+        subjects = list(Subject.get_subjects_with_latest_sessions(organization, order_by=('code', )))
+        if not subjects:
+            raise CommandError(f'No subjects in the organization: {kwargs["organization"]}')
+
+        # Predict the LBD probabilities in bulk (cached for the evolution graphs of the reports)
+        with measure(timings, 'predict'):
+            sessions = ExaminationSession.objects \
+                .filter(subject__organization=organization) \
+                .select_related(
+                    'subject', *(model._meta.model_name for model in DATA_TO_MODEL_CLASS_MAPPING.values()))
+            ExaminationSessionLBDPredictor.predict_lbd_probability_many(user, sessions)
+            probabilities = dict(zip(
+                [subject.pk for subject in subjects],
+                SubjectLBDPredictor.predict_lbd_probability_many(user, subjects)))
+
+        self.stdout.write(f'Predicted {len(subjects)} subjects in {timings["predict"]:.2f} s')
+
+        # Shard the subjects
+        subject_ids = [subject.pk for subject in subjects]
+        shards = np.array_split(subject_ids, min(len(subject_ids), kwargs['processes'] * SHARDS_PER_PROCESS))
+        shards = [shard.tolist() for shard in shards]
+
+        # --
+
+        # Create the reports (in the worker processes)
+        results, done = [], 0
+        arguments = [
+            (user.pk, shard, kwargs['output_dir'], {pk: probabilities[pk] for pk in shard})
+            for shard in shards
+        ]
+        if kwargs['processes'] == 1:
+            for shard_arguments in arguments:
+                results.append(create_reports(*shard_arguments))
+                done += len(shard_arguments[1])
+                self.stdout.write(f'Created reports: {done}/{len(subjects)} subjects')
+        else:
+            # Set up Django in the worker processes before the tasks are unpickled (e.g. when spawned)
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=kwargs['processes'], initializer=django.setup) as executor:
+                futures = {executor.submit(create_reports, *shard_arguments): shard_arguments[1]
+                           for shard_arguments in arguments}
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    done += len(futures[future])
+                    self.stdout.write(f'Created reports: {done}/{len(subjects)} subjects')
 
-        t1 = datetime.now()
-        print(f'Start: {t1}')
+        # Report the errors
+        for _, errors, _ in results:
+            for code, error in errors:
+                self.stderr.write(f'{code}: {error}')
 
-        # Get the subjects
-        subjects = Subject.get_subjects(organization=organization)
+        # Sum the timings of the workers (the layout is the remainder of the report generation)
+        for _, _, worker_timings in results:
+            total = worker_timings.pop('total', 0)
+            worker_timings['layout'] = max(
+                total - sum(worker_timings.get(stage, 0) for stage in ('predict', 'graphs', 'write')), 0)
+            for stage, seconds in worker_timings.items():
+                timings[stage] = timings.get(stage, 0) + seconds
 
-        # Create the reports
-        for i, subject in enumerate(subjects, 1):
-            print(f'[{i}/{subjects.count()}] {subject.code}')
-            create_report(request, subject)
+        # --
 
-        t2 = datetime.now()
-        print(f'End: {str(t2)}')
-        print(f'Time difference: {str(t2 - t1)}')
+        t2 = time.perf_counter()
+        created = sum(result[0] for result in results)
+        self.stdout.write(
+            'Timings (summed over the processes): ' +
+            ', '.join(f'{stage}: {timings.get(stage, 0):.2f} s' for stage in STAGES))
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {created}/{len(subjects)} reports in {t2 - t1:.2f} s '
+            f'({created / (t2 - t1):.2f} reports/s, processes: {kwargs["processes"]})'))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from subjects.models import ExaminationSession
+from subjects.models_cache import PredictionCache
+
+
+class Command(BaseCommand):
+    help = 'Invalidates the cached predictions of a predictor model (e.g. after the model rollout)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            default=getattr(settings, 'PREDICTOR_CONFIGURATION')['model_identifier'],
+            help='model identifier (the configured model by default)')
+
+    def handle(self, *args, **kwargs):
+        """Handles the command: invalidates the cached and stored predictions (bumps the version of the cache keys)"""
+
+        # Invalidate the cached predictions (including the cached LBD probabilities)
+        version = PredictionCache(kwargs['model']).invalidate()
+
+        # Invalidate the stored LBD probabilities
+        invalidated = ExaminationSession.invalidate_stored_lbd_predictions(kwargs['model'])
+
+        # Report the new version
+        self.stdout.write(
+            f'{kwargs["model"]}: cached predictions invalidated (version: {version}), '
+            f'stored predictions marked as stale: {invalidated}')
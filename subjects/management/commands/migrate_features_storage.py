@@ -0,0 +1,63 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from subjects.models import DATA_TO_MODEL_CLASS_MAPPING
+
+
+class Command(BaseCommand):
+    help = 'Migrates the features of the feature-based data from the data files into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modality',
+            action='append',
+            choices=list(DATA_TO_MODEL_CLASS_MAPPING.keys()),
+            help='modality to be migrated (all modalities by default; can be repeated)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='number of the records updated at once')
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='re-read the features of the records already stored in the database')
+
+    def handle(self, *args, **kwargs):
+        """Handles the command: migrates the features from the data files into the database"""
+
+        # Get the settings
+        modalities = kwargs['modality'] or list(DATA_TO_MODEL_CLASS_MAPPING.keys())
+        batch_size = max(1, kwargs['batch_size'])
+
+        for modality in modalities:
+            model = DATA_TO_MODEL_CLASS_MAPPING[modality]
+            t1 = datetime.now()
+
+            # Get the records with the data files (and with no features stored in the database)
+            records = model.objects.exclude(data='').order_by('pk')
+            if not kwargs['force']:
+                records = records.filter(features__isnull=True)
+
+            # Read the features from the data files
+            migrated, failed, batch = 0, 0, []
+            for record in records.iterator(chunk_size=batch_size):
+                try:
+                    record.features = model.read_features_as_mapping(path=record.data.path)
+                except (OSError, ValueError) as e:
+                    self.stderr.write(f'{record}: {type(e).__name__}: {e}')
+                    failed += 1
+                    continue
+
+                # Store the features (in batches)
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    model.objects.bulk_update(batch, [model.CONFIGURATION.features_field])
+                    migrated, batch = migrated + len(batch), []
+
+            # Store the rest of the features
+            model.objects.bulk_update(batch, [model.CONFIGURATION.features_field])
+            migrated += len(batch)
+
+            # Report the progress
+            t2 = datetime.now()
+            self.stdout.write(f'[{t2}] {modality}: migrated: {migrated}, failed: {failed} ({str(t2 - t1)})')
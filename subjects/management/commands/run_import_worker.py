@@ -0,0 +1,75 @@
+import time
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from subjects.models import ImportJob
+from subjects.views_io import import_subjects_from_file
+
+
+# Get the import worker configuration
+worker_configuration = getattr(settings, 'IMPORT_CONFIGURATION').get('import_worker', {})
+
+
+def run_import_job(job):
+    """
+    Runs the import job (imports the subjects from the uploaded workbook).
+
+    :param job: claimed import job
+    :type job: Record
+    :return: errors per subject
+    :rtype: dict
+    """
+    try:
+        with job.file.open('rb') as f:
+            errors = import_subjects_from_file(job.user, f, progress=job.set_progress)
+    except Exception as e:
+        job.finish(error=f'{type(e).__name__}: {e}')
+        raise
+    else:
+        job.finish(errors=errors)
+        return errors
+
+
+class Command(BaseCommand):
+    help = 'Runs the import worker (imports the uploaded subject cohort workbooks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=worker_configuration.get('poll_interval', 5),
+            help='number of seconds to wait when there are no pending jobs')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='exit when there are no pending jobs')
+
+    def handle(self, *args, **kwargs):
+        """Handles the command: imports the uploaded subject cohort workbooks"""
+
+        # Requeue the jobs interrupted by a previous run of the worker
+        ImportJob.requeue_running()
+
+        while True:
+
+            # Claim the oldest pending job
+            job = ImportJob.claim()
+
+            # Wait for the new jobs (or exit)
+            if not job:
+                if kwargs['once']:
+                    break
+                time.sleep(kwargs['poll_interval'])
+                continue
+
+            # Run the import job
+            t1 = datetime.now()
+            try:
+                errors = run_import_job(job)
+            except Exception as e:
+                self.stderr.write(f'[{datetime.now()}] {job}: failed ({type(e).__name__}: {e})')
+                continue
+            t2 = datetime.now()
+
+            # Report the progress
+            self.stdout.write(f'[{t2}] {job}: {job.subjects_total} subjects, {len(errors)} errors ({str(t2 - t1)})')
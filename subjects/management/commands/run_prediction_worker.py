@@ -0,0 +1,147 @@
+import time
+import django
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.db import connections
+from django.core.management.base import BaseCommand, CommandError
+from subjects.models import User, ExaminationSession, PredictionJob
+from subjects.views_predictors import ExaminationSessionLBDPredictor
+from predictor.processors import process_features
+
+
+# Get the prediction worker configuration
+worker_configuration = getattr(settings, 'PREDICTOR_CONFIGURATION').get('prediction_worker', {})
+
+
+def precompute_lbd_predictions(job_ids, username=None):
+    """
+    Precomputes the LBD predictions of the examination sessions of the prediction jobs (worker process).
+
+    :param job_ids: IDs of the claimed prediction jobs
+    :type job_ids: list
+    :param username: username of the user to be used for the predictor API
+    :type username: str, optional
+    :return: (number of finished jobs, number of failed jobs)
+    :rtype: tuple
+    """
+
+    # Get the user and the jobs
+    user = User.objects.get(username=username) if username else None
+    jobs = list(PredictionJob.objects.filter(id__in=job_ids).select_related('examination_session__subject'))
+
+    # Precompute the LBD predictions (single predictor call for all the examination sessions)
+    try:
+        probabilities = ExaminationSessionLBDPredictor.compute_lbd_probability_many(
+            user,
+            [job.examination_session for job in jobs])
+    except Exception as e:
+        PredictionJob.finish(jobs, error=f'{type(e).__name__}: {e}')
+        return 0, len(jobs)
+    else:
+        # Get the failed jobs (no LBD probability predicted although there are features to predict from)
+        failed = [
+            job for job, lbd_probability in zip(jobs, probabilities)
+            if lbd_probability is None and process_features(job.examination_session)[1].size
+        ]
+
+        # Finish the jobs (the failed jobs are retried later)
+        PredictionJob.finish([job for job in jobs if job not in failed])
+        PredictionJob.finish(failed, error='The LBD probability could not be predicted')
+        return len(jobs) - len(failed), len(failed)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Runs the prediction worker (precomputes the LBD predictions of the queued examination sessions)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            default=worker_configuration.get('user'),
+            help='username of the user to be used for the predictor API (required by the API predictor)')
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=worker_configuration.get('processes', 2),
+            help='number of the worker processes')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=worker_configuration.get('batch_size', 50),
+            help='number of the jobs claimed at once')
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=worker_configuration.get('poll_interval', 5),
+            help='number of seconds to wait when there are no pending jobs')
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=worker_configuration.get('max_attempts', 3),
+            help='maximum number of attempts of a failed job (1 to never retry the failed jobs)')
+        parser.add_argument(
+            '--retry-delay',
+            type=float,
+            default=worker_configuration.get('retry_delay', 60),
+            help='number of seconds to wait before a failed job is retried')
+        parser.add_argument(
+            '--enqueue-stale',
+            action='store_true',
+            help='enqueue all examination sessions with stale (or missing) predictions first')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='exit when there are no pending jobs')
+
+    def handle(self, *args, **kwargs):
+        """Handles the command: precomputes the LBD predictions of the queued examination sessions"""
+
+        # Get the settings
+        username = kwargs['user']
+        processes = max(1, kwargs['processes'])
+        batch_size = max(1, kwargs['batch_size'])
+
+        # Validate the user (the predictor API needs the user to sign in with)
+        if username and not User.objects.filter(username=username).exists():
+            raise CommandError(f'User does not exist: {username}')
+        if not username and getattr(settings, 'PREDICTOR_CONFIGURATION').get('use_api_predictor', False) is True:
+            raise CommandError('The user must be provided for the API predictor (--user or prediction_worker.user)')
+
+        # Requeue the jobs interrupted by a previous run of the worker
+        PredictionJob.requeue_running()
+
+        # Enqueue the examination sessions with stale predictions
+        if kwargs['enqueue_stale']:
+            ExaminationSession.enqueue_lbd_predictions(ExaminationSession.objects.filter(lbd_probability_stale=True))
+
+        # Close the database connections (they must not be shared with the worker processes)
+        connections.close_all()
+
+        # Set up Django in the worker processes before the tasks are unpickled (e.g. when spawned)
+        with ProcessPoolExecutor(max_workers=processes, initializer=django.setup) as pool:
+            while True:
+
+                # Requeue the failed jobs to be retried and claim the pending jobs
+                PredictionJob.requeue_failed(kwargs['max_attempts'], kwargs['retry_delay'])
+                jobs = PredictionJob.claim(batch_size)
+                connections.close_all()
+
+                # Wait for the new jobs (or exit)
+                if not jobs:
+                    if kwargs['once']:
+                        break
+                    time.sleep(kwargs['poll_interval'])
+                    continue
+
+                # Precompute the LBD predictions (the jobs are split evenly among the worker processes)
+                t1 = datetime.now()
+                chunks = [[job.id for job in jobs[i::processes]] for i in range(processes)]
+                chunks = [chunk for chunk in chunks if chunk]
+                results = list(pool.map(precompute_lbd_predictions, chunks, [username] * len(chunks)))
+                t2 = datetime.now()
+
+                # Report the progress
+                finished, failed = sum(r[0] for r in results), sum(r[1] for r in results)
+                self.stdout.write(f'[{t2}] finished: {finished}, failed: {failed} ({str(t2 - t1)})')
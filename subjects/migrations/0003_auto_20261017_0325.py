@@ -0,0 +1,38 @@
+# Generated by Django 3.1.7 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0002_auto_20230113_1403'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examinationsession',
+            name='lbd_probability',
+            field=models.FloatField(blank=True, null=True, verbose_name='lbd probability'),
+        ),
+        migrations.AddField(
+            model_name='examinationsession',
+            name='lbd_probability_computed_on',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='lbd probability computed on'),
+        ),
+        migrations.AddField(
+            model_name='examinationsession',
+            name='lbd_probability_hash',
+            field=models.CharField(blank=True, max_length=40, null=True, verbose_name='lbd probability features hash'),
+        ),
+        migrations.AddField(
+            model_name='examinationsession',
+            name='lbd_probability_model',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='lbd probability model'),
+        ),
+        migrations.AddField(
+            model_name='examinationsession',
+            name='lbd_probability_stale',
+            field=models.BooleanField(default=True, verbose_name='lbd probability stale'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.7 on 2026-10-17 03:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0003_auto_20261017_0325'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='state')),
+                ('attempts', models.SmallIntegerField(default=0, verbose_name='attempts')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='error')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created on')),
+                ('started_on', models.DateTimeField(blank=True, null=True, verbose_name='started on')),
+                ('examination_session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='prediction_job', to='subjects.examinationsession')),
+            ],
+            options={
+                'ordering': ['created_on'],
+            },
+        ),
+    ]
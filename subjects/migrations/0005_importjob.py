@@ -0,0 +1,35 @@
+# Generated by Django 3.1.7 on 2026-10-17 03:30
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0004_predictionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/', validators=[django.core.validators.FileExtensionValidator(['xls', 'xlsx'])], verbose_name='file')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='state')),
+                ('subjects_total', models.IntegerField(default=0, verbose_name='subjects total')),
+                ('subjects_done', models.IntegerField(default=0, verbose_name='subjects done')),
+                ('errors', models.JSONField(blank=True, default=dict, verbose_name='errors')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='error')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created on')),
+                ('started_on', models.DateTimeField(blank=True, null=True, verbose_name='started on')),
+                ('finished_on', models.DateTimeField(blank=True, null=True, verbose_name='finished on')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_on'],
+            },
+        ),
+    ]
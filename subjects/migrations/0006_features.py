@@ -0,0 +1,43 @@
+# Generated by Django 3.1.7 on 2026-10-17 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0005_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataacoustic',
+            name='features',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='features'),
+        ),
+        migrations.AddField(
+            model_name='dataactigraphy',
+            name='features',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='features'),
+        ),
+        migrations.AddField(
+            model_name='datacei',
+            name='features',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='features'),
+        ),
+        migrations.AddField(
+            model_name='datahandwriting',
+            name='features',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='features'),
+        ),
+        migrations.AddField(
+            model_name='datapsychology',
+            name='features',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='features'),
+        ),
+        migrations.AddField(
+            model_name='datatcs',
+            name='features',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='features'),
+        ),
+    ]
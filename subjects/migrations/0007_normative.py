@@ -0,0 +1,38 @@
+# Generated by Django 3.1.7 on 2026-10-17 03:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0006_features'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NormativeData',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('norms', models.JSONField(default=dict, verbose_name='norms')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created on')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='NormativeSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modality', models.CharField(max_length=20, verbose_name='modality')),
+                ('sketches', models.JSONField(blank=True, default=dict, verbose_name='sketches')),
+                ('updated_on', models.DateTimeField(auto_now=True, verbose_name='updated on')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='normative_sketches', to='subjects.subject')),
+            ],
+            options={
+                'unique_together': {('subject', 'modality')},
+            },
+        ),
+    ]
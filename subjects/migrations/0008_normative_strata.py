@@ -0,0 +1,27 @@
+# Generated by Django 3.1.7 on 2026-10-17 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0007_normative'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='normativedata',
+            name='strata',
+            field=models.JSONField(blank=True, default=dict, verbose_name='strata'),
+        ),
+        migrations.AddField(
+            model_name='normativesketch',
+            name='stratum',
+            field=models.SmallIntegerField(blank=True, null=True, verbose_name='stratum'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='normativesketch',
+            unique_together={('subject', 'modality', 'stratum')},
+        ),
+    ]
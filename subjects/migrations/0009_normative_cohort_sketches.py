@@ -0,0 +1,79 @@
+# Generated by Django 3.1.7 on 2026-10-17 04:36
+
+from django.conf import settings
+from django.db import migrations, models
+from subjects.models_norms import TDigest
+
+
+def remove_duplicate_sketches(apps, schema_editor):
+    """Removes the duplicate sketches without a stratum (keeps the latest one of the subject and modality)"""
+    NormativeSketch = apps.get_model('subjects', 'NormativeSketch')
+
+    kept = {}
+    for pk, subject_id, modality in NormativeSketch.objects \
+            .filter(stratum__isnull=True) \
+            .order_by('updated_on', 'pk') \
+            .values_list('pk', 'subject_id', 'modality'):
+        kept[(subject_id, modality)] = pk
+    NormativeSketch.objects.filter(stratum__isnull=True).exclude(pk__in=kept.values()).delete()
+
+
+def merge_cohort_sketches(apps, schema_editor):
+    """Merges the sketches of the subjects per modality and stratum"""
+    NormativeSketch = apps.get_model('subjects', 'NormativeSketch')
+    NormativeCohortSketch = apps.get_model('subjects', 'NormativeCohortSketch')
+    compression = getattr(settings, 'DATA_CONFIGURATION').get('normative', {}).get('compression')
+
+    # Collect the sketches of the features per stratum
+    strata = {}
+    for modality, stratum, subject_sketches in \
+            NormativeSketch.objects.values_list('modality', 'stratum', 'sketches').iterator():
+        for label, sketch in subject_sketches.items():
+            strata.setdefault((modality, stratum), {}).setdefault(label, []) \
+                .append(TDigest.from_dict(sketch, compression))
+
+    # Create the merged sketches
+    NormativeCohortSketch.objects.bulk_create([
+        NormativeCohortSketch(
+            modality=modality,
+            stratum=stratum,
+            sketches={
+                label: TDigest.merge_all(sketches, compression).to_dict()
+                for label, sketches in sorted(features.items())
+            })
+        for (modality, stratum), features in strata.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subjects', '0008_normative_strata'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_sketches, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='NormativeCohortSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modality', models.CharField(max_length=20, verbose_name='modality')),
+                ('stratum', models.SmallIntegerField(blank=True, null=True, verbose_name='stratum')),
+                ('sketches', models.JSONField(blank=True, default=dict, verbose_name='sketches')),
+                ('updated_on', models.DateTimeField(auto_now=True, verbose_name='updated on')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='normativesketch',
+            constraint=models.UniqueConstraint(condition=models.Q(stratum__isnull=True), fields=('subject', 'modality'), name='unique_normative_sketch_without_stratum'),
+        ),
+        migrations.AddConstraint(
+            model_name='normativecohortsketch',
+            constraint=models.UniqueConstraint(condition=models.Q(stratum__isnull=True), fields=('modality',), name='unique_normative_cohort_sketch_without_stratum'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='normativecohortsketch',
+            unique_together={('modality', 'stratum')},
+        ),
+        migrations.RunPython(merge_cohort_sketches, migrations.RunPython.noop),
+    ]
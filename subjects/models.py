@@ -1,17 +1,28 @@
-import numpy
+import math
 import random
 import string
 import uuid
+import logging
 import secrets
-from django.db import models
-from django.db.models.signals import post_save
+import threading
+from datetime import timedelta
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from django.db import models, transaction, connections
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery, UniqueConstraint
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_save, post_delete
 from django.conf import settings
+from django.utils import timezone
 from django.core.validators import FileExtensionValidator
+from django.core.files.base import ContentFile
 from django.contrib.auth.models import AbstractUser
 from django.shortcuts import get_object_or_404
-from predictor.preprocessors import preprocess_feature
-from .models_cache import SubjectCache, ExaminationSessionCache
+from predictor.preprocessors import FeatureEncodingPlan
+from .models_cache import SubjectCache, ExaminationSessionCache, FeaturesCache, ImportJobCache, NormativeDataCache
+from .models_norms import TDigest, NormativeStrata, NormativeTable, pending_normative_updates
 from .models_formatters import FeaturesFormatter, format_feature_data_type
+from .models_utils import rename_features
 from .models_configuration import (
     SubjectDataConfiguration,
     DataAcousticConfiguration,
@@ -25,7 +36,11 @@ from .models_signals import (
     prepare_predictor_api_for_created_user,
     update_last_examined_on_for_subject,
     invalidate_cached_lbd_prediction_for_session,
-    invalidate_cached_lbd_prediction_for_subject
+    invalidate_cached_lbd_prediction_for_subject,
+    invalidate_cached_features_for_data,
+    update_normative_data_for_session_data,
+    update_normative_data_for_subject,
+    update_normative_data_for_session
 )
 from .models_io import (
     is_csv_file,
@@ -35,6 +50,10 @@ from .models_io import (
 )
 
 
+# Get the module-level logger instance
+logger = logging.getLogger(__name__)
+
+
 class User(AbstractUser):
     """Class implementing user model"""
 
@@ -141,6 +160,12 @@ class Subject(models.Model):
             } for name in names
         ]
 
+    def get_latest_session(self):
+        """Returns the latest examination session (the prefetched one if available)"""
+        if hasattr(self, 'latest_sessions'):
+            return self.latest_sessions[0] if self.latest_sessions else None
+        return ExaminationSession.get_sessions(subject=self, order_by=('-session_number', )).first()
+
     def get_features_for_prediction(self):
         """Gets the prediction features for a given subject"""
 
@@ -148,22 +173,8 @@ class Subject(models.Model):
         features = self.get_features_from_record(self)
         features = FeaturesFormatter.get_features_as_kwargs(features)
 
-        # Accumulate the features and labels
-        feature_values = []
-        feature_labels = []
-
-        for supported_feature in self.CONFIGURATION.get_predictor_feature_names():
-            if supported_feature in features:
-
-                # Preprocess the feature
-                label, value = preprocess_feature(features[supported_feature], supported_feature, model=self)
-
-                # Accumulate the feature
-                feature_values += value
-                feature_labels += label
-
-        # Return the labels and features for prediction
-        return feature_labels, numpy.array(feature_values, dtype=float)
+        # Return the labels and features for prediction (encoded via the compiled encoding plan)
+        return FeatureEncodingPlan.encode_many([(type(self), features)])
 
     @staticmethod
     def get_subjects(organization, order_by=()):
@@ -198,6 +209,38 @@ class Subject(models.Model):
         """
         return Subject.get_subjects(organization, order_by=order_by).filter(code__contains=search_phrase)
 
+    @staticmethod
+    def get_subjects_with_latest_sessions(organization, search_phrase=None, order_by=()):
+        """
+        Returns subjects according to the input attributes (prepared for listing).
+
+        The subjects are annotated with the number of examination sessions (num_sessions), and
+        their latest examination session is prefetched (latest_sessions) together with all its data.
+
+        :param organization: organization name of the subjects
+        :type organization: str
+        :param search_phrase: search phrase to filter the subjects
+        :type search_phrase: str, optional
+        :param order_by: ordering of the subjects
+        :type order_by: tuple, optional
+        :return: fetched subjects
+        :rtype: QuerySet
+        """
+
+        # Get the subjects
+        if search_phrase:
+            subjects = Subject.get_subjects_filtered(organization, search_phrase, order_by=order_by)
+        else:
+            subjects = Subject.get_subjects(organization, order_by=order_by)
+
+        # Annotate the number of sessions and prefetch the latest sessions (with the data)
+        return subjects \
+            .annotate(num_sessions=Count('examination_sessions')) \
+            .prefetch_related(Prefetch(
+                'examination_sessions',
+                queryset=ExaminationSession.get_latest_sessions(),
+                to_attr='latest_sessions'))
+
     @staticmethod
     def get_subject(pk=None, code=None):
         """
@@ -246,6 +289,11 @@ class ExaminationSession(models.Model):
     created_on = models.DateTimeField('created on', auto_now_add=True)
     updated_on = models.DateTimeField('updated on', auto_now=True)
     examined_on = models.DateTimeField('examined on', null=True, blank=True)
+    lbd_probability = models.FloatField('lbd probability', null=True, blank=True)
+    lbd_probability_model = models.CharField('lbd probability model', max_length=100, null=True, blank=True)
+    lbd_probability_hash = models.CharField('lbd probability features hash', max_length=40, null=True, blank=True)
+    lbd_probability_computed_on = models.DateTimeField('lbd probability computed on', null=True, blank=True)
+    lbd_probability_stale = models.BooleanField('lbd probability stale', default=True)
 
     def __str__(self):
         return f'{self.session_number}. session for subject: {self.subject.code}'
@@ -253,12 +301,39 @@ class ExaminationSession(models.Model):
     def get_lbd_probability_cache_key(self):
         return self.CACHED_DATA(self).get_lbd_probability_cache_key()
 
+    @staticmethod
+    def enqueue_lbd_predictions(sessions):
+        """Enqueues the LBD predictions of the examination sessions (precomputed by the prediction worker)"""
+        PredictionJob.enqueue(sessions)
+
+    @staticmethod
+    def invalidate_stored_lbd_predictions(model):
+        """
+        Invalidates the stored LBD predictions of a predictor model (e.g. after the model rollout).
+
+        The stored LBD probabilities of the examination sessions are marked as stale (kept to be served
+        while revalidated), and the stored LBD probabilities of the subjects are cleared.
+
+        :param model: predictor model identifier
+        :type model: str
+        :return: number of the invalidated examination sessions
+        :rtype: int
+        """
+        with transaction.atomic():
+            invalidated = ExaminationSession.objects \
+                .filter(lbd_probability_model=model, lbd_probability_stale=False) \
+                .update(lbd_probability_stale=True)
+            if model == ExaminationSession.CACHED_DATA.PREDICTOR_MODEL:
+                Subject.objects.exclude(lbd_probability=None).update(lbd_probability=None)
+
+        # Return the number of the invalidated examination sessions
+        return invalidated
+
     def get_features_for_prediction(self):
         """Gets the prediction features for a given examination session"""
 
-        # Prepare the features and labels buffer
-        feature_labels = []
-        feature_values = []
+        # Prepare the features buffer
+        features_buffer = []
 
         # Get the features for all data types specified in the predictor configuration
         for label in self.PREDICTOR_DATA_SEQUENCE:
@@ -267,7 +342,7 @@ class ExaminationSession(models.Model):
             model = DATA_TO_MODEL_CLASS_MAPPING[label]
 
             # Get the model record (skip if there is no record yet)
-            record = model.get_data(examination_session=self)
+            record = model.get_session_data(examination_session=self)
             if not record:
                 continue
 
@@ -275,26 +350,11 @@ class ExaminationSession(models.Model):
             features = model.get_features_from_record(record)
             features = FeaturesFormatter.get_features_as_kwargs(features)
 
-            # Accumulate the features and labels
-            values = []
-            labels = []
-
-            for supported_feature in model.CONFIGURATION.get_predictor_feature_names():
-                if supported_feature in features:
+            # Add the specific features to the overall collection
+            features_buffer.append((model, features))
 
-                    # Preprocess the feature
-                    label, value = preprocess_feature(features[supported_feature], supported_feature, model=model)
-
-                    # Accumulate the feature
-                    values += value
-                    labels += label
-
-            # Add the specific features and labels to the overall collection
-            feature_values += values
-            feature_labels += labels
-
-        # Return the labels and features for prediction
-        return feature_labels, numpy.array(feature_values, dtype=float)
+        # Return the labels and features for prediction (encoded via the compiled encoding plans)
+        return FeatureEncodingPlan.encode_many(features_buffer)
 
     @staticmethod
     def get_sessions(subject, order_by=()):
@@ -313,6 +373,26 @@ class ExaminationSession(models.Model):
         else:
             return ExaminationSession.objects.filter(subject=subject)
 
+    @staticmethod
+    def get_latest_sessions():
+        """
+        Returns the latest session of every subject (with all the data selected).
+
+        :return: fetched sessions
+        :rtype: QuerySet
+        """
+
+        # Prepare the latest session subquery
+        latest = ExaminationSession.objects \
+            .filter(subject=OuterRef('subject')) \
+            .order_by('-session_number') \
+            .values('id')[:1]
+
+        # Return the sessions
+        return ExaminationSession.objects \
+            .filter(id=Subquery(latest)) \
+            .select_related(*(model._meta.model_name for model in DATA_TO_MODEL_CLASS_MAPPING.values()))
+
     @staticmethod
     def get_session(pk=None, subject=None, subject_code=None, session_number=None):
         """
@@ -347,6 +427,981 @@ class ExaminationSession(models.Model):
                     return session
 
 
+class PredictionJob(models.Model):
+    """Class implementing prediction job model (queued precomputation of the LBD prediction of a session)"""
+
+    class Meta:
+        """Model meta information definition"""
+
+        # Default ordering of the records
+        ordering = ['created_on']
+
+    # Define the job states
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    # Define the model schema
+    examination_session = models.OneToOneField(
+        'ExaminationSession',
+        on_delete=models.CASCADE,
+        related_name='prediction_job')
+    state = models.CharField('state', max_length=10, choices=STATES, default=PENDING)
+    attempts = models.SmallIntegerField('attempts', default=0)
+    error = models.TextField('error', null=True, blank=True)
+    created_on = models.DateTimeField('created on', auto_now_add=True)
+    started_on = models.DateTimeField('started on', null=True, blank=True)
+
+    def __str__(self):
+        return f'Prediction job ({self.state}) for: {self.examination_session}'
+
+    @staticmethod
+    def enqueue(sessions, requeue=True):
+        """
+        Enqueues the prediction jobs for the examination sessions.
+
+        :param sessions: examination sessions to be predicted
+        :type sessions: iterable of Records
+        :param requeue: requeue flag (True to reset already queued/running jobs to pending)
+        :type requeue: bool, optional
+        :return: None
+        :rtype: None type
+        """
+
+        # Get the examination session IDs
+        session_ids = [session.pk for session in sessions]
+        if not session_ids:
+            return
+
+        # Create the missing jobs
+        PredictionJob.objects.bulk_create(
+            [PredictionJob(examination_session_id=session_id) for session_id in session_ids],
+            ignore_conflicts=True)
+
+        # Reset the existing jobs (the data might have changed since they were started)
+        if requeue:
+            PredictionJob.objects \
+                .filter(examination_session_id__in=session_ids) \
+                .update(state=PredictionJob.PENDING, started_on=None, error=None)
+
+    @staticmethod
+    def claim(batch_size):
+        """
+        Claims the pending prediction jobs (marks them as running).
+
+        :param batch_size: maximum number of jobs to be claimed
+        :type batch_size: int
+        :return: claimed jobs
+        :rtype: list of Records
+        """
+        with transaction.atomic():
+
+            # Get the pending jobs (skip the jobs locked by other workers)
+            jobs = list(
+                PredictionJob.objects
+                .select_for_update(skip_locked=True)
+                .filter(state=PredictionJob.PENDING)[:batch_size])
+
+            # Mark the jobs as running
+            started_on = timezone.now()
+            PredictionJob.objects \
+                .filter(id__in=[job.id for job in jobs]) \
+                .update(state=PredictionJob.RUNNING, started_on=started_on)
+
+        # Return the claimed jobs
+        for job in jobs:
+            job.state, job.started_on = PredictionJob.RUNNING, started_on
+        return jobs
+
+    @staticmethod
+    def finish(jobs, error=None):
+        """
+        Finishes the prediction jobs (removes them, or marks them as failed if an error is provided).
+
+        Only the jobs that were not requeued in the meantime are finished.
+
+        :param jobs: jobs to be finished
+        :type jobs: list of Records
+        :param error: error information
+        :type error: str, optional
+        :return: None
+        :rtype: None type
+        """
+        for job in jobs:
+            running = PredictionJob.objects.filter(
+                id=job.id,
+                state=PredictionJob.RUNNING,
+                started_on=job.started_on)
+            if error:
+                running.update(state=PredictionJob.FAILED, attempts=job.attempts + 1, error=error)
+            else:
+                running.delete()
+
+    @staticmethod
+    def requeue_running():
+        """Requeues the running jobs (e.g. interrupted by a worker that was shut down)"""
+        PredictionJob.objects \
+            .filter(state=PredictionJob.RUNNING) \
+            .update(state=PredictionJob.PENDING, started_on=None)
+
+    @staticmethod
+    def requeue_failed(max_attempts, retry_delay):
+        """
+        Requeues the failed jobs to be retried (the jobs that failed fewer times than the maximum attempts).
+
+        :param max_attempts: maximum number of attempts of a job
+        :type max_attempts: int
+        :param retry_delay: number of seconds to wait before the failed job is retried
+        :type retry_delay: float
+        :return: number of the requeued jobs
+        :rtype: int
+        """
+        return PredictionJob.objects \
+            .filter(
+                state=PredictionJob.FAILED,
+                attempts__lt=max_attempts,
+                started_on__lte=timezone.now() - timedelta(seconds=retry_delay)) \
+            .update(state=PredictionJob.PENDING, started_on=None)
+
+    @staticmethod
+    def get_pending_session_ids(sessions):
+        """
+        Returns the IDs of the examination sessions with not yet finished prediction jobs.
+
+        :param sessions: examination sessions (None for the subjects with no sessions)
+        :type sessions: iterable of Records
+        :return: IDs of the examination sessions
+        :rtype: set
+        """
+        return set(
+            PredictionJob.objects
+            .filter(examination_session__in=[session.pk for session in sessions if session is not None])
+            .exclude(state=PredictionJob.FAILED)
+            .values_list('examination_session_id', flat=True))
+
+
+class ImportJob(models.Model):
+    """Class implementing import job model (queued import of the uploaded subject cohort workbook)"""
+
+    class Meta:
+        """Model meta information definition"""
+
+        # Default ordering of the records
+        ordering = ['-created_on']
+
+    # Define the cached data object
+    CACHED_DATA = ImportJobCache
+
+    # Define the job states
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    STATES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FINISHED, 'Finished'), (FAILED, 'Failed')]
+
+    # Define the model schema
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='import_jobs')
+    file = models.FileField('file', upload_to='imports/', validators=[FileExtensionValidator(['xls', 'xlsx'])])
+    state = models.CharField('state', max_length=10, choices=STATES, default=PENDING)
+    subjects_total = models.IntegerField('subjects total', default=0)
+    subjects_done = models.IntegerField('subjects done', default=0)
+    errors = models.JSONField('errors', default=dict, blank=True)
+    error = models.TextField('error', null=True, blank=True)
+    created_on = models.DateTimeField('created on', auto_now_add=True)
+    started_on = models.DateTimeField('started on', null=True, blank=True)
+    finished_on = models.DateTimeField('finished on', null=True, blank=True)
+
+    def __str__(self):
+        return f'Import job ({self.state}): {self.file.name}'
+
+    @staticmethod
+    def claim():
+        """
+        Claims the oldest pending import job (marks it as running).
+
+        :return: claimed job (None if there are no pending jobs)
+        :rtype: Record
+        """
+        with transaction.atomic():
+
+            # Get the oldest pending job (skip the jobs locked by other workers)
+            job = ImportJob.objects \
+                .select_for_update(skip_locked=True) \
+                .filter(state=ImportJob.PENDING) \
+                .order_by('created_on') \
+                .first()
+
+            # Mark the job as running
+            if job:
+                job.state, job.started_on = ImportJob.RUNNING, timezone.now()
+                job.save(update_fields=['state', 'started_on'])
+
+        # Return the claimed job
+        return job
+
+    @staticmethod
+    def requeue_running():
+        """Requeues the running jobs (e.g. interrupted by a worker that was shut down)"""
+        ImportJob.objects.filter(state=ImportJob.RUNNING).update(state=ImportJob.PENDING, started_on=None)
+
+    def set_progress(self, subjects_done, subjects_total, errors):
+        """
+        Sets the progress of the running import job.
+
+        :param subjects_done: number of processed subjects
+        :type subjects_done: int
+        :param subjects_total: total number of subjects
+        :type subjects_total: int
+        :param errors: errors per subject
+        :type errors: dict
+        :return: None
+        :rtype: None type
+        """
+        self.subjects_done, self.subjects_total, self.errors = subjects_done, subjects_total, dict(errors)
+        self.CACHED_DATA(self).set_cached_progress({
+            'subjects_done': self.subjects_done,
+            'subjects_total': self.subjects_total,
+            'errors': self.errors
+        })
+
+    def finish(self, errors=None, error=None):
+        """
+        Finishes the import job (marks it as finished, or as failed if an error is provided).
+
+        :param errors: errors per subject
+        :type errors: dict, optional
+        :param error: error information (the whole import failed)
+        :type error: str, optional
+        :return: None
+        :rtype: None type
+        """
+        self.state = ImportJob.FAILED if error else ImportJob.FINISHED
+        self.error = error
+        self.errors = dict(errors) if errors is not None else self.errors
+        self.finished_on = timezone.now()
+        if not error:
+            self.subjects_done = self.subjects_total
+        self.save(update_fields=['state', 'error', 'errors', 'subjects_done', 'subjects_total', 'finished_on'])
+        self.CACHED_DATA(self).delete_cached_progress()
+
+    def get_progress(self):
+        """
+        Returns the progress of the import job (cached progress of the running job, if available).
+
+        :return: progress of the import job
+        :rtype: dict
+        """
+
+        # Prepare the progress (persisted)
+        progress = {
+            'state': self.state,
+            'subjects_done': self.subjects_done,
+            'subjects_total': self.subjects_total,
+            'errors': self.errors,
+            'error': self.error,
+            'created_on': self.created_on.isoformat() if self.created_on else None,
+            'finished_on': self.finished_on.isoformat() if self.finished_on else None
+        }
+
+        # Update the progress of the running job
+        if self.state == ImportJob.RUNNING:
+            progress.update(self.CACHED_DATA(self).get_cached_progress() or {})
+
+        # Return the progress
+        return progress
+
+
+class NormativeSketch(models.Model):
+    """
+    Class implementing normative sketch model (quantile sketches of the numerical features of a subject).
+
+    The sketches are kept per subject of the normative cohort (healthy controls), modality and stratum (sex
+    and age band at the examination), so that they are updated incrementally when the data of the subject
+    changes (or removed when the subject leaves the cohort), and merged into the published normative data
+    (medians and IQRs, global and per stratum).
+    """
+
+    class Meta:
+        """Model meta information definition"""
+
+        # Unique constraints (the sketches without a stratum are constrained separately, as NULLs are distinct)
+        unique_together = ('subject', 'modality', 'stratum')
+        constraints = [
+            UniqueConstraint(
+                fields=['subject', 'modality'],
+                condition=Q(stratum__isnull=True),
+                name='unique_normative_sketch_without_stratum')
+        ]
+
+    # Define the normative configuration
+    CONFIGURATION = getattr(settings, 'DATA_CONFIGURATION').get('normative', {})
+
+    # Define the strata of the normative data
+    STRATA = NormativeStrata(**CONFIGURATION.get('strata', {}))
+
+    # Define the batch size of the bulk operations
+    BULK_BATCH_SIZE = 500
+
+    # Define the executor of the background publications of the normative data (single publication at a time)
+    publish_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='normative')
+    publish_lock = threading.Lock()
+    publish_queued = False
+
+    # Define the model schema
+    subject = models.ForeignKey('Subject', on_delete=models.CASCADE, related_name='normative_sketches')
+    modality = models.CharField('modality', max_length=20)
+    stratum = models.SmallIntegerField('stratum', null=True, blank=True)
+    sketches = models.JSONField('sketches', default=dict, blank=True)
+    updated_on = models.DateTimeField('updated on', auto_now=True)
+
+    def __str__(self):
+        return f'Normative sketch ({self.modality}, stratum: {self.stratum}) of subject: {self.subject_id}'
+
+    @staticmethod
+    def get_stratum(session):
+        """
+        Returns the stratum of the examination session (sex of the subject and age band at the examination).
+
+        :param session: examination session (with the subject)
+        :type session: ExaminationSession instance
+        :return: stratum (None if the sex or the age of the subject is unknown)
+        :rtype: int
+        """
+        subject = session.subject
+        year = (session.examined_on or timezone.now()).year
+        return NormativeSketch.STRATA.get_stratum(subject.sex, subject.year_of_birth, year)
+
+    @staticmethod
+    def get_cohort(organization=None, cohort_filter=None):
+        """
+        Returns the subjects of the normative cohort.
+
+        :param organization: organization name of the subjects (the configured one by default)
+        :type organization: str, optional
+        :param cohort_filter: code filter of the subjects (the configured one by default)
+        :type cohort_filter: str, optional
+        :return: fetched subjects
+        :rtype: QuerySet
+        """
+        organization = organization or NormativeSketch.CONFIGURATION.get('organization')
+        cohort_filter = cohort_filter or NormativeSketch.CONFIGURATION.get('cohort_filter', 'HC')
+
+        # Get the subjects
+        subjects = Subject.objects.filter(code__contains=cohort_filter)
+        return subjects.filter(organization__name=organization) if organization else subjects
+
+    @staticmethod
+    def is_in_cohort(subject, organization=None, cohort_filter=None):
+        """
+        Checks if the subject is in the normative cohort (without a query unless the organization is configured).
+
+        :param subject: subject
+        :type subject: Subject instance
+        :param organization: organization name of the subjects (the configured one by default)
+        :type organization: str, optional
+        :param cohort_filter: code filter of the subjects (the configured one by default)
+        :type cohort_filter: str, optional
+        :return: True if the subject is in the cohort
+        :rtype: bool
+        """
+        organization = organization or NormativeSketch.CONFIGURATION.get('organization')
+        cohort_filter = cohort_filter or NormativeSketch.CONFIGURATION.get('cohort_filter', 'HC')
+
+        # Check the code and the organization of the subject
+        if cohort_filter not in (subject.code or ''):
+            return False
+        return not organization or (subject.organization_id is not None and subject.organization.name == organization)
+
+    @staticmethod
+    def get_modality(model):
+        """Returns the modality of the examination session data model"""
+        return {value: key for key, value in DATA_TO_MODEL_CLASS_MAPPING.items()}.get(model)
+
+    @staticmethod
+    def get_numerical_features(model, record):
+        """
+        Returns the numerical features of the examination session data (finite values only).
+
+        :param model: examination session data model
+        :type model: child class of CommonExaminationSessionData
+        :param record: examination session data
+        :type record: Record
+        :return: numerical features ({feature label: value})
+        :rtype: dict
+        """
+        features = {}
+
+        for feature in FeaturesFormatter(model).prepare_computable(record=record):
+            label = feature[FeaturesFormatter.FEATURE_LABEL_FIELD]
+            value = feature[FeaturesFormatter.FEATURE_VALUE_FIELD]
+            if not model.CONFIGURATION.is_feature_numerical(label) or isinstance(value, bool):
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if math.isfinite(value):
+                features[label] = value
+
+        # Return the features
+        return features
+
+    @staticmethod
+    def update_subjects(updates, organization=None, cohort_filter=None, background=False):
+        """
+        Updates the sketches of the subjects and publishes the new normative data if any sketch changed.
+
+        :param updates: modalities to be updated per subject ({subject ID: modalities (None for all)})
+        :type updates: dict
+        :param organization: organization name of the cohort (the configured one by default)
+        :type organization: str, optional
+        :param cohort_filter: code filter of the cohort (the configured one by default)
+        :type cohort_filter: str, optional
+        :param background: background flag (True to publish the normative data off the request path)
+        :type background: bool, optional
+        :return: published normative data (None if no sketch changed or if published in the background)
+        :rtype: Record
+        """
+        if not updates:
+            return None
+
+        # Update the sketches of the subjects and the merged sketches of the cohort
+        with transaction.atomic():
+            changed = NormativeSketch.update_sketches(updates, organization, cohort_filter)
+
+        # Publish the new normative data
+        if not changed:
+            return None
+        if background:
+            transaction.on_commit(NormativeSketch.schedule_publish)
+            return None
+        return NormativeData.publish(*NormativeSketch.compute_norms())
+
+    @staticmethod
+    def update_sketches(updates, organization=None, cohort_filter=None):
+        """
+        Updates the sketches of the subjects and applies the changes to the merged sketches of the cohort.
+
+        The new sketches are merged into the merged sketches of their strata, while the strata with the
+        replaced or removed sketches are merged again from the sketches of their subjects.
+
+        :param updates: modalities to be updated per subject ({subject ID: modalities (None for all)})
+        :type updates: dict
+        :param organization: organization name of the cohort (the configured one by default)
+        :type organization: str, optional
+        :param cohort_filter: code filter of the cohort (the configured one by default)
+        :type cohort_filter: str, optional
+        :return: True if any sketch changed
+        :rtype: bool
+        """
+
+        # Get the subjects of the normative cohort (the sketches of the other subjects are removed)
+        subject_ids = set(updates.keys())
+        cohort_ids = NormativeSketch.get_cohort(organization, cohort_filter).filter(pk__in=subject_ids)
+        cohort_ids = set(cohort_ids.values_list('pk', flat=True))
+
+        # Prepare the changed sketches (new ones per stratum, strata to be merged again)
+        created, updated, deleted_ids, added, remerged = [], [], [], {}, set()
+
+        # Remove the sketches of the subjects that are not in the cohort
+        others = subject_ids - cohort_ids
+        rebuilt = False
+        if others:
+            removed = NormativeSketch.objects.filter(subject_id__in=others)
+            remerged.update(removed.values_list('modality', 'stratum').distinct())
+            removed.delete()
+
+            # The sketches of the deleted subjects were removed with them (their strata are unknown)
+            rebuilt = Subject.objects.filter(pk__in=others).count() < len(others)
+
+        # Get the stored sketches
+        compression = NormativeSketch.CONFIGURATION.get('compression')
+        stored = {
+            (sketch.subject_id, sketch.modality, sketch.stratum): sketch
+            for sketch in NormativeSketch.objects.filter(subject_id__in=cohort_ids)
+        }
+
+        for modality, model in DATA_TO_MODEL_CLASS_MAPPING.items():
+
+            # Get the subjects to be updated for the modality
+            ids = [pk for pk in cohort_ids if updates[pk] is None or modality in updates[pk]]
+            if not ids:
+                continue
+
+            # Collect the values of the numerical features (all the sessions of the subjects, per stratum)
+            values = {}
+            for record in model.objects.filter(examination_session__subject_id__in=ids) \
+                    .select_related('examination_session__subject'):
+                session = record.examination_session
+                stratum_values = values.setdefault((session.subject_id, NormativeSketch.get_stratum(session)), {})
+                for label, value in NormativeSketch.get_numerical_features(model, record).items():
+                    stratum_values.setdefault(label, []).append(value)
+
+            # Compute the sketches (only the changed ones are written)
+            keys = {(pk, stratum) for pk, m, stratum in stored.keys() if pk in ids and m == modality}
+            for pk, stratum in keys | set(values.keys()):
+                sketches = {
+                    label: TDigest(compression).update(feature_values).to_dict()
+                    for label, feature_values in sorted(values.get((pk, stratum), {}).items())
+                }
+                sketch = stored.get((pk, modality, stratum))
+
+                if not sketches:
+                    if sketch:
+                        deleted_ids.append(sketch.pk)
+                        remerged.add((modality, stratum))
+                elif not sketch:
+                    created.append(NormativeSketch(
+                        subject_id=pk, modality=modality, stratum=stratum, sketches=sketches))
+                    added.setdefault((modality, stratum), []).append(sketches)
+                elif sketch.sketches != sketches:
+                    sketch.sketches, sketch.updated_on = sketches, timezone.now()
+                    updated.append(sketch)
+                    remerged.add((modality, stratum))
+
+        # Write the changed sketches
+        NormativeSketch.objects.filter(pk__in=deleted_ids).delete()
+        NormativeSketch.objects.bulk_create(created, batch_size=NormativeSketch.BULK_BATCH_SIZE)
+        NormativeSketch.objects.bulk_update(
+            updated, ['sketches', 'updated_on'], batch_size=NormativeSketch.BULK_BATCH_SIZE)
+
+        # Apply the changes to the merged sketches of the cohort
+        if rebuilt:
+            NormativeCohortSketch.rebuild()
+        else:
+            NormativeCohortSketch.apply(added, remerged)
+
+        # Return the changed flag
+        return rebuilt or bool(added or remerged)
+
+    @staticmethod
+    def rebuild(organization=None, cohort_filter=None):
+        """
+        Rebuilds the sketches of all the subjects of the normative cohort and publishes the normative data.
+
+        :param organization: organization name of the subjects (the configured one by default)
+        :type organization: str, optional
+        :param cohort_filter: code filter of the subjects (the configured one by default)
+        :type cohort_filter: str, optional
+        :return: published normative data
+        :rtype: Record
+        """
+        with transaction.atomic():
+
+            # Remove the sketches of the subjects that are not in the cohort
+            cohort_ids = list(NormativeSketch.get_cohort(organization, cohort_filter).values_list('pk', flat=True))
+            NormativeSketch.objects.exclude(subject_id__in=cohort_ids).delete()
+
+            # Update the sketches of the cohort and merge them again (publish the normative data in any case)
+            NormativeSketch.update_sketches({pk: None for pk in cohort_ids}, organization, cohort_filter)
+            NormativeCohortSketch.rebuild()
+            return NormativeData.publish(*NormativeSketch.compute_norms())
+
+    @staticmethod
+    def replace_all(sketches, norms=None, strata=None):
+        """
+        Replaces all the sketches (e.g. computed in parallel for the whole cohort) and publishes the normative
+        data.
+
+        :param sketches: sketches ({(subject ID, modality, stratum): {feature label: sketch}})
+        :type sketches: dict
+        :param norms: normative data (computed from the sketches if not provided)
+        :type norms: dict, optional
+        :param strata: normative data of the strata (computed from the sketches if the norms are not provided)
+        :type strata: dict, optional
+        :return: published normative data
+        :rtype: Record
+        """
+        sketches = {key: subject_sketches for key, subject_sketches in sketches.items() if subject_sketches}
+
+        with transaction.atomic():
+
+            # Replace the sketches
+            NormativeSketch.objects.all().delete()
+            NormativeSketch.objects.bulk_create([
+                NormativeSketch(subject_id=subject_id, modality=modality, stratum=stratum, sketches=subject_sketches)
+                for (subject_id, modality, stratum), subject_sketches in sketches.items()
+            ], batch_size=NormativeSketch.BULK_BATCH_SIZE)
+
+            # Replace the merged sketches of the cohort
+            NormativeCohortSketch.rebuild(
+                (modality, stratum, subject_sketches)
+                for (_, modality, stratum), subject_sketches in sketches.items())
+
+            # Publish the normative data
+            if norms is None:
+                norms, strata = NormativeSketch.compute_norms()
+            return NormativeData.publish(norms, strata)
+
+    @staticmethod
+    def schedule_update(subject_id, modalities=None):
+        """
+        Schedules the update of the sketches of the subject (run after the commit of the transaction).
+
+        The callback is registered for every call (the callbacks of a rolled back transaction are discarded),
+        and the first callback run after the commit pops all the pending updates (the others find none).
+
+        :param subject_id: subject ID
+        :type subject_id: int
+        :param modalities: modalities to be updated (None for all)
+        :type modalities: iterable of str, optional
+        :return: None
+        :rtype: None type
+        """
+        pending_normative_updates.add(subject_id, modalities)
+        transaction.on_commit(NormativeSketch.run_pending_updates)
+
+    @staticmethod
+    def run_pending_updates():
+        """Runs the pending (scheduled) updates of the sketches (the normative data is published in the background)"""
+        NormativeSketch.update_subjects(pending_normative_updates.pop(), background=True)
+
+    @staticmethod
+    def schedule_publish():
+        """Schedules the publication of the normative data in the background (once while a publication is queued)"""
+        with NormativeSketch.publish_lock:
+            if NormativeSketch.publish_queued:
+                return
+            NormativeSketch.publish_queued = True
+        NormativeSketch.publish_executor.submit(NormativeSketch.publish_norms)
+
+    @staticmethod
+    def publish_norms():
+        """Publishes the normative data computed from the sketches (run in the background)"""
+        with NormativeSketch.publish_lock:
+            NormativeSketch.publish_queued = False
+        try:
+            NormativeData.publish(*NormativeSketch.compute_norms())
+        except Exception as e:
+            logger.exception(f'Publication of the normative data failed: {type(e).__name__}: {e}')
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def compute_norms():
+        """
+        Computes the normative data (medians and IQRs of the features) from the merged sketches of the cohort.
+
+        :return: normative data ({modality: {feature label: {'median', 'iqr', 'count'}}}) and normative data
+                 of the strata ({modality: {stratum: {feature label: {'median', 'iqr', 'count'}}}})
+        :rtype: tuple (dict, dict)
+        """
+
+        compression = NormativeSketch.CONFIGURATION.get('compression')
+
+        # Collect the merged sketches of the features (per modality, feature and stratum)
+        sketches = {modality: {} for modality in DATA_TO_MODEL_CLASS_MAPPING.keys()}
+        for modality, stratum, cohort_sketches in \
+                NormativeCohortSketch.objects.values_list('modality', 'stratum', 'sketches'):
+            for label, sketch in cohort_sketches.items():
+                sketches.setdefault(modality, {}).setdefault(label, {})[stratum] = \
+                    TDigest.from_dict(sketch, compression)
+
+        # Prepare the normative data
+        norms, strata = {}, {}
+
+        # Compute the normative data (per stratum and globally, merging the sketches of the strata)
+        for modality, features in sketches.items():
+            norms[modality], strata[modality] = {}, {}
+
+            for label, merged in sorted(features.items()):
+                norm = NormativeSketch.get_norm(TDigest.merge_all(merged.values(), compression))
+                if not norm:
+                    continue
+                norms[modality][label] = norm
+
+                for stratum, sketch in merged.items():
+                    if stratum is not None and sketch.count:
+                        strata[modality].setdefault(str(stratum), {})[label] = NormativeSketch.get_norm(sketch)
+
+        # Return the normative data
+        return norms, strata
+
+    @staticmethod
+    def get_norm(sketch):
+        """Returns the normative data of the feature from the merged sketch (None if the sketch is empty)"""
+        if not sketch.count:
+            return None
+        return {
+            'median': round(sketch.quantile(0.5), 6),
+            'iqr': round(sketch.quantile(0.75) - sketch.quantile(0.25), 6),
+            'count': int(sketch.count)
+        }
+
+
+class NormativeCohortSketch(models.Model):
+    """
+    Class implementing normative cohort sketch model (sketches of the subjects of the normative cohort merged
+    per modality and stratum).
+
+    The new sketches of the subjects are merged into the merged sketches, while the strata with the replaced or
+    removed sketches are merged again from the sketches of their subjects (the sketches cannot be subtracted),
+    so the normative data are published without merging the sketches of the whole cohort.
+    """
+
+    class Meta:
+        """Model meta information definition"""
+
+        # Unique constraints (the sketches without a stratum are constrained separately, as NULLs are distinct)
+        unique_together = ('modality', 'stratum')
+        constraints = [
+            UniqueConstraint(
+                fields=['modality'],
+                condition=Q(stratum__isnull=True),
+                name='unique_normative_cohort_sketch_without_stratum')
+        ]
+
+    # Define the model schema
+    modality = models.CharField('modality', max_length=20)
+    stratum = models.SmallIntegerField('stratum', null=True, blank=True)
+    sketches = models.JSONField('sketches', default=dict, blank=True)
+    updated_on = models.DateTimeField('updated on', auto_now=True)
+
+    def __str__(self):
+        return f'Normative cohort sketch ({self.modality}, stratum: {self.stratum})'
+
+    @staticmethod
+    def merge(sketches):
+        """
+        Merges the sketches of the features.
+
+        :param sketches: sketches to be merged ([{feature label: sketch}])
+        :type sketches: iterable
+        :return: merged sketches ({feature label: sketch})
+        :rtype: dict
+        """
+        compression = NormativeSketch.CONFIGURATION.get('compression')
+
+        # Collect the sketches per feature
+        features = {}
+        for feature_sketches in sketches:
+            for label, sketch in feature_sketches.items():
+                features.setdefault(label, []).append(TDigest.from_dict(sketch, compression))
+
+        # Merge the sketches
+        return {
+            label: TDigest.merge_all(feature_sketches, compression).to_dict()
+            for label, feature_sketches in sorted(features.items())
+        }
+
+    @staticmethod
+    def apply(added, remerged):
+        """
+        Applies the changes of the sketches of the subjects to the merged sketches (in a transaction).
+
+        :param added: new sketches of the subjects ({(modality, stratum): [{feature label: sketch}]})
+        :type added: dict
+        :param remerged: strata to be merged again from the sketches of their subjects ({(modality, stratum)})
+        :type remerged: set
+        :return: None
+        :rtype: None type
+        """
+
+        # Lock the merged sketches in a stable order (concurrent updates)
+        for modality, stratum in sorted(set(added) | set(remerged), key=lambda k: (k[0], -1 if k[1] is None else k[1])):
+            cohort_sketch, _ = NormativeCohortSketch.objects \
+                .select_for_update() \
+                .get_or_create(modality=modality, stratum=stratum)
+
+            # Merge the sketches (again from the subjects, or the new ones into the merged ones)
+            if (modality, stratum) in remerged:
+                sketches = NormativeCohortSketch.merge(NormativeSketch.objects
+                                                       .filter(modality=modality, stratum=stratum)
+                                                       .values_list('sketches', flat=True)
+                                                       .iterator())
+            else:
+                sketches = NormativeCohortSketch.merge([cohort_sketch.sketches] + added[(modality, stratum)])
+
+            # Write the merged sketches
+            if sketches:
+                cohort_sketch.sketches = sketches
+                cohort_sketch.save()
+            else:
+                cohort_sketch.delete()
+
+    @staticmethod
+    def rebuild(sketches=None):
+        """
+        Rebuilds all the merged sketches.
+
+        :param sketches: sketches of the subjects ([(modality, stratum, {feature label: sketch})], the stored
+                         ones by default)
+        :type sketches: iterable, optional
+        :return: None
+        :rtype: None type
+        """
+        if sketches is None:
+            sketches = NormativeSketch.objects.values_list('modality', 'stratum', 'sketches').iterator()
+
+        # Collect the sketches of the subjects per stratum
+        strata = {}
+        for modality, stratum, subject_sketches in sketches:
+            strata.setdefault((modality, stratum), []).append(subject_sketches)
+
+        # Replace the merged sketches
+        NormativeCohortSketch.objects.all().delete()
+        NormativeCohortSketch.objects.bulk_create([
+            NormativeCohortSketch(modality=modality, stratum=stratum, sketches=NormativeCohortSketch.merge(group))
+            for (modality, stratum), group in strata.items()
+        ], batch_size=NormativeSketch.BULK_BATCH_SIZE)
+
+
+class NormativeData(models.Model):
+    """
+    Class implementing normative data model (published versions of the normative data).
+
+    The primary key is the version of the normative data. The current version is announced via the
+    cache, so the running workers pick up the new normative data without a restart. The normative data
+    of the current version are compiled into the lookup tables (per modality, indexed by stratum and
+    feature), so the normative data of a stratum are looked up in constant time.
+    """
+
+    class Meta:
+        """Model meta information definition"""
+
+        # Default ordering of the records
+        ordering = ['-id']
+
+    # Define the cached data object
+    CACHED_DATA = NormativeDataCache
+
+    # Define the model schema
+    norms = models.JSONField('norms', default=dict)
+    strata = models.JSONField('strata', default=dict, blank=True)
+    created_on = models.DateTimeField('created on', auto_now_add=True)
+
+    def __str__(self):
+        return f'Normative data (version: {self.pk})'
+
+    @staticmethod
+    def publish(norms, strata=None):
+        """
+        Publishes the new version of the normative data (the old versions are pruned).
+
+        :param norms: normative data ({modality: {feature label: {'median', 'iqr', 'count'}}})
+        :type norms: dict
+        :param strata: normative data of the strata ({modality: {stratum: {feature label: {...}}}})
+        :type strata: dict, optional
+        :return: published normative data
+        :rtype: Record
+        """
+
+        # Store the new version
+        data = NormativeData.objects.create(norms=norms, strata=strata or {})
+
+        # Prune the old versions
+        versions_kept = NormativeSketch.CONFIGURATION.get('versions_kept', 10)
+        kept = NormativeData.objects.values_list('pk', flat=True)[:versions_kept]
+        NormativeData.objects.exclude(pk__in=list(kept)).delete()
+
+        # Announce the new version (after the commit)
+        transaction.on_commit(lambda: NormativeData.CACHED_DATA.set_cached_version(data.pk))
+
+        # Return the published normative data
+        return data
+
+    @staticmethod
+    def get_tables():
+        """
+        Returns the lookup tables of the current normative data (the latest published version, or the
+        configured normative data for the modalities with no published normative data).
+
+        :return: lookup tables ({modality: NormativeTable})
+        :rtype: dict
+        """
+
+        # Get the tables checked recently
+        tables = NormativeData.CACHED_DATA.get_local_tables()
+        if tables is not None:
+            return tables
+
+        # Get the current version
+        version = NormativeData.CACHED_DATA.get_cached_version()
+        if version is None:
+            version = NormativeData.objects.values_list('pk', flat=True).first() or 0
+            NormativeData.CACHED_DATA.set_cached_version(version)
+
+        # Get the tables of the current version (build them if the version changed)
+        tables = NormativeData.CACHED_DATA.get_local_tables(version)
+        if tables is None:
+            data = NormativeData.objects.filter(pk=version).first() if version else None
+            tables = NormativeData.build_tables(data)
+            NormativeData.CACHED_DATA.set_local_tables(version, tables)
+
+        # Return the tables
+        return tables
+
+    @staticmethod
+    def build_tables(data=None):
+        """
+        Builds the lookup tables of the normative data.
+
+        :param data: published normative data (None to build the tables of the configured normative data)
+        :type data: Record, optional
+        :return: lookup tables ({modality: NormativeTable})
+        :rtype: dict
+        """
+        strata, tables = NormativeSketch.STRATA, {}
+
+        # Build the tables of the configured normative data (global only)
+        for modality, norms in getattr(settings, 'NORM_CONFIGURATION').items():
+            tables[modality] = NormativeTable.from_norms(norms, rename=partial(rename_features, modality=modality))
+
+        # Build the tables of the published normative data
+        for modality, norms in (data.norms if data else {}).items():
+            if norms:
+                tables[modality] = NormativeTable.from_norms(
+                    norms,
+                    data.strata.get(modality),
+                    strata.size,
+                    strata.min_count,
+                    rename=partial(rename_features, modality=modality))
+
+        # Return the tables
+        return tables
+
+    @staticmethod
+    def get_table(modality):
+        """
+        Returns the lookup table of the current normative data of the modality.
+
+        :param modality: modality label
+        :type modality: str
+        :return: lookup table (None if there are no normative data of the modality)
+        :rtype: NormativeTable
+        """
+        return NormativeData.get_tables().get(modality)
+
+    @staticmethod
+    def get_stratum(session):
+        """
+        Returns the stratum of the examination session (None if the sex or the age of the subject is unknown).
+
+        :param session: examination session
+        :type session: ExaminationSession instance
+        :return: stratum
+        :rtype: int
+        """
+        return NormativeSketch.get_stratum(session) if session else None
+
+    @staticmethod
+    def get_norms(modality, stratum=None):
+        """
+        Returns the current normative data of the modality and stratum (the global normative data of the
+        features with too few values in the stratum).
+
+        :param modality: modality label
+        :type modality: str
+        :param stratum: stratum (None for the global normative data)
+        :type stratum: int, optional
+        :return: normative data ({feature label: {'median', 'iqr', ...}})
+        :rtype: dict
+        """
+        table = NormativeData.get_table(modality)
+        return table.get_norms(stratum) if table else {}
+
+
 class CommonExaminationSessionData(models.Model):
     """Base class for examination session data (structured and unstructured)"""
 
@@ -404,6 +1459,21 @@ class CommonExaminationSessionData(models.Model):
         # Return the features
         return response
 
+    @classmethod
+    def get_session_data(cls, examination_session):
+        """
+        Returns the data of the examination session (the selected one if available).
+
+        :param examination_session: session record
+        :type examination_session: Record
+        :return: fetched data
+        :rtype: Record
+        """
+        try:
+            return getattr(examination_session, cls._meta.model_name)
+        except ObjectDoesNotExist:
+            return None
+
     @classmethod
     def get_data(cls, pk=None, examination_session=None, subject_code=None, session_number=None):
         """
@@ -454,13 +1524,76 @@ class CommonFeatureBasedData(CommonExaminationSessionData):
         """Meta class definition"""
         abstract = True
 
+    # Define the cached features object
+    CACHED_FEATURES = FeaturesCache
+
     # Define the model schema
     data = models.FileField('data', upload_to='data/', validators=[FileExtensionValidator(['csv', 'xls', 'xlsx'])])
+    features = models.JSONField('features', null=True, blank=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Creates the instance loaded from the database (remembers the loaded data file)"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_data_name = instance.__dict__.get('data')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Saves the data (the features of a new data file are stored in the database as well)"""
+
+        # Store the features of the new (uploaded or replaced) data file in the database (or drop the stored ones)
+        if self.data and (not self.data._committed or self.data.name != getattr(self, '_loaded_data_name', None)):
+            if self.CONFIGURATION.features_storage != 'database':
+                self.features = None
+            elif not self.data._committed:
+                self.features = self.read_features_as_mapping(file=ContentFile(self.data.read(), name=self.data.name))
+                self.data.seek(0)
+            else:
+                self.features = self.read_features_as_mapping(path=self.data.path)
+
+        # Save the data
+        super().save(*args, **kwargs)
+        self._loaded_data_name = self.data.name
+
+    @classmethod
+    def read_features_as_mapping(cls, file=None, path=None):
+        """Returns the features from the input file or file path as a dict (to be stored in the database)"""
+        return {
+            feature[FeaturesFormatter.FEATURE_LABEL_FIELD]:
+                FeaturesFormatter.sanitize_feature_value(feature[FeaturesFormatter.FEATURE_VALUE_FIELD])
+            for feature in cls.read_features_from_file(file=file, path=path)
+        }
 
     @classmethod
     def get_features_from_record(cls, record, **kwargs):
         """Returns the features from the input record"""
-        return cls.read_features_from_file(path=record.data.path) if record else []
+
+        # Handle no record situation
+        if not record:
+            return []
+
+        # Get the features stored in the database (sorted by the feature names, as if read from the file)
+        if record.features is not None:
+            supported_features = cls.CONFIGURATION.get_available_feature_names()
+            return [
+                {FeaturesFormatter.FEATURE_LABEL_FIELD: label, FeaturesFormatter.FEATURE_VALUE_FIELD: value}
+                for label, value in sorted(record.features.items())
+                if label in supported_features
+            ]
+
+        # Handle no data file situation
+        if not record.data:
+            return []
+
+        # Try to get the cached parsed features (if not in the cache, read them and cache them)
+        cache_instance = cls.CACHED_FEATURES(cls, record.data.path)
+        features = cache_instance.get_cached_features()
+        if features is None:
+            features = cls.read_features_from_file(path=record.data.path)
+            cache_instance.set_cached_features(features)
+
+        # Return the features (copied, so that the callers cannot alter the cached ones)
+        return [dict(feature) for feature in features]
 
 
 class DataAcoustic(CommonFeatureBasedData):
@@ -561,8 +1694,29 @@ post_save.connect(invalidate_cached_lbd_prediction_for_session, sender=DataHandw
 post_save.connect(invalidate_cached_lbd_prediction_for_session, sender=DataPsychology)
 post_save.connect(invalidate_cached_lbd_prediction_for_session, sender=DataTCS)
 post_save.connect(invalidate_cached_lbd_prediction_for_session, sender=DataCEI)
+post_save.connect(invalidate_cached_features_for_data, sender=DataAcoustic)
+post_save.connect(invalidate_cached_features_for_data, sender=DataActigraphy)
+post_save.connect(invalidate_cached_features_for_data, sender=DataHandwriting)
+post_save.connect(invalidate_cached_features_for_data, sender=DataPsychology)
+post_save.connect(invalidate_cached_features_for_data, sender=DataTCS)
+post_save.connect(invalidate_cached_features_for_data, sender=DataCEI)
 post_save.connect(invalidate_cached_lbd_prediction_for_subject, sender=Subject)
 post_save.connect(update_last_examined_on_for_subject, sender=ExaminationSession)
+post_save.connect(update_normative_data_for_session_data, sender=DataAcoustic)
+post_save.connect(update_normative_data_for_session_data, sender=DataActigraphy)
+post_save.connect(update_normative_data_for_session_data, sender=DataHandwriting)
+post_save.connect(update_normative_data_for_session_data, sender=DataPsychology)
+post_save.connect(update_normative_data_for_session_data, sender=DataTCS)
+post_save.connect(update_normative_data_for_session_data, sender=DataCEI)
+post_delete.connect(update_normative_data_for_session_data, sender=DataAcoustic)
+post_delete.connect(update_normative_data_for_session_data, sender=DataActigraphy)
+post_delete.connect(update_normative_data_for_session_data, sender=DataHandwriting)
+post_delete.connect(update_normative_data_for_session_data, sender=DataPsychology)
+post_delete.connect(update_normative_data_for_session_data, sender=DataTCS)
+post_delete.connect(update_normative_data_for_session_data, sender=DataCEI)
+post_save.connect(update_normative_data_for_subject, sender=Subject)
+post_delete.connect(update_normative_data_for_subject, sender=Subject)
+post_save.connect(update_normative_data_for_session, sender=ExaminationSession)
 
 
 # Define the data to the model class mapping
@@ -1,10 +1,21 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from django.conf import settings
 from django.core.cache import cache
+from django.utils import timezone
 from django.core.cache.backends.base import DEFAULT_TIMEOUT
 
 
 class BaseCachedModel(object):
-    """Base class for the cached models"""
+    """
+    Base class for the cached models.
+
+    The LBD probability is cached in two tiers: the Django cache (first tier, with TTL) and the
+    database (second tier, persistent until marked as stale by the invalidation signals).
+    """
 
     # Define the LBD probability cache prefix
     CACHE_LBD_PROBABILITY_PREFIX = 'lbd_probability'
@@ -12,31 +23,448 @@ class BaseCachedModel(object):
     # Get the time-to-live (TTL) for the cache
     CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
 
+    # Get the predictor model identifier (the stored predictions of other models are not used)
+    PREDICTOR_MODEL = getattr(settings, 'PREDICTOR_CONFIGURATION')['model_identifier']
+
+    # Get the stale-while-revalidate mode (serve the last known LBD probability while it is recomputed)
+    STALE_WHILE_REVALIDATE = getattr(settings, 'PREDICTOR_CONFIGURATION').get('stale_while_revalidate', False)
+
+    # Define the time-to-live (TTL) of the revalidation lock (single revalidation in flight per instance)
+    CACHE_REVALIDATION_TTL = 60
+
+    # Define the sentinel of the missing LBD probability (distinguished from the cached 0.0 and None)
+    MISSING = object()
+
+    # Define the cached negative result (no data to predict the LBD probability from) and its short TTL
+    CACHE_NO_DATA = 'no_data'
+    CACHE_NO_DATA_TTL = getattr(settings, 'PREDICTOR_CONFIGURATION').get('no_data_cache_ttl', 60)
+
     def __init__(self, instance):
         self.instance = instance
 
-    def get_lbd_probability_cache_key(self):
-        """Gets the LBD probability cache key"""
+    @classmethod
+    def get_version(cls):
+        """Gets the version of the cached predictions of the predictor model (bumped by the invalidation)"""
+        return PredictionCache(cls.PREDICTOR_MODEL).get_version()
+
+    def get_lbd_probability_cache_key(self, version=None):
+        """Gets the LBD probability cache key (versioned by the cached predictions of the predictor model)"""
         return None
 
     def get_cached_lbd_probability(self):
-        """Gets the cached LBD probability"""
-        return cache.get(self.get_lbd_probability_cache_key())
+        """Gets the cached LBD probability (MISSING if not cached, None if cached as no data)"""
+        return self.get_many_cached_lbd_probabilities([self.instance])[0]
+
+    def set_cached_lbd_probability(self, lbd_probability, features_hash=None):
+        """Sets the cached LBD probability (and stores it; None is cached as no data)"""
+        self.set_many_cached_lbd_probabilities([self.instance], [lbd_probability], [features_hash])
+
+    @classmethod
+    def get_many_cached_lbd_probabilities(cls, instances):
+        """
+        Gets the cached LBD probabilities of multiple instances (single cache round trip; falls back to
+        the stored LBD probabilities).
+
+        :param instances: model instances
+        :type instances: iterable of objects
+        :return: cached LBD probabilities (MISSING if not cached, None if cached as no data)
+        :rtype: list
+        """
+
+        # Try to get the LBD probabilities from the cache
+        version = cls.get_version()
+        cache_instances = [cls(instance) for instance in instances]
+        keys = [cache_instance.get_lbd_probability_cache_key(version) for cache_instance in cache_instances]
+        cached = cache.get_many(keys)
+
+        # Prepare the LBD probabilities
+        probabilities = [cached.get(key, cls.MISSING) for key in keys]
+        probabilities = [None if p == cls.CACHE_NO_DATA else p for p in probabilities]
+
+        # Try to get the missing LBD probabilities from the database (and put them back into the cache)
+        stored = {}
+        for i, (key, cache_instance) in enumerate(zip(keys, cache_instances)):
+            if probabilities[i] is cls.MISSING:
+                lbd_probability = cache_instance.get_stored_lbd_probability()
+                if lbd_probability is not None:
+                    probabilities[i] = stored[key] = lbd_probability
+        if stored:
+            cache.set_many(stored, timeout=cls.CACHE_TTL)
 
-    def set_cached_lbd_probability(self, lbd_probability):
-        """Sets the cached LBD probability"""
-        cache.set(self.get_lbd_probability_cache_key(), lbd_probability, timeout=self.CACHE_TTL)
+        # Return the cached LBD probabilities
+        return probabilities
+
+    @classmethod
+    def set_many_cached_lbd_probabilities(cls, instances, probabilities, features_hashes=None):
+        """
+        Sets the cached LBD probabilities of multiple instances (single cache round trip) and stores them.
+        The None LBD probabilities are cached as no data (with the short TTL) and they clear the stored ones
+        (so that the last known LBD probability is no longer served as stale).
+
+        :param instances: model instances
+        :type instances: iterable of objects
+        :param probabilities: LBD probabilities (None for no data)
+        :type probabilities: iterable of float
+        :param features_hashes: hashes of the features the LBD probabilities were predicted from
+        :type features_hashes: iterable of str, optional
+        """
+
+        # Prepare the cache instances
+        version = cls.get_version()
+        cache_instances = [cls(instance) for instance in instances]
+        probabilities = list(probabilities)
+        features_hashes = list(features_hashes or [None] * len(cache_instances))
+
+        # Cache the LBD probabilities and the negative results
+        cache.set_many({
+            cache_instance.get_lbd_probability_cache_key(version): lbd_probability
+            for cache_instance, lbd_probability in zip(cache_instances, probabilities)
+            if lbd_probability is not None
+        }, timeout=cls.CACHE_TTL)
+        cache.set_many({
+            cache_instance.get_lbd_probability_cache_key(version): cls.CACHE_NO_DATA
+            for cache_instance, lbd_probability in zip(cache_instances, probabilities)
+            if lbd_probability is None
+        }, timeout=cls.CACHE_NO_DATA_TTL)
+
+        # Store the LBD probabilities (or clear them if there is no data)
+        for cache_instance, lbd_probability, features_hash in zip(cache_instances, probabilities, features_hashes):
+            if lbd_probability is not None:
+                cache_instance.set_stored_lbd_probability(lbd_probability, features_hash=features_hash)
+            else:
+                cache_instance.clear_stored_lbd_probability()
+
+    def get_stored_lbd_probability(self):
+        """Gets the stored LBD probability"""
+        return None
+
+    def set_stored_lbd_probability(self, lbd_probability, features_hash=None):
+        """Sets the stored LBD probability"""
+        return None
+
+    def clear_stored_lbd_probability(self):
+        """Clears the stored LBD probability (no data to predict the LBD probability from)"""
+        return None
+
+    def get_stale_lbd_probability(self):
+        """Gets the last known LBD probability (even if stale or predicted by other model)"""
+        return None
+
+    def claim_revalidation(self):
+        """Claims the revalidation of the LBD probability (False if there is a revalidation in flight already)"""
+        return cache.add(f'{self.get_lbd_probability_cache_key()}_revalidation', True, self.CACHE_REVALIDATION_TTL)
+
+    def release_revalidation(self):
+        """Releases the revalidation of the LBD probability"""
+        cache.delete(f'{self.get_lbd_probability_cache_key()}_revalidation')
+
+    def _update_instance(self, **fields):
+        """Updates the instance fields in the database (without sending the model signals)"""
+        type(self.instance).objects.filter(pk=self.instance.pk).update(**fields)
+        for field, value in fields.items():
+            setattr(self.instance, field, value)
 
 
 class SubjectCache(BaseCachedModel):
     """Class implementing cached subject data"""
 
-    def get_lbd_probability_cache_key(self):
-        return f'{self.CACHE_LBD_PROBABILITY_PREFIX}_subject_{self.instance.code}'
+    def get_lbd_probability_cache_key(self, version=None):
+        version = version or self.get_version()
+        return f'{self.CACHE_LBD_PROBABILITY_PREFIX}_{self.PREDICTOR_MODEL}_v{version}_subject_{self.instance.code}'
+
+    def set_stored_lbd_probability(self, lbd_probability, features_hash=None):
+        if self.instance.lbd_probability != lbd_probability:
+            self._update_instance(lbd_probability=lbd_probability)
+
+    def clear_stored_lbd_probability(self):
+        if self.instance.lbd_probability is not None:
+            self._update_instance(lbd_probability=None)
 
 
 class ExaminationSessionCache(BaseCachedModel):
     """Class implementing cached examination session data"""
 
-    def get_lbd_probability_cache_key(self):
-        return f'{self.CACHE_LBD_PROBABILITY_PREFIX}_subject_{self.instance.subject.code}_session_{self.instance.id}'
+    def get_lbd_probability_cache_key(self, version=None):
+        version = version or self.get_version()
+        return f'{self.CACHE_LBD_PROBABILITY_PREFIX}_{self.PREDICTOR_MODEL}_v{version}' \
+               f'_subject_{self.instance.subject.code}_session_{self.instance.id}'
+
+    def get_stored_lbd_probability(self):
+        if self.instance.lbd_probability_stale or self.instance.lbd_probability_model != self.PREDICTOR_MODEL:
+            return None
+        return self.instance.lbd_probability
+
+    def get_stale_lbd_probability(self):
+        return self.instance.lbd_probability
+
+    def set_stored_lbd_probability(self, lbd_probability, features_hash=None):
+        self._update_instance(
+            lbd_probability=lbd_probability,
+            lbd_probability_model=self.PREDICTOR_MODEL,
+            lbd_probability_hash=features_hash,
+            lbd_probability_computed_on=timezone.now(),
+            lbd_probability_stale=False)
+
+    def clear_stored_lbd_probability(self):
+        if self.instance.lbd_probability is not None or self.instance.lbd_probability_stale:
+            self._update_instance(
+                lbd_probability=None,
+                lbd_probability_model=self.PREDICTOR_MODEL,
+                lbd_probability_hash=None,
+                lbd_probability_computed_on=timezone.now(),
+                lbd_probability_stale=False)
+
+
+class PredictionCache(object):
+    """
+    Class implementing cached predictions keyed by the model identifier and the features hash.
+
+    The identical feature vectors share the prediction (regardless of the subject/session). The cache
+    keys are versioned per model identifier, so all the cached predictions of a model are invalidated
+    at once (e.g. on a model rollout) by bumping the version, with no need to flush the cache. The same
+    version is part of the cached LBD probabilities of the subjects and the examination sessions.
+    """
+
+    # Define the prediction cache prefix
+    CACHE_PREDICTION_PREFIX = 'prediction'
+
+    # Get the time-to-live (TTL) for the cache
+    CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
+
+    def __init__(self, model):
+        self.model = model
+
+    def get_version_cache_key(self):
+        """Gets the version cache key"""
+        return f'{self.CACHE_PREDICTION_PREFIX}_{self.model}_version'
+
+    def get_version(self):
+        """Gets the version of the cached predictions (the version is kept with no expiration)"""
+        return cache.get_or_set(self.get_version_cache_key(), 1, timeout=None)
+
+    def get_prediction_cache_key(self, features_hash, version=None):
+        """Gets the prediction cache key"""
+        version = version or self.get_version()
+        return f'{self.CACHE_PREDICTION_PREFIX}_{self.model}_v{version}_{features_hash}'
+
+    def get_cached_predictions(self, features_hashes):
+        """
+        Gets the cached predictions (single cache round trip).
+
+        :param features_hashes: hashes of the features
+        :type features_hashes: list of str
+        :return: cached predictions (None if not cached)
+        :rtype: list
+        """
+        version = self.get_version()
+        keys = [self.get_prediction_cache_key(features_hash, version) for features_hash in features_hashes]
+        cached = cache.get_many(keys)
+        return [cached.get(key) for key in keys]
+
+    def set_cached_predictions(self, features_hashes, predictions):
+        """
+        Sets the cached predictions (the missing predictions (None) are not cached).
+
+        :param features_hashes: hashes of the features
+        :type features_hashes: list of str
+        :param predictions: predictions
+        :type predictions: list
+        """
+        version = self.get_version()
+        cache.set_many({
+            self.get_prediction_cache_key(features_hash, version): prediction
+            for features_hash, prediction in zip(features_hashes, predictions)
+            if prediction is not None
+        }, timeout=self.CACHE_TTL)
+
+    def invalidate(self):
+        """Invalidates all the cached predictions of the model (bumps the version)"""
+        self.get_version()
+        try:
+            return cache.incr(self.get_version_cache_key())
+        except ValueError:
+            return self.get_version()
+
+
+class FeaturesCache(object):
+    """
+    Class implementing cached parsed features of the feature-based data.
+
+    The parsed features are content-addressed (the key is derived from the path, the modification
+    time and the size of the data file), and they are stored in two layers: an in-process LRU layer
+    (shared by all instances within a worker process) and the Django cache (shared by the workers).
+    """
+
+    # Define the parsed features cache prefix
+    CACHE_FEATURES_PREFIX = 'features'
+
+    # Get the time-to-live (TTL) for the cache
+    CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
+
+    # Define the maximum number of entries in the in-process layer
+    LOCAL_CACHE_SIZE = 512
+
+    # Define the in-process layer (key: (path, features))
+    local_cache = OrderedDict()
+    local_cache_lock = threading.Lock()
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+
+    def get_features_cache_key(self):
+        """Gets the parsed features cache key (None if the data file is not accessible)"""
+        try:
+            stat = os.stat(self.path)
+        except (OSError, TypeError, ValueError):
+            return None
+
+        # Prepare the content address of the data file
+        address = hashlib.sha1(f'{self.path}:{stat.st_mtime_ns}:{stat.st_size}'.encode('utf-8')).hexdigest()
+
+        # Return the cache key
+        return f'{self.CACHE_FEATURES_PREFIX}_{self.model.__name__.lower()}_{address}'
+
+    def get_cached_features(self):
+        """Gets the cached parsed features (None if not cached)"""
+
+        # Get the cache key
+        key = self.get_features_cache_key()
+        if not key:
+            return None
+
+        # Try to get the features from the in-process layer
+        with self.local_cache_lock:
+            if key in self.local_cache:
+                self.local_cache.move_to_end(key)
+                return self.local_cache[key][1]
+
+        # Try to get the features from the Django cache (and promote them into the in-process layer)
+        features = cache.get(key)
+        if features is not None:
+            self._set_local(key, features)
+
+        # Return the cached features
+        return features
+
+    def set_cached_features(self, features):
+        """Sets the cached parsed features"""
+
+        # Get the cache key
+        key = self.get_features_cache_key()
+        if not key:
+            return
+
+        # Cache the features in both layers
+        self._set_local(key, features)
+        cache.set(key, features, timeout=self.CACHE_TTL)
+
+    def delete_cached_features(self):
+        """Deletes the cached parsed features of the data file (from both layers)"""
+
+        # Delete the features from the in-process layer (all versions of the data file)
+        with self.local_cache_lock:
+            for key in [k for k, (path, _) in self.local_cache.items() if path == self.path]:
+                del self.local_cache[key]
+
+        # Delete the features from the Django cache (current version of the data file)
+        key = self.get_features_cache_key()
+        if key:
+            cache.delete(key)
+
+    def _set_local(self, key, features):
+        with self.local_cache_lock:
+            self.local_cache[key] = (self.path, features)
+            self.local_cache.move_to_end(key)
+            while len(self.local_cache) > self.LOCAL_CACHE_SIZE:
+                self.local_cache.popitem(last=False)
+
+
+class ImportJobCache(object):
+    """
+    Class implementing cached progress of the import jobs.
+
+    The import runs inside a single transaction, so the progress is published via the Django cache
+    (visible to the other processes immediately) and persisted to the database once the job is done.
+    """
+
+    # Define the import job progress cache prefix
+    CACHE_PROGRESS_PREFIX = 'import_job'
+
+    # Get the time-to-live (TTL) for the cache
+    CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    def get_progress_cache_key(self):
+        return f'{self.CACHE_PROGRESS_PREFIX}_{self.instance.pk}_progress'
+
+    def get_cached_progress(self):
+        """Gets the cached progress (None if not cached)"""
+        return cache.get(self.get_progress_cache_key())
+
+    def set_cached_progress(self, progress):
+        """Sets the cached progress"""
+        cache.set(self.get_progress_cache_key(), progress, timeout=self.CACHE_TTL)
+
+    def delete_cached_progress(self):
+        """Deletes the cached progress"""
+        cache.delete(self.get_progress_cache_key())
+
+
+class NormativeDataCache(object):
+    """
+    Class implementing cached normative data (current published version of the norms).
+
+    The current version is published via the Django cache (shared by the processes), while the lookup
+    tables of the version are kept in-process and rebuilt once the published version changes (checked at
+    most every few seconds), so the running workers pick up the new norms with no restart.
+    """
+
+    # Define the normative data version cache key
+    CACHE_VERSION_KEY = 'normative_data_version'
+
+    # Define the interval (in seconds) of checking the published version
+    CHECK_INTERVAL = 5
+
+    # Define the in-process layer (current version and its lookup tables)
+    local_cache = {'version': None, 'tables': None, 'checked_on': None}
+    local_cache_lock = threading.Lock()
+
+    @classmethod
+    def get_cached_version(cls):
+        """Gets the published version (None if not cached)"""
+        return cache.get(cls.CACHE_VERSION_KEY)
+
+    @classmethod
+    def set_cached_version(cls, version):
+        """Sets the published version"""
+        cache.set(cls.CACHE_VERSION_KEY, version, timeout=None)
+
+    @classmethod
+    def get_local_tables(cls, version=None):
+        """
+        Gets the lookup tables from the in-process layer.
+
+        :param version: version of the norms (None to get the tables checked recently, of any version)
+        :type version: int, optional
+        :return: lookup tables (None if the tables are not of the version or not checked recently)
+        :rtype: dict
+        """
+        with cls.local_cache_lock:
+            if cls.local_cache['tables'] is None:
+                return None
+            if version is None:
+                checked_on = cls.local_cache['checked_on']
+                return cls.local_cache['tables'] if time.monotonic() - checked_on < cls.CHECK_INTERVAL else None
+            if cls.local_cache['version'] == version:
+                cls.local_cache['checked_on'] = time.monotonic()
+                return cls.local_cache['tables']
+            return None
+
+    @classmethod
+    def set_local_tables(cls, version, tables):
+        """Sets the lookup tables of the version into the in-process layer"""
+        with cls.local_cache_lock:
+            cls.local_cache.update({'version': version, 'tables': tables, 'checked_on': time.monotonic()})
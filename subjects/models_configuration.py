@@ -80,6 +80,12 @@ class CommonDataFeatureBasedConfiguration(CommonDataConfiguration):
     # Define the data path
     data_path = os.path.join(getattr(settings, 'MEDIA_ROOT'), data_field)
 
+    # Define the features field (features stored in the database)
+    features_field = 'features'
+
+    # Define the storage of the features ('database': features field, 'file': data field only)
+    features_storage = getattr(settings, 'DATA_CONFIGURATION').get('features_storage', 'file')
+
 
 class DataAcousticConfiguration(CommonDataFeatureBasedConfiguration):
     """Class implementing acoustic data configuration"""
@@ -187,8 +187,8 @@ def format_feature_data_type(feature, configuration):
     :rtype: int, float, str or np.NaN
     """
 
-    # Validate the input values
-    if not feature:
+    # Validate the input values (the zero values are kept)
+    if feature is None or (isinstance(feature, str) and feature == ''):
         return None
     if not configuration:
         return feature
@@ -1,5 +1,7 @@
 import io
 import csv
+import time
+import pandas
 import openpyxl
 from django.http import HttpResponse
 from .models_formatters import FeaturesFormatter
@@ -138,12 +140,63 @@ def read_features_from_excel(file=None, path=None):
     return zip(feature_labels, feature_values)
 
 
+def read_sheets_from_excel(file=None, path=None, sheet_names=(), **kwargs):
+    """
+    Reads the worksheets from a *.XLSX/*.XLS file into pandas.DataFrames.
+
+    The workbook is opened and parsed once (*.XLSX files in the openpyxl read-only mode), and all
+    the requested worksheets are read from it (the missing and unparsable worksheets are skipped).
+
+    :param file: file to be read
+    :type file: File, optional
+    :param path: path to the file to be read
+    :type path: str, optional
+    :param sheet_names: names of the worksheets to be read
+    :type sheet_names: iterable of str
+    :param kwargs: keyword arguments passed to the worksheet parser (see pandas.read_excel)
+    :type kwargs: dict
+    :return: (worksheets, parse timings in seconds: 'workbook' and per worksheet)
+    :rtype: tuple of (dict of pandas.DataFrames, dict)
+    """
+
+    # Validate the input arguments
+    if not any((file, path)):
+        raise ValueError(f'Not enough arguments to read from the *.xls/*.xlsx file')
+
+    # Prepare the data
+    sheets = {}
+    timings = {}
+
+    with open_excel_file(file=file, path=path) as file:
+
+        # Open the workbook
+        t = time.perf_counter()
+        with pandas.ExcelFile(file) as workbook:
+            timings['workbook'] = time.perf_counter() - t
+
+            # Read the worksheets
+            for sheet_name in sheet_names:
+                if sheet_name not in workbook.sheet_names:
+                    continue
+
+                # Read the worksheet (skip the worksheet that cannot be parsed, e.g. due to the index column)
+                t = time.perf_counter()
+                try:
+                    sheets[sheet_name] = workbook.parse(sheet_name=sheet_name, **kwargs)
+                except (ValueError, IndexError):
+                    continue
+                timings[sheet_name] = time.perf_counter() - t
+
+    # Return the worksheets and the parse timings
+    return sheets, timings
+
+
 def get_file_name(file, path):
     return (file.name if file else path).lower().strip()
 
 
 def open_csv_file(file, path):
-    return io.StringIO(file.read().decode('utf-8')) if file else open(path, 'r')
+    return io.StringIO(file.read().decode('utf-8'), newline=None) if file else open(path, 'r')
 
 
 def open_excel_file(file, path):
@@ -0,0 +1,327 @@
+import threading
+import numpy as np
+
+
+class TDigest(object):
+    """
+    Class implementing the mergeable quantile sketch (merging t-digest).
+
+    The sketch keeps the centroids (means and weights) of the values. The centroids are compressed with
+    the arcsine scale function (small centroids at the tails, large centroids in the middle), so the size
+    of the sketch is bounded by the compression, and the sketches can be merged (e.g. per subject into a
+    cohort). As long as no centroid was compressed (all weights equal to 1), the quantiles are exact (the
+    same as of numpy.percentile with the linear interpolation).
+    """
+
+    # Define the default compression (maximum number of the centroids is about the compression)
+    COMPRESSION = 100
+
+    def __init__(self, compression=None, means=None, weights=None, min_value=None, max_value=None):
+        self.compression = compression or self.COMPRESSION
+        self.means = np.asarray(means if means is not None else [], dtype=float)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=float)
+        self.min = min_value
+        self.max = max_value
+
+    @property
+    def count(self):
+        """Gets the number of the values in the sketch"""
+        return float(self.weights.sum())
+
+    def update(self, values):
+        """
+        Updates the sketch with the values (the missing and non-finite values are skipped).
+
+        :param values: values to be added
+        :type values: iterable of float
+        :return: updated sketch
+        :rtype: TDigest
+        """
+        values = np.asarray([v for v in values if v is not None], dtype=float)
+        values = values[np.isfinite(values)]
+        return self._add(values, np.ones(len(values)), values.min(initial=np.inf), values.max(initial=-np.inf))
+
+    def merge(self, other):
+        """
+        Merges the other sketch into the sketch.
+
+        :param other: sketch to be merged
+        :type other: TDigest
+        :return: merged sketch
+        :rtype: TDigest
+        """
+        if not other.count:
+            return self
+        return self._add(other.means, other.weights, other.min, other.max)
+
+    @classmethod
+    def merge_all(cls, sketches, compression=None):
+        """
+        Merges the sketches into a new sketch (single compression).
+
+        :param sketches: sketches to be merged
+        :type sketches: iterable of TDigest
+        :param compression: compression of the merged sketch
+        :type compression: int, optional
+        :return: merged sketch
+        :rtype: TDigest
+        """
+        sketches = [sketch for sketch in sketches if sketch.count]
+        if not sketches:
+            return cls(compression=compression)
+        return cls(compression=compression)._add(
+            np.concatenate([sketch.means for sketch in sketches]),
+            np.concatenate([sketch.weights for sketch in sketches]),
+            min(sketch.min for sketch in sketches),
+            max(sketch.max for sketch in sketches))
+
+    def quantile(self, q):
+        """
+        Gets the quantile of the values in the sketch.
+
+        :param q: quantile (0 to 1)
+        :type q: float
+        :return: quantile (None if the sketch is empty)
+        :rtype: float
+        """
+        if not len(self.means):
+            return None
+
+        # Get the exact quantile (no centroid compressed)
+        if np.all(self.weights == 1):
+            return float(np.percentile(self.means, q * 100))
+
+        # Interpolate between the centroids (placed at the centres of their weights) and the extremes
+        positions = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(
+            q * self.count,
+            np.concatenate(([0], positions, [self.count])),
+            np.concatenate(([self.min], self.means, [self.max]))))
+
+    def to_dict(self):
+        """Gets the sketch as a dict (to be stored in the database)"""
+        return {
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data, compression=None):
+        """Gets the sketch from a dict (stored in the database)"""
+        return cls(
+            compression=compression,
+            means=data.get('means'),
+            weights=data.get('weights'),
+            min_value=data.get('min'),
+            max_value=data.get('max'))
+
+    def _add(self, means, weights, min_value, max_value):
+        if not len(means):
+            return self
+
+        # Add the centroids and update the extremes
+        self.means = np.concatenate((self.means, means))
+        self.weights = np.concatenate((self.weights, weights))
+        self.min = float(min_value) if self.min is None else min(self.min, float(min_value))
+        self.max = float(max_value) if self.max is None else max(self.max, float(max_value))
+
+        # Compress the centroids
+        return self._compress()
+
+    def _compress(self):
+
+        # Sort the centroids
+        order = np.argsort(self.means, kind='mergesort')
+        self.means, self.weights = self.means[order], self.weights[order]
+        if len(self.means) <= self.compression:
+            return self
+
+        # Assign the centroids into the clusters of the unit size on the arcsine scale
+        total = self.weights.sum()
+        q = (np.cumsum(self.weights) - self.weights / 2) / total
+        k = self.compression / np.pi * np.arcsin(2 * q - 1)
+        clusters = np.floor(k - k.min()).astype(int)
+
+        # Merge the centroids of every cluster (weighted means)
+        weights = np.bincount(clusters, weights=self.weights)
+        means = np.bincount(clusters, weights=self.means * self.weights)
+        present = weights > 0
+        self.weights, self.means = weights[present], means[present] / weights[present]
+
+        # Return the compressed sketch
+        return self
+
+
+class PendingNormativeUpdates(threading.local):
+    """
+    Class implementing the pending updates of the normative data (per thread).
+
+    The updates scheduled within a transaction (e.g. during an import) are accumulated and run once
+    after the commit (the subjects and the modalities are de-duplicated).
+    """
+
+    def __init__(self):
+        self.updates = {}
+
+    def add(self, subject_id, modalities):
+        """Adds the pending update of the subject (None for all the modalities)"""
+        pending = self.updates.setdefault(subject_id, set())
+        if modalities is None:
+            self.updates[subject_id] = None
+        elif pending is not None:
+            pending.update(modalities)
+
+    def pop(self):
+        """Pops all the pending updates ({subject ID: modalities (None for all)})"""
+        updates, self.updates = self.updates, {}
+        return updates
+
+
+# Define the pending updates of the normative data (per thread)
+pending_normative_updates = PendingNormativeUpdates()
+
+
+class NormativeStrata(object):
+    """
+    Class implementing the strata of the normative data (sex × age band).
+
+    The strata are numbered 0 to (number of sexes × number of age bands - 1); the subjects of unknown sex
+    or age are not in any stratum (None), so they contribute to the global normative data only.
+    """
+
+    # Define the maximum age of the age lookup
+    MAX_AGE = 150
+
+    def __init__(self, sexes=('F', 'M'), age_bands=(0, 50, 60, 70, 80), min_count=10):
+        self.sexes = {sex: index for index, sex in enumerate(sexes)}
+        self.age_bands = sorted(age_bands)
+        self.min_count = min_count
+
+        # Prepare the age lookup (age band of every age, None below the first band)
+        self.bands = [None] * (self.MAX_AGE + 1)
+        for age in range(self.MAX_AGE + 1):
+            for index, lower_bound in enumerate(self.age_bands):
+                if age >= lower_bound:
+                    self.bands[age] = index
+
+    @property
+    def size(self):
+        """Gets the number of the strata"""
+        return len(self.sexes) * len(self.age_bands)
+
+    def get_stratum(self, sex, year_of_birth, year):
+        """
+        Gets the stratum of the subject (constant-time lookup).
+
+        :param sex: sex of the subject
+        :type sex: str
+        :param year_of_birth: year of birth of the subject
+        :type year_of_birth: int
+        :param year: year of the examination
+        :type year: int
+        :return: stratum (None if the sex or the age is unknown)
+        :rtype: int
+        """
+        if sex not in self.sexes or not year_of_birth or not year:
+            return None
+        age = min(max(year - year_of_birth, 0), self.MAX_AGE)
+        band = self.bands[age]
+        return None if band is None else self.sexes[sex] * len(self.age_bands) + band
+
+    def get_label(self, stratum):
+        """Gets the label of the stratum (e.g. 'F 60-69')"""
+        sex = list(self.sexes.keys())[stratum // len(self.age_bands)]
+        band = stratum % len(self.age_bands)
+        upper_bound = self.age_bands[band + 1] - 1 if band + 1 < len(self.age_bands) else None
+        return f'{sex} {self.age_bands[band]}-{upper_bound if upper_bound is not None else ""}'
+
+
+class NormativeTable(object):
+    """
+    Class implementing the lookup table of the normative data of a modality.
+
+    The medians, IQRs and counts are kept in arrays indexed by [stratum + 1, feature] (the first row holds
+    the global normative data). The features of the strata with too few values fall back to the global
+    normative data when the table is built, so the lookup of a stratum is a constant-time row selection.
+    """
+
+    def __init__(self, labels, median, iqr, count, names=None):
+        self.labels = list(labels)
+        self.names = list(names) if names is not None else self.labels
+        self.index = {label: index for index, label in enumerate(self.labels)}
+        self.median = median
+        self.iqr = iqr
+        self.count = count
+        self.norms = [None] * len(median)
+
+    @classmethod
+    def from_norms(cls, norms, strata_norms=None, strata_size=0, min_count=0, rename=None):
+        """
+        Builds the lookup table from the normative data.
+
+        :param norms: global normative data ({feature label: {'median', 'iqr', 'count'}})
+        :type norms: dict
+        :param strata_norms: normative data of the strata ({stratum: {feature label: {'median', 'iqr', 'count'}}})
+        :type strata_norms: dict, optional
+        :param strata_size: number of the strata
+        :type strata_size: int, optional
+        :param min_count: minimum number of the values of a feature in a stratum (global norms otherwise)
+        :type min_count: int, optional
+        :param rename: renaming of the feature labels for presentation (feature labels -> feature names)
+        :type rename: callable, optional
+        :return: lookup table
+        :rtype: NormativeTable
+        """
+        labels = sorted(norms.keys())
+
+        # Prepare the arrays (the global normative data in every row)
+        shape = (strata_size + 1, len(labels))
+        median = np.tile([cls._get_value(norms[label], 'median') for label in labels], (shape[0], 1))
+        iqr = np.tile([cls._get_value(norms[label], 'iqr') for label in labels], (shape[0], 1))
+        count = np.tile([norms[label].get('count') or 0 for label in labels], (shape[0], 1)).astype(int)
+
+        # Fill the normative data of the strata (large enough)
+        for stratum, stratum_norms in (strata_norms or {}).items():
+            row = int(stratum) + 1
+            if not 0 < row < shape[0]:
+                continue
+            for column, label in enumerate(labels):
+                norm = stratum_norms.get(label)
+                if norm and (norm.get('count') or 0) >= min_count and norm.get('median') is not None:
+                    median[row, column] = cls._get_value(norm, 'median')
+                    iqr[row, column] = cls._get_value(norm, 'iqr')
+                    count[row, column] = norm['count']
+
+        # Return the lookup table
+        return cls(labels, median, iqr, count, names=rename(labels) if rename else None)
+
+    def get_row(self, stratum=None):
+        """Gets the row of the stratum (the global normative data for no or unknown stratum)"""
+        return stratum + 1 if stratum is not None and 0 <= stratum + 1 < len(self.median) else 0
+
+    def get_norms(self, stratum=None):
+        """
+        Gets the normative data of the stratum (built once per stratum).
+
+        :param stratum: stratum (None for the global normative data)
+        :type stratum: int, optional
+        :return: normative data ({feature label: {'median', 'iqr', 'count'}})
+        :rtype: dict
+        """
+        row = self.get_row(stratum)
+        if self.norms[row] is None:
+            self.norms[row] = {
+                label: {
+                    'median': None if np.isnan(self.median[row, column]) else float(self.median[row, column]),
+                    'iqr': None if np.isnan(self.iqr[row, column]) else float(self.iqr[row, column]),
+                    'count': int(self.count[row, column])
+                }
+                for column, label in enumerate(self.labels)
+            }
+        return self.norms[row]
+
+    @staticmethod
+    def _get_value(norm, key):
+        return np.nan if norm.get(key) is None else float(norm[key])
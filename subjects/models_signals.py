@@ -1,4 +1,5 @@
 from predictor import sign_up_predictor_user
+from django.apps import apps
 from django.conf import settings
 from django.core.cache import cache
 
@@ -59,7 +60,7 @@ def update_last_examined_on_for_subject(sender, instance, created, **kwargs):
     # Update the last examined on of the subject
     if examined_on:
         instance.subject.last_examined_on = max(examined_on)
-        instance.subject.save()
+        instance.subject.save(update_fields=['last_examined_on', 'updated_on'])
 
 
 def invalidate_cached_lbd_prediction_for_session(sender, instance, created, **kwargs):
@@ -78,9 +79,13 @@ def invalidate_cached_lbd_prediction_for_session(sender, instance, created, **kw
     :rtype: None type
     """
 
+    # Get the examination session and the subject
+    session = instance.examination_session
+    subject = session.subject
+
     # Get the keys to be invalidated (specific session and subject)
-    session_key = f'{instance.examination_session.get_lbd_probability_cache_key()}'
-    subject_key = f'{instance.examination_session.subject.get_lbd_probability_cache_key()}'
+    session_key = f'{session.get_lbd_probability_cache_key()}'
+    subject_key = f'{subject.get_lbd_probability_cache_key()}'
 
     # Join the obtained keys
     keys = [session_key] + [subject_key]
@@ -89,6 +94,14 @@ def invalidate_cached_lbd_prediction_for_session(sender, instance, created, **kw
     if keys:
         cache.delete_many(keys)
 
+    # Mark the stored predictions as stale
+    type(session).objects.filter(pk=session.pk).update(lbd_probability_stale=True)
+    type(subject).objects.filter(pk=subject.pk).update(lbd_probability=None)
+
+    # Enqueue the prediction to be precomputed by the prediction worker
+    if getattr(settings, 'PREDICTOR_CONFIGURATION', {}).get('use_prediction_worker', False) is True:
+        type(session).enqueue_lbd_predictions([session])
+
 
 def invalidate_cached_lbd_prediction_for_subject(sender, instance, created, **kwargs):
     """
@@ -105,4 +118,183 @@ def invalidate_cached_lbd_prediction_for_subject(sender, instance, created, **kw
     :return: None
     :rtype: None type
     """
-    cache.delete(instance.get_lbd_probability_cache_key())
+
+    # Get the fields that were updated (None if all fields were updated)
+    update_fields = kwargs.get('update_fields')
+
+    # Get the keys to be invalidated (subject)
+    keys = [instance.get_lbd_probability_cache_key()]
+
+    # Invalidate the examination sessions as well if the subject's prediction features could have changed
+    if update_fields is None or set(update_fields) & set(instance.CONFIGURATION.get_predictor_feature_names()):
+        sessions = instance.examination_sessions.all()
+        keys += [session.get_lbd_probability_cache_key() for session in sessions]
+        sessions.update(lbd_probability_stale=True)
+
+        # Enqueue the predictions to be precomputed by the prediction worker
+        if getattr(settings, 'PREDICTOR_CONFIGURATION', {}).get('use_prediction_worker', False) is True:
+            sessions.model.enqueue_lbd_predictions(sessions)
+
+    # Invalidate the keys
+    cache.delete_many(keys)
+
+    # Mark the stored prediction as stale
+    type(instance).objects.filter(pk=instance.pk).update(lbd_probability=None)
+
+
+def invalidate_cached_features_for_data(sender, instance, created, **kwargs):
+    """
+    Invalidates the cached parsed features for feature-based examination session data.
+
+    :param sender: sender class
+    :type sender: child class of CommonFeatureBasedData
+    :param instance: instance object
+    :type instance: child instance of CommonFeatureBasedData
+    :param created: creation flag (True if created; False otherwise)
+    :type created bool
+    :param kwargs: additional keyword arguments
+    :type kwargs: dict
+    :return: None
+    :rtype: None type
+    """
+    if instance.data:
+        instance.CACHED_FEATURES(sender, instance.data.path).delete_cached_features()
+
+
+def update_normative_data_for_session_data(sender, instance, **kwargs):
+    """
+    Schedules the update of the normative data for the saved/deleted examination session data.
+
+    :param sender: sender class
+    :type sender: child class of CommonExaminationSessionData
+    :param instance: instance object
+    :type instance: child instance of CommonExaminationSessionData
+    :param kwargs: additional keyword arguments
+    :type kwargs: dict
+    :return: None
+    :rtype: None type
+    """
+    normative_sketch = apps.get_model('subjects', 'NormativeSketch')
+
+    # Get the subject of the examination session (the session might have been deleted already)
+    subject = apps.get_model('subjects', 'Subject').objects \
+        .filter(examination_sessions__pk=instance.examination_session_id) \
+        .select_related('organization') \
+        .first()
+
+    # Schedule the update of the modality of the subject (the subjects outside the cohort are skipped)
+    if subject is not None and normative_sketch.is_in_cohort(subject):
+        normative_sketch.schedule_update(subject.pk, [normative_sketch.get_modality(sender)])
+
+
+def update_normative_data_for_subject(sender, instance, **kwargs):
+    """
+    Schedules the update of the normative data for the saved/deleted subject (the subject might have
+    entered or left the normative cohort).
+
+    :param sender: sender class
+    :type sender: Subject
+    :param instance: instance object
+    :type instance: Subject instance
+    :param kwargs: additional keyword arguments
+    :type kwargs: dict
+    :return: None
+    :rtype: None type
+    """
+
+    # Skip the new subjects (no data yet) and the updates not affecting the cohort or the strata
+    update_fields = kwargs.get('update_fields')
+    fields = {'code', 'organization', 'sex', 'year_of_birth'}
+    if kwargs.get('created') or (update_fields is not None and not fields & set(update_fields)):
+        return
+
+    # Schedule the update of all the modalities of the subject in the cohort (or of the one that left it)
+    normative_sketch = apps.get_model('subjects', 'NormativeSketch')
+    if normative_sketch.is_in_cohort(instance) or instance.normative_sketches.exists():
+        normative_sketch.schedule_update(instance.pk)
+
+
+def update_normative_data_for_session(sender, instance, created, **kwargs):
+    """
+    Schedules the update of the normative data for the saved examination session (the stratum of the
+    session depends on the examination date).
+
+    :param sender: sender class
+    :type sender: ExaminationSession
+    :param instance: instance object
+    :type instance: ExaminationSession instance
+    :param created: creation flag (True if created; False otherwise)
+    :type created bool
+    :param kwargs: additional keyword arguments
+    :type kwargs: dict
+    :return: None
+    :rtype: None type
+    """
+
+    # Skip the new sessions (no data yet) and the updates not affecting the strata
+    update_fields = kwargs.get('update_fields')
+    if created or (update_fields is not None and 'examined_on' not in update_fields):
+        return
+
+    # Schedule the update of all the modalities of the subject (the subjects outside the cohort are skipped)
+    normative_sketch = apps.get_model('subjects', 'NormativeSketch')
+    if normative_sketch.is_in_cohort(instance.subject):
+        normative_sketch.schedule_update(instance.subject_id)
+
+
+# Define the batched invalidation (used instead of the signals by the bulk operations)
+def invalidate_cached_lbd_predictions(subjects=(), sessions=()):
+    """
+    Invalidates the cached LBD predictions for multiple subjects and examination sessions at once.
+
+    :param subjects: subjects to be invalidated (including all their examination sessions)
+    :type subjects: iterable of Subject instances
+    :param sessions: examination sessions to be invalidated (including their subjects)
+    :type sessions: iterable of ExaminationSession instances
+    :return: None
+    :rtype: None type
+    """
+
+    # Get the subjects and the examination sessions to be invalidated
+    subjects, sessions = list(subjects), list(sessions)
+    for subject in subjects:
+        sessions += list(subject.examination_sessions.all())
+    subjects += [session.subject for session in sessions]
+    if not sessions and not subjects:
+        return
+
+    # Invalidate the keys
+    keys = [subject.get_lbd_probability_cache_key() for subject in subjects]
+    keys += [session.get_lbd_probability_cache_key() for session in sessions]
+    cache.delete_many(list(set(keys)))
+
+    # Mark the stored predictions as stale
+    if sessions:
+        type(sessions[0]).objects.filter(pk__in=[s.pk for s in sessions]).update(lbd_probability_stale=True)
+    if subjects:
+        type(subjects[0]).objects.filter(pk__in=[s.pk for s in subjects]).update(lbd_probability=None)
+
+    # Enqueue the predictions to be precomputed by the prediction worker
+    if sessions and getattr(settings, 'PREDICTOR_CONFIGURATION', {}).get('use_prediction_worker', False) is True:
+        type(sessions[0]).enqueue_lbd_predictions(sessions)
+
+
+def update_normative_data(subjects=(), sessions=()):
+    """
+    Updates the normative data for multiple subjects and examination sessions at once.
+
+    :param subjects: subjects to be updated (all their examination sessions)
+    :type subjects: iterable of Subject instances
+    :param sessions: examination sessions to be updated (their subjects)
+    :type sessions: iterable of ExaminationSession instances
+    :return: None
+    :rtype: None type
+    """
+    normative_sketch = apps.get_model('subjects', 'NormativeSketch')
+
+    # Get the subjects in the cohort (the others are skipped)
+    subjects = list(subjects) + [session.subject for session in sessions]
+    subject_ids = {subject.pk for subject in subjects if normative_sketch.is_in_cohort(subject)}
+
+    # Update the normative data
+    normative_sketch.update_subjects({pk: None for pk in subject_ids}, background=True)
@@ -1,4 +1,4 @@
-import sys
+import numpy as np
 from django.conf import settings
 from subjects.models_formatters import FeaturesFormatter
 
@@ -6,6 +6,9 @@ from subjects.models_formatters import FeaturesFormatter
 # Presentation settings
 presentation_config = getattr(settings, 'PRESENTATION_CONFIGURATION')['features']
 
+# Define the scaling of the IQR to the standard deviation (normal distribution)
+IQR_TO_STD = 1.349
+
 
 def rename_feature(feature_label, feature_configuration):
     """Renames the feature according to the input configuration"""
@@ -16,31 +19,126 @@ def rename_feature(feature_label, feature_configuration):
     return feature_configuration[feature_label]['name']
 
 
-def compute_difference_from_norm(session_data, norm_data, modality):
-    """Computes the difference between the features and the norm of a given modality (in a given session)"""
+def rename_features(feature_labels, modality):
+    """Renames the features of a given modality (e.g. once per feature order of the normative data)"""
+    return [rename_feature(label, presentation_config.get(modality, {})) for label in feature_labels]
+
 
-    # Prepare the modality presentation
-    modality_presentation = presentation_config[modality]
+def align_feature_values(session_data, feature_index):
+    """
+    Aligns the feature values with the feature order (NaN for the missing and non-numerical values).
 
-    # Prepare the comparison
-    comparison = []
+    :param session_data: computable features
+    :type session_data: list of dicts
+    :param feature_index: feature order ({feature label: index})
+    :type feature_index: dict
+    :return: aligned feature values
+    :rtype: numpy.ndarray
+    """
+    values = np.full(len(feature_index), np.nan)
 
-    # Compute the comparison
     for data in session_data:
-        orig = data[FeaturesFormatter.FEATURE_VALUE_FIELD]
-        norm = norm_data[data[FeaturesFormatter.FEATURE_LABEL_FIELD]]['median'] \
-            if data[FeaturesFormatter.FEATURE_LABEL_FIELD] in norm_data \
-            else None
+        index = feature_index.get(data[FeaturesFormatter.FEATURE_LABEL_FIELD])
+        value = data[FeaturesFormatter.FEATURE_VALUE_FIELD]
+        if index is not None and isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[index] = value
+
+    # Return the aligned feature values
+    return values
+
+
+def compare_with_norm(values, medians, iqrs):
+    """
+    Compares the feature values with the norm (vectorized over the aligned arrays).
+
+    :param values: feature values (NaN for the missing values)
+    :type values: numpy.ndarray
+    :param medians: medians of the norm (NaN for the missing norms)
+    :type medians: numpy.ndarray
+    :param iqrs: IQRs of the norm (NaN for the missing norms)
+    :type iqrs: numpy.ndarray
+    :return: differences from the medians [%] (NaN if not comparable, e.g. zero median), z-scores against
+             the IQRs (NaN if not comparable, e.g. zero IQR) and ranks by the difference (1 for the most
+             differentiating feature, 0 if not comparable)
+    :rtype: tuple (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    values, medians, iqrs = (np.asarray(array, dtype=float) for array in (values, medians, iqrs))
+
+    # Compute the differences and the z-scores (the IQR scaled to the standard deviation)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        differences = np.where(medians != 0, np.abs(values / medians * 100 - 100), np.nan)
+        z_scores = np.where(iqrs > 0, (values - medians) / (iqrs / IQR_TO_STD), np.nan)
+
+    # Rank the comparable features by the difference (descending)
+    comparable = np.isfinite(differences)
+    order = np.argsort(np.where(comparable, -differences, np.inf), kind='stable')
+    ranks = np.empty(len(values), dtype=int)
+    ranks[order] = np.arange(1, len(values) + 1)
+    ranks[~comparable] = 0
 
-        orig = orig if orig is not None else None
-        norm = norm if norm is not None else None
+    # Return the differences, the z-scores and the ranks
+    return differences, z_scores, ranks
 
-        comparison.append({
-            'feature': rename_feature(data[FeaturesFormatter.FEATURE_LABEL_FIELD], modality_presentation),
-            'difference': abs(((orig / (norm + sys.float_info.epsilon)) * 100) - 100) if all((orig, norm)) else None,
-            'orig value': orig,
-            'norm value': norm
-        })
+
+def compute_difference_from_norm(session_data, norm_table, stratum=None):
+    """
+    Computes the difference between the features and the norm of a given modality (in a given session).
+
+    :param session_data: computable features
+    :type session_data: list of dicts
+    :param norm_table: lookup table of the normative data of the modality
+    :type norm_table: NormativeTable
+    :param stratum: stratum of the normative data (None for the global normative data)
+    :type stratum: int, optional
+    :return: comparison (aligned arrays in the feature order of the normative data)
+    :rtype: dict
+    """
+
+    # Align the feature values with the norm
+    row = norm_table.get_row(stratum)
+    values = align_feature_values(session_data, norm_table.index)
+    medians, iqrs = norm_table.median[row], norm_table.iqr[row]
+
+    # Compare the features with the norm
+    differences, z_scores, ranks = compare_with_norm(values, medians, iqrs)
 
     # Return the comparison
-    return comparison
+    return {
+        'label': norm_table.labels,
+        'index': norm_table.index,
+        'feature': norm_table.names,
+        'orig value': values,
+        'norm value': medians,
+        'iqr': iqrs,
+        'difference': differences,
+        'z-score': z_scores,
+        'rank': ranks
+    }
+
+
+def get_most_differentiating_features(comparison, top_n=10):
+    """
+    Gets the most differentiating features from the comparison with the norm.
+
+    :param comparison: comparison with the norm (see compute_difference_from_norm)
+    :type comparison: dict
+    :param top_n: number of the features
+    :type top_n: int, optional
+    :return: most differentiating features (sorted by the rank)
+    :rtype: list of dicts
+    """
+    ranks = comparison['rank']
+    indices = np.flatnonzero((ranks > 0) & (ranks <= top_n))
+    indices = indices[np.argsort(ranks[indices])]
+
+    # Return the features
+    return [
+        {
+            'feature': comparison['feature'][index],
+            'orig value': float(comparison['orig value'][index]),
+            'norm value': float(comparison['norm value'][index]),
+            'difference': float(comparison['difference'][index]),
+            'z-score': float(comparison['z-score'][index])
+        }
+        for index in indices
+    ]
@@ -1,3 +1,511 @@
-from django.test import TestCase
+import numpy
+import pandas
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.db import IntegrityError, transaction
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.core.cache import cache
+from django.utils import timezone
+from subjects import views_io
+from subjects.models import (
+    User,
+    Organization,
+    Subject,
+    ExaminationSession,
+    PredictionJob,
+    NormativeSketch,
+    NormativeCohortSketch,
+    DATA_TO_MODEL_CLASS_MAPPING
+)
+from subjects.models_cache import BaseCachedModel, SubjectCache, ExaminationSessionCache, PredictionCache
+from subjects.models_norms import TDigest
+from subjects.models_utils import compare_with_norm, IQR_TO_STD
+from subjects.views_predictors import ExaminationSessionLBDPredictor
+from subjects.management.commands.run_prediction_worker import precompute_lbd_predictions
 
-# Create your tests here.
+
+def create_subjects(organization, count, sessions=1, prefix='HC'):
+    """
+    Creates the subjects with the examination sessions (without the session data).
+
+    :param organization: organization of the subjects
+    :type organization: Organization instance
+    :param count: number of the subjects
+    :type count: int
+    :param sessions: number of the examination sessions per subject
+    :type sessions: int, optional
+    :param prefix: prefix of the subject codes
+    :type prefix: str, optional
+    :return: created subjects
+    :rtype: list
+    """
+    subjects = []
+    for i in range(count):
+        subject = Subject.objects.create(
+            code=f'{prefix}{i:03d}',
+            organization=organization,
+            year_of_birth=1950 + i,
+            sex='M' if i % 2 else 'F')
+        for session_number in range(1, sessions + 1):
+            ExaminationSession.objects.create(subject=subject, session_number=session_number)
+        subjects.append(subject)
+    return subjects
+
+
+def create_import_data(codes, prefixes=('[1]', ), label='cei', seed=0):
+    """
+    Creates the data of the subjects as read from the external source (the identity and the features of a modality).
+
+    :param codes: codes of the subjects
+    :type codes: list of str
+    :param prefixes: session prefixes
+    :type prefixes: tuple of str, optional
+    :param label: label of the modality
+    :type label: str, optional
+    :param seed: seed of the feature values
+    :type seed: int, optional
+    :return: identity data and features data (see import_subjects_data)
+    :rtype: tuple (pandas.DataFrame, dict)
+    """
+    rng = numpy.random.default_rng(seed)
+    index = pandas.Index(codes, name='code')
+
+    # Prepare the identity data
+    df_identity = pandas.DataFrame({
+        'Sex': ['M' if i % 2 else 'F' for i in range(len(codes))],
+        'Date of birth': [f'{1950 + i}-01-01' for i in range(len(codes))],
+        **{f'{prefix} Date of examination': [f'2022-0{j + 1}-01'] * len(codes) for j, prefix in enumerate(prefixes)}
+    }, index=index)
+
+    # Prepare the features data
+    df_features = pandas.DataFrame({
+        f'{prefix} {feature}': rng.normal(size=len(codes)).round(4)
+        for prefix in prefixes
+        for feature in DATA_TO_MODEL_CLASS_MAPPING[label].CONFIGURATION.get_available_feature_names()
+    }, index=index)
+
+    # Return the identity and the features data
+    return df_identity, {label: df_features}
+
+
+class PredictionWorkerTests(TestCase):
+    """Tests of the prediction worker"""
+
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name='test')
+        create_subjects(self.organization, 2)
+        PredictionJob.enqueue(ExaminationSession.objects.all())
+        self.jobs = PredictionJob.claim(10)
+
+    @mock.patch.object(ExaminationSessionLBDPredictor, 'compute_lbd_probability_many')
+    def test_job_without_prediction_fails(self, compute_lbd_probability_many):
+        compute_lbd_probability_many.return_value = [None, 0.4]
+
+        self.assertEqual(precompute_lbd_predictions([job.id for job in self.jobs]), (1, 1))
+
+        # The job with no prediction (although there are features) is failed, the other one is finished
+        _, sessions = compute_lbd_probability_many.call_args[0]
+        failed = PredictionJob.objects.get()
+        self.assertEqual(failed.examination_session, sessions[0])
+        self.assertEqual(failed.state, PredictionJob.FAILED)
+        self.assertEqual(failed.attempts, 1)
+        self.assertTrue(failed.error)
+
+    @mock.patch('subjects.management.commands.run_prediction_worker.process_features')
+    @mock.patch.object(ExaminationSessionLBDPredictor, 'compute_lbd_probability_many')
+    def test_job_without_features_finishes(self, compute_lbd_probability_many, process_features):
+        compute_lbd_probability_many.return_value = [None, 0.4]
+        process_features.return_value = ([], numpy.array([]))
+
+        self.assertEqual(precompute_lbd_predictions([job.id for job in self.jobs]), (2, 0))
+        self.assertFalse(PredictionJob.objects.exists())
+
+    @mock.patch.object(ExaminationSessionLBDPredictor, 'compute_lbd_probability_many')
+    def test_failed_batch(self, compute_lbd_probability_many):
+        compute_lbd_probability_many.side_effect = RuntimeError('predictor is down')
+
+        self.assertEqual(precompute_lbd_predictions([job.id for job in self.jobs]), (0, 2))
+        self.assertEqual(PredictionJob.objects.filter(state=PredictionJob.FAILED).count(), 2)
+
+
+class LBDProbabilityCacheTests(TestCase):
+    """Tests of the cached LBD probabilities (versioned cache keys, sentinels and invalidation)"""
+
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name='test')
+        self.subject = create_subjects(self.organization, 1)[0]
+        self.session = self.subject.examination_sessions.get()
+
+    def test_missing_and_no_data_sentinels(self):
+        self.assertIs(SubjectCache(self.subject).get_cached_lbd_probability(), BaseCachedModel.MISSING)
+
+        # No data is cached as None (distinguished from the missing LBD probability)
+        SubjectCache(self.subject).set_cached_lbd_probability(None)
+        self.assertIsNone(SubjectCache(self.subject).get_cached_lbd_probability())
+
+        # Zero is cached as a valid LBD probability
+        SubjectCache(self.subject).set_cached_lbd_probability(0.0)
+        self.assertEqual(SubjectCache(self.subject).get_cached_lbd_probability(), 0.0)
+        self.assertEqual(Subject.objects.get(pk=self.subject.pk).lbd_probability, 0.0)
+
+    def test_no_data_clears_stored_lbd_probability(self):
+        ExaminationSessionCache(self.session).set_cached_lbd_probability(0.4, features_hash='hash')
+        ExaminationSessionCache(self.session).set_cached_lbd_probability(None)
+
+        session = ExaminationSession.objects.get(pk=self.session.pk)
+        self.assertIsNone(session.lbd_probability)
+        self.assertIsNone(session.lbd_probability_hash)
+        self.assertFalse(session.lbd_probability_stale)
+
+    def test_many_cached_lbd_probabilities(self):
+        subjects = [self.subject] + create_subjects(self.organization, 2, prefix='PD')
+        SubjectCache.set_many_cached_lbd_probabilities(subjects[:2], [0.2, None])
+
+        probabilities = SubjectCache.get_many_cached_lbd_probabilities(subjects)
+        self.assertEqual(probabilities[:2], [0.2, None])
+        self.assertIs(probabilities[2], BaseCachedModel.MISSING)
+
+    def test_invalidation_bumps_version(self):
+        prediction_cache = PredictionCache(BaseCachedModel.PREDICTOR_MODEL)
+        version = prediction_cache.get_version()
+        key = SubjectCache(self.subject).get_lbd_probability_cache_key()
+
+        # The cached LBD probabilities and predictions of the previous version are not used anymore
+        SubjectCache(self.subject).set_cached_lbd_probability(0.3)
+        prediction_cache.set_cached_predictions(['hash'], [0.3])
+        self.assertEqual(prediction_cache.invalidate(), version + 1)
+        self.assertNotEqual(SubjectCache(self.subject).get_lbd_probability_cache_key(), key)
+        self.assertEqual(prediction_cache.get_cached_predictions(['hash']), [None])
+        self.assertIs(SubjectCache(self.subject).get_cached_lbd_probability(), BaseCachedModel.MISSING)
+
+    def test_invalidation_marks_stored_lbd_probabilities_stale(self):
+        ExaminationSessionCache(self.session).set_cached_lbd_probability(0.6)
+        PredictionCache(BaseCachedModel.PREDICTOR_MODEL).invalidate()
+
+        # The stored LBD probability is used until it is marked as stale (then served as stale only)
+        session = ExaminationSession.objects.get(pk=self.session.pk)
+        self.assertEqual(ExaminationSessionCache(session).get_cached_lbd_probability(), 0.6)
+        self.assertEqual(ExaminationSession.invalidate_stored_lbd_predictions(BaseCachedModel.PREDICTOR_MODEL), 1)
+
+        cache.clear()
+        session = ExaminationSession.objects.get(pk=self.session.pk)
+        self.assertIs(ExaminationSessionCache(session).get_cached_lbd_probability(), BaseCachedModel.MISSING)
+        self.assertEqual(ExaminationSessionCache(session).get_stale_lbd_probability(), 0.6)
+
+
+class ImportTests(TestCase):
+    """Tests of the bulk import of the subjects (diff against the existing records and rollback)"""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_root.cleanup)
+        self.addCleanup(media_settings.disable)
+
+        # Prepare the user and the data to be imported
+        self.user = User.objects.create(username='test', organization=Organization.objects.create(name='test'))
+        self.codes = ['HC000', 'HC001', 'HC002']
+        self.df_identity, self.df_features = create_import_data(self.codes, prefixes=('[1]', '[2]'))
+
+    def get_features(self, code, session_number=1):
+        model = DATA_TO_MODEL_CLASS_MAPPING['cei']
+        session = ExaminationSession.objects.get(subject__code=code, session_number=session_number)
+        return model.get_features_from_record(model.get_session_data(session))
+
+    def test_import(self):
+        self.assertEqual(views_io.import_subjects_data(self.user, self.df_identity, self.df_features), {})
+
+        self.assertEqual(sorted(Subject.objects.values_list('code', flat=True)), self.codes)
+        self.assertEqual(ExaminationSession.objects.count(), 6)
+        self.assertEqual(DATA_TO_MODEL_CLASS_MAPPING['cei'].objects.count(), 6)
+        self.assertEqual(Subject.objects.get(code='HC001').sex, 'M')
+        self.assertEqual(
+            list(ExaminationSession.objects.filter(subject__code='HC000').values_list('internal_prefix', flat=True)),
+            ['[1]', '[2]'])
+
+    def test_import_writes_changed_records_only(self):
+        views_io.import_subjects_data(self.user, self.df_identity, self.df_features)
+        updated_on = dict(Subject.objects.values_list('code', 'updated_on'))
+        features = {code: self.get_features(code) for code in self.codes}
+
+        # Change the identity of a subject and the features of another subject
+        self.df_identity.loc['HC000', 'Sex'] = 'M'
+        self.df_features['cei'].iloc[1, 0] = 42.0
+        self.assertEqual(views_io.import_subjects_data(self.user, self.df_identity, self.df_features), {})
+
+        self.assertNotEqual(Subject.objects.get(code='HC000').updated_on, updated_on['HC000'])
+        self.assertEqual(Subject.objects.get(code='HC002').updated_on, updated_on['HC002'])
+        self.assertNotEqual(self.get_features('HC001'), features['HC001'])
+        self.assertEqual(self.get_features('HC002'), features['HC002'])
+
+    def test_import_drops_stale_stored_features(self):
+        views_io.import_subjects_data(self.user, self.df_identity, self.df_features)
+        model = DATA_TO_MODEL_CLASS_MAPPING['cei']
+        self.assertEqual(model.CONFIGURATION.features_storage, 'file')
+
+        # Store the features in the database (as in the database storage) and replace the data file
+        records = model.objects.filter(
+            examination_session__subject__code='HC001',
+            examination_session__session_number=1)
+        records.update(features={'stale': 1})
+        self.df_features['cei'].iloc[1, 0] = 42.0
+        views_io.import_subjects_data(self.user, self.df_identity, self.df_features)
+
+        # The features are read from the new data file
+        self.assertIsNone(records.get().features)
+        self.assertIn(42.0, [feature['value'] for feature in self.get_features('HC001')])
+
+    def test_failed_subjects_are_rolled_back(self):
+        views_io.import_subjects_data(self.user, self.df_identity, self.df_features)
+
+        # Change the stored records of an existing subject (to be restored by the failed import) and remove another
+        Subject.objects.filter(code='HC000').update(year_of_birth=1900)
+        ExaminationSession.objects.filter(subject__code='HC000', session_number=1).update(internal_prefix='old')
+        ExaminationSession.objects.filter(subject__code='HC000', session_number=2).delete()
+        Subject.objects.filter(code='HC001').delete()
+
+        # Fail the existing subject (session data) and the new subject (examination sessions)
+        prepare_session, prepare_session_data = views_io.prepare_session, views_io.prepare_session_data
+
+        def fail_session(subject, *args, **kwargs):
+            if subject.code == 'HC001':
+                raise ValueError('session')
+            return prepare_session(subject, *args, **kwargs)
+
+        def fail_session_data(model, session, *args, **kwargs):
+            if session.subject.code == 'HC000':
+                raise ValueError('session data')
+            return prepare_session_data(model, session, *args, **kwargs)
+
+        with mock.patch.object(views_io, 'prepare_session', fail_session), \
+                mock.patch.object(views_io, 'prepare_session_data', fail_session_data):
+            errors = views_io.import_subjects_data(self.user, self.df_identity, self.df_features)
+
+        self.assertEqual(sorted(errors.keys()), ['HC000', 'HC001'])
+        self.assertEqual(Subject.objects.get(code='HC000').year_of_birth, 1900)
+        sessions = ExaminationSession.objects.filter(subject__code='HC000')
+        self.assertEqual(list(sessions.values_list('session_number', 'internal_prefix')), [(1, 'old')])
+        self.assertFalse(Subject.objects.filter(code='HC001').exists())
+        self.assertEqual(ExaminationSession.objects.filter(subject__code='HC002').count(), 2)
+
+
+class PredictionJobTests(TestCase):
+    """Tests of the lifecycle of the prediction jobs (claim, finish and requeue)"""
+
+    def setUp(self):
+        self.organization = Organization.objects.create(name='test')
+        create_subjects(self.organization, 3)
+        PredictionJob.enqueue(ExaminationSession.objects.all())
+
+    def test_claim(self):
+        jobs = PredictionJob.claim(2)
+        self.assertEqual(len(jobs), 2)
+        self.assertTrue(all(job.state == PredictionJob.RUNNING and job.started_on for job in jobs))
+
+        # The claimed jobs are not claimed again
+        self.assertEqual(len(PredictionJob.claim(10)), 1)
+        self.assertEqual(PredictionJob.claim(10), [])
+
+    def test_finish(self):
+        finished, failed = PredictionJob.claim(2)
+        PredictionJob.finish([finished])
+        PredictionJob.finish([failed], error='error')
+
+        self.assertFalse(PredictionJob.objects.filter(pk=finished.pk).exists())
+        failed = PredictionJob.objects.get(pk=failed.pk)
+        self.assertEqual((failed.state, failed.attempts, failed.error), (PredictionJob.FAILED, 1, 'error'))
+
+    def test_finish_skips_requeued_jobs(self):
+        job = PredictionJob.claim(1)[0]
+
+        # The data changed while the job was running (the job is requeued and must be predicted again)
+        PredictionJob.enqueue([job.examination_session])
+        PredictionJob.finish([job])
+        self.assertEqual(PredictionJob.objects.get(pk=job.pk).state, PredictionJob.PENDING)
+
+    def test_requeue_failed(self):
+        job = PredictionJob.claim(1)[0]
+        PredictionJob.finish([job], error='error')
+
+        # The failed job is retried after the retry delay
+        self.assertEqual(PredictionJob.requeue_failed(max_attempts=2, retry_delay=60), 0)
+        PredictionJob.objects.filter(pk=job.pk).update(started_on=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(PredictionJob.requeue_failed(max_attempts=2, retry_delay=60), 1)
+
+        # The job that failed the maximum number of attempts is not retried anymore
+        job = next(claimed for claimed in PredictionJob.claim(10) if claimed.pk == job.pk)
+        PredictionJob.finish([job], error='error')
+        self.assertEqual(PredictionJob.objects.get(pk=job.pk).attempts, 2)
+        self.assertEqual(PredictionJob.requeue_failed(max_attempts=2, retry_delay=0), 0)
+
+    def test_requeue_running(self):
+        PredictionJob.claim(10)
+        PredictionJob.requeue_running()
+        self.assertEqual(PredictionJob.objects.filter(state=PredictionJob.PENDING).count(), 3)
+
+    def test_pending_session_ids(self):
+        sessions = list(ExaminationSession.objects.all())
+        PredictionJob.finish(PredictionJob.claim(1))
+        self.assertEqual(len(PredictionJob.get_pending_session_ids(sessions + [None])), 2)
+
+
+class TDigestTests(SimpleTestCase):
+    """Tests of the mergeable quantile sketch"""
+
+    @staticmethod
+    def get_rank_error(values, estimate, q):
+        """Gets the error of the estimated quantile in the rank (fraction of the values)"""
+        return abs(numpy.mean(values <= estimate) - q)
+
+    def test_exact_quantiles(self):
+        values = numpy.random.default_rng(0).normal(size=50)
+        sketch = TDigest(compression=100).update(values)
+
+        for q in (0, 0.1, 0.25, 0.5, 0.9, 1):
+            self.assertAlmostEqual(sketch.quantile(q), numpy.percentile(values, q * 100))
+
+    def test_quantile_accuracy(self):
+        values = numpy.random.default_rng(1).lognormal(size=20000)
+        sketch = TDigest(compression=100)
+        for chunk in numpy.array_split(values, 20):
+            sketch.update(chunk)
+
+        self.assertLessEqual(len(sketch.means), 2 * sketch.compression)
+        self.assertEqual(sketch.count, len(values))
+        self.assertEqual((sketch.min, sketch.max), (values.min(), values.max()))
+        for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+            self.assertLess(self.get_rank_error(values, sketch.quantile(q), q), 0.01)
+
+    def test_merge(self):
+        values = numpy.random.default_rng(2).normal(size=10000)
+        sketches = [TDigest().update(chunk) for chunk in numpy.array_split(values, 10)]
+
+        # Merge the sketches at once and one by one
+        merged_all = TDigest.merge_all(sketches)
+        merged = TDigest()
+        for sketch in sketches:
+            merged.merge(sketch)
+
+        for sketch in (merged_all, merged):
+            self.assertEqual(sketch.count, len(values))
+            for q in (0.05, 0.5, 0.95):
+                self.assertLess(self.get_rank_error(values, sketch.quantile(q), q), 0.01)
+
+    def test_serialization(self):
+        sketch = TDigest().update(numpy.random.default_rng(3).normal(size=1000))
+        restored = TDigest.from_dict(sketch.to_dict())
+        self.assertEqual(restored.quantile(0.3), sketch.quantile(0.3))
+
+    def test_missing_values(self):
+        sketch = TDigest().update([1.0, None, numpy.nan, numpy.inf, 3.0])
+        self.assertEqual((sketch.count, sketch.quantile(0.5)), (2, 2.0))
+        self.assertIsNone(TDigest().quantile(0.5))
+        self.assertEqual(TDigest.merge_all([TDigest(), sketch]).count, 2)
+
+
+class NormativeSketchTests(TestCase):
+    """Tests of the incremental updates of the normative sketches (merged per stratum)"""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_root.cleanup)
+        self.addCleanup(media_settings.disable)
+
+        # Import the subjects of the cohort and a subject outside of it
+        user = User.objects.create(username='test', organization=Organization.objects.create(name='test'))
+        codes = [f'HC{i:03d}' for i in range(10)] + ['PD000']
+        with mock.patch.object(NormativeSketch, 'schedule_update'):
+            views_io.import_subjects_data(user, *create_import_data(codes, prefixes=('[1]', '[2]')))
+        self.subjects = {subject.code: subject for subject in Subject.objects.all()}
+        self.label = DATA_TO_MODEL_CLASS_MAPPING['cei'].CONFIGURATION.get_available_feature_names()[0]
+
+    def get_rebuilt_norms(self):
+        """Gets the normative data computed from the merged sketches rebuilt from all the subject sketches"""
+        with transaction.atomic():
+            NormativeCohortSketch.rebuild()
+            norms = NormativeSketch.compute_norms()
+            transaction.set_rollback(True)
+        return norms
+
+    def test_incremental_updates_match_rebuild(self):
+        NormativeSketch.update_subjects({subject.pk: None for subject in self.subjects.values()})
+        self.assertFalse(NormativeSketch.objects.filter(subject=self.subjects['PD000']).exists())
+        self.assertEqual(NormativeSketch.compute_norms(), self.get_rebuilt_norms())
+        self.assertEqual(NormativeSketch.compute_norms()[0]['cei'][self.label]['count'], 20)
+
+        # Move a subject to another stratum (its strata are merged again)
+        subject = self.subjects['HC003']
+        Subject.objects.filter(pk=subject.pk).update(year_of_birth=1990)
+        NormativeSketch.update_subjects({subject.pk: None})
+        self.assertEqual(NormativeSketch.compute_norms(), self.get_rebuilt_norms())
+
+        # Move a subject out of the cohort (its sketches are removed)
+        Subject.objects.filter(pk=subject.pk).update(code='PD003')
+        NormativeSketch.update_subjects({subject.pk: None})
+        self.assertFalse(NormativeSketch.objects.filter(subject=subject).exists())
+        self.assertEqual(NormativeSketch.compute_norms(), self.get_rebuilt_norms())
+
+        # Delete a subject (its sketches are removed with it)
+        subject_id = self.subjects['HC004'].pk
+        with mock.patch.object(NormativeSketch, 'schedule_update'):
+            self.subjects['HC004'].delete()
+        NormativeSketch.update_subjects({subject_id: None})
+        self.assertEqual(NormativeSketch.compute_norms(), self.get_rebuilt_norms())
+        self.assertEqual(NormativeSketch.compute_norms()[0]['cei'][self.label]['count'], 16)
+
+    @mock.patch.object(NormativeSketch, 'schedule_update')
+    def test_subjects_outside_cohort_are_skipped(self, schedule_update):
+        subject, other = self.subjects['HC000'], self.subjects['PD000']
+
+        # The data of the subject outside the cohort is not scheduled
+        for session in other.examination_sessions.all():
+            session.save()
+            DATA_TO_MODEL_CLASS_MAPPING['cei'].get_session_data(session).save()
+        other.save()
+        schedule_update.assert_not_called()
+
+        # The data of the subject in the cohort is scheduled
+        DATA_TO_MODEL_CLASS_MAPPING['cei'].get_session_data(subject.examination_sessions.first()).save()
+        schedule_update.assert_called_once_with(subject.pk, ['cei'])
+
+    def test_sketch_without_stratum_is_unique(self):
+        subject = self.subjects['HC000']
+        NormativeSketch.objects.create(subject=subject, modality='cei', stratum=None)
+        NormativeCohortSketch.objects.create(modality='cei', stratum=None)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            NormativeSketch.objects.create(subject=subject, modality='cei', stratum=None)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            NormativeCohortSketch.objects.create(modality='cei', stratum=None)
+
+
+class CompareWithNormTests(SimpleTestCase):
+    """Tests of the comparison of the feature values with the norm"""
+
+    def test_compare_with_norm(self):
+        values = [12, 5, 0, numpy.nan, 8]
+        medians = [10, 10, 0, 10, 10]
+        iqrs = [2 * IQR_TO_STD, 0, 1, 1, IQR_TO_STD]
+
+        differences, z_scores, ranks = compare_with_norm(values, medians, iqrs)
+
+        # Differences from the medians [%] (not comparable with the zero median or the missing value)
+        numpy.testing.assert_allclose(differences, [20, 50, numpy.nan, numpy.nan, 20])
+
+        # Z-scores against the IQRs (not comparable with the zero IQR or the missing value)
+        numpy.testing.assert_allclose(z_scores, [1, numpy.nan, 0, numpy.nan, -2])
+
+        # Ranks by the difference (ties in the feature order, 0 if not comparable)
+        numpy.testing.assert_array_equal(ranks, [2, 1, 0, 0, 3])
+
+    def test_no_features(self):
+        differences, z_scores, ranks = compare_with_norm([], [], [])
+        self.assertEqual((len(differences), len(z_scores), len(ranks)), (0, 0, 0))
@@ -2,6 +2,7 @@ from django.urls import path
 from .views import (
     SubjectListView,
     SubjectCohortImportView,
+    SubjectImportJobDetailView,
     SubjectCreateView,
     SubjectDetailView,
     SubjectUpdateView,
@@ -20,6 +21,8 @@ from .views import (
     SessionDataCEIDetailView,
     SessionDataCEIUpdateView,
     create_session,
+    get_import_job_status,
+    get_predictor_status,
     export_acoustic_data,
     export_actigraphy_data,
     export_handwriting_data,
@@ -42,6 +45,9 @@ urlpatterns = [
     # Subjects
     path('create/', SubjectCreateView.as_view(), name='subject_create'),
     path('import/', SubjectCohortImportView.as_view(), name='subject_import_cohort'),
+    path('import/<int:pk>/', SubjectImportJobDetailView.as_view(), name='subject_import_job'),
+    path('import/<int:pk>/status/', get_import_job_status, name='subject_import_job_status'),
+    path('predictor/status/', get_predictor_status, name='predictor_status'),
     path('<str:code>/', SubjectDetailView.as_view(), name='subject_detail'),
     path('<str:code>/update/', SubjectUpdateView.as_view(), name='subject_update'),
     path('<str:code>/delete/', SubjectDeleteView.as_view(), name='subject_delete'),
@@ -1,5 +1,6 @@
 import logging
-from django.http import HttpResponseRedirect
+import numpy as np
+from django.http import HttpResponseRedirect, JsonResponse, Http404
 from django.shortcuts import reverse, redirect
 from django.conf import settings
 from django.core.paginator import Paginator
@@ -12,6 +13,8 @@ from visualizer.subject import visualize_evolution_of_predictions
 from visualizer.modalities import visualize_most_differentiating_features
 from reporter.subject import create_report as create_subject_report
 from reporter.session import create_report as session_subject_report
+from predictor.breaker import predictor_breaker
+from predictor.client import LBDPredictorApiClient, LBDPredictorLocalClient
 from .views_io import import_subjects_from_external_source
 from .views_predictors import SubjectLBDPredictor, ExaminationSessionLBDPredictor
 from .models_io import export_data, export_report
@@ -20,6 +23,8 @@ from .models_formatters import FeaturesFormatter
 from .models import (
     Subject,
     ExaminationSession,
+    ImportJob,
+    NormativeData,
     DataAcoustic,
     DataActigraphy,
     DataHandwriting,
@@ -105,16 +110,11 @@ class SubjectListView(LoginRequiredMixin, generic.ListView):
     def get_queryset(self):
         """Gets the queryset to be returned"""
 
-        # Get the non-filtered queryset (no search applied over the subjects)
-        if not self.request.GET.get('q'):
-            return Subject.get_subjects(self.request.user.organization, order_by=('code',))
-
-        # Get the filtered queryset
-        else:
-            return Subject.get_subjects_filtered(
-                organization=self.request.user.organization,
-                search_phrase=self.request.GET.get('q'),
-                order_by=('code',))
+        # Get the queryset (annotated with the number of sessions and prefetched latest sessions)
+        return Subject.get_subjects_with_latest_sessions(
+            organization=self.request.user.organization,
+            search_phrase=self.request.GET.get('q'),
+            order_by=('code',))
 
     def get_context_data(self, **kwargs):
         """Enriches the context with additional data"""
@@ -126,13 +126,18 @@ class SubjectListView(LoginRequiredMixin, generic.ListView):
         if self.request.GET.get('q'):
             context.update({'q': self.request.GET.get('q')})
 
-        # Add the session information
-        for subject in context.get(self.context_object_name):
-            subject.num_sessions = ExaminationSession.get_sessions(subject=subject).count()
+        # Get the LBD probability for each subject in the list (single batched prediction)
+        subjects = context.get(self.context_object_name)
+        probabilities = SubjectLBDPredictor.predict_lbd_probability_many(self.request.user, subjects)
+        for subject, lbd_probability in zip(subjects, probabilities):
+            subject.lbd_probability = lbd_probability
 
-        # Get the LBD probability for each subject in the list
-        for subject in context.get(self.context_object_name):
-            subject.lbd_probability = SubjectLBDPredictor.predict_lbd_probability(self.request.user, subject)
+        # Mark the LBD probabilities that are still being precomputed
+        pending = ExaminationSessionLBDPredictor.get_pending_session_ids(
+            [subject.get_latest_session() for subject in subjects if subject.lbd_probability is None])
+        for subject in subjects:
+            subject.lbd_probability_pending = subject.lbd_probability is None and \
+                getattr(subject.get_latest_session(), 'id', None) in pending
 
         # Return the updated context
         return context
@@ -152,7 +157,12 @@ class SubjectCohortImportView(LoginRequiredMixin, UserPassesTestMixin, generic.F
         return self.request.user.power_user
 
     def form_valid(self, form):
-        """Form valid hook: imports the subjects"""
+        """Form valid hook: imports the subjects (or creates an import job for the import worker)"""
+
+        # Store the upload and create an import job (processed by the import worker)
+        if settings.IMPORT_CONFIGURATION.get('use_import_worker'):
+            job = ImportJob.objects.create(user=self.request.user, file=form.cleaned_data['file'])
+            return redirect('subjects:subject_import_job', pk=job.pk)
 
         # Import the subjects
         import_subjects_from_external_source(self.request.user, form)
@@ -165,6 +175,24 @@ class SubjectCohortImportView(LoginRequiredMixin, UserPassesTestMixin, generic.F
         return reverse_lazy('subjects:subject_list')
 
 
+class SubjectImportJobDetailView(LoginRequiredMixin, UserPassesTestMixin, generic.DetailView):
+    """Class implementing subject cohort import job detail view"""
+
+    # Define the template name
+    template_name = 'subjects/subject_import_job.html'
+
+    # Define the context object name
+    context_object_name = 'job'
+
+    def test_func(self):
+        """Test function to determine if a user can use the view"""
+        return self.request.user.power_user
+
+    def get_queryset(self):
+        """Returns the import jobs of the user"""
+        return ImportJob.objects.filter(user=self.request.user)
+
+
 class SubjectDetailView(LoginRequiredMixin, generic.DetailView):
     """Class implementing subject detail view"""
 
@@ -200,8 +228,12 @@ class SubjectDetailView(LoginRequiredMixin, generic.DetailView):
             self.object.lbd_probability = lbd_probability
 
             # Add the prediction to the context
-            if lbd_probability:
+            if lbd_probability is not None:
                 context.update({'prediction': lbd_probability})
+            else:
+                latest_session = self.object.get_latest_session()
+                pending = ExaminationSessionLBDPredictor.get_pending_session_ids([latest_session])
+                context.update({'prediction_pending': latest_session.id in pending})
 
         # Add the visualization of the predicted LBD probability to the context
         context.update({'plot_div': visualize_evolution_of_predictions(self.request.user, self.object)})
@@ -362,8 +394,11 @@ class SessionDetailView(LoginRequiredMixin, generic.DetailView):
         lbd_probability = ExaminationSessionLBDPredictor.predict_lbd_probability(self.request.user, self.object)
 
         # Add the prediction
-        if lbd_probability:
+        if lbd_probability is not None:
             context.update({'prediction': lbd_probability})
+        else:
+            pending = ExaminationSessionLBDPredictor.get_pending_session_ids([self.object])
+            context.update({'prediction_pending': self.object.id in pending})
 
         # Return the updated context
         return context
@@ -393,8 +428,8 @@ class SessionDataDetailViewTemplate(LoginRequiredMixin, generic.DetailView):
     paginate_by = 15
 
     @classmethod
-    def get_norms(cls):
-        return getattr(settings, 'NORM_CONFIGURATION')[cls.modality]
+    def get_norm_table(cls):
+        return NormativeData.get_table(cls.modality)
 
     @classmethod
     def get_presentation(cls):
@@ -421,17 +456,22 @@ class SessionDataDetailViewTemplate(LoginRequiredMixin, generic.DetailView):
             presentable_data = None
             computable_data = None
 
+        # Get the normative data (of the stratum of the subject)
+        norm_table = self.get_norm_table()
+        stratum = NormativeData.get_stratum(self.object)
+
         # Compute the comparison with the normative data
-        if computable_data:
-            comparison = compute_difference_from_norm(computable_data, self.get_norms(), modality=self.modality)
-            comparison = {c['feature']: c for c in comparison}
+        comparison = None
+        if computable_data and norm_table:
+            comparison = compute_difference_from_norm(computable_data, norm_table, stratum)
 
             for feature in presentable_data:
-                if feature[FeaturesFormatter.FEATURE_LABEL_FIELD] in comparison:
-                    norm = comparison[feature[FeaturesFormatter.FEATURE_LABEL_FIELD]]['norm value']
-                    diff = comparison[feature[FeaturesFormatter.FEATURE_LABEL_FIELD]]['difference']
-                    norm = round(float(norm), 4) if norm is not None else ''
-                    diff = round(float(diff), 4) if diff is not None else ''
+                index = comparison['index'].get(feature[FeaturesFormatter.FEATURE_LABEL_FIELD])
+                if index is not None:
+                    norm = comparison['norm value'][index]
+                    diff = comparison['difference'][index]
+                    norm = round(float(norm), 4) if np.isfinite(norm) else ''
+                    diff = round(float(diff), 4) if np.isfinite(diff) else ''
                     feature.update({'norm': norm, 'diff': diff})
 
         # Convert the numerical data into strings of fixed number of decimal places (for better UX)
@@ -464,11 +504,10 @@ class SessionDataDetailViewTemplate(LoginRequiredMixin, generic.DetailView):
             })
 
         # Add the visualization of the most discriminating features to the context
-        if computable_data:
+        if comparison:
             context.update({
                 'plot_div': visualize_most_differentiating_features(
-                    session_data=computable_data,
-                    norm_data=self.get_norms(),
+                    comparison=comparison,
                     modality=self.modality)
             })
 
@@ -749,6 +788,51 @@ def export_cei_data(request, code, session_number):
     return export_data(request, code, session_number, model=DataCEI)
 
 
+@login_required(login_url='/login')
+def get_import_job_status(request, pk):
+    """
+    Gets the progress of the subject cohort import job.
+
+    :param request: HTTP request
+    :type request: Request
+    :param pk: ID of the import job
+    :type pk: int
+    :return: JSON response with the progress of the import job
+    :rtype: JsonResponse
+    """
+
+    # Fetch the import job of the user or raise 404 error if non-existent
+    job = ImportJob.objects.filter(pk=pk, user=request.user).first()
+    if not job or not request.user.power_user:
+        raise Http404('Import job not found')
+
+    # Return the progress
+    return JsonResponse(job.get_progress())
+
+
+@login_required(login_url='/login')
+def get_predictor_status(request):
+    """
+    Gets the status of the predictor (circuit breaker, API client pool and loaded models) for monitoring.
+
+    :param request: HTTP request
+    :type request: Request
+    :return: JSON response with the status of the predictor
+    :rtype: JsonResponse
+    """
+
+    # Validate the access to the status
+    if not request.user.power_user:
+        raise Http404('Predictor status not found')
+
+    # Return the status
+    return JsonResponse({
+        'breaker': predictor_breaker.get_statistics(),
+        'pool': LBDPredictorApiClient.pool.get_statistics(),
+        'models': LBDPredictorLocalClient.registry.get_statistics()
+    })
+
+
 def export_subject_report(request, code):
     """Exports the subject preDLB probability predictions report in a PDF file"""
 
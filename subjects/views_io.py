@@ -1,261 +1,625 @@
 import pandas
+import logging
 from itertools import chain
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
 from django.core.files.base import ContentFile
 from django.conf import settings
 from .models import Subject, ExaminationSession, DATA_TO_MODEL_CLASS_MAPPING
 from .models_formatters import FeaturesFormatter
-from .models_io import open_excel_file
+from .models_signals import invalidate_cached_lbd_predictions, update_normative_data
+from .models_io import read_sheets_from_excel
 from .views_io_utils import parse_sex, parse_year, parse_date
 
 
 # Import configuration
 import_configuration = getattr(settings, 'IMPORT_CONFIGURATION')
 
+# Get the module-level logger instance
+logger = logging.getLogger(__name__)
 
-def import_session_data(user, subject, session_number, session_prefix, identity_data, features_data):
+# Define the batch size of the bulk operations
+BULK_BATCH_SIZE = 500
+
+# Define the imported fields of the subjects and the examination sessions (written via the bulk updates)
+SUBJECT_FIELDS = ['year_of_birth', 'sex', 'updated_on']
+SESSION_FIELDS = ['internal_prefix', 'examined_on', 'updated_on']
+
+
+def prepare_subject(user, subject_code, identity_data, subject=None):
     """
-    Imports the session from the data provided from the external source.
+    Prepares the subject (new or updated) from the data provided from the external source.
 
     :param user: logged-in user
     :type user: User instance
+    :param subject_code: code of the subject
+    :type subject_code: str
+    :param identity_data: data for the identity of the subject
+    :type identity_data: pandas.Series
+    :param subject: existing subject
+    :type subject: Subject instance, optional
+    :return: (subject, changed flag)
+    :rtype: tuple
+    """
+
+    # Prepare the fields
+    fields = {
+        'code': subject_code,
+        'sex': parse_sex(identity_data['Sex']),
+        'year_of_birth': parse_year(identity_data['Date of birth'])
+    }
+
+    # Create the subject
+    if not subject:
+        return Subject(organization=user.organization, **fields), True
+
+    # Update the subject
+    changed = any(getattr(subject, field) != value for field, value in fields.items())
+    for field, value in fields.items():
+        setattr(subject, field, value)
+
+    # Return the subject
+    return subject, changed
+
+
+def prepare_session(subject, session_number, session_prefix, identity_data, session=None):
+    """
+    Prepares the examination session (new or updated) from the data provided from the external source.
+
     :param subject: subject
     :type subject: Subject instance
     :param session_number: session number
     :type session_number: int
     :param session_prefix: session prefix
     :type session_prefix: str
-    :param identity_data: data for the identity of the subjects
+    :param identity_data: data for the identity of the subject
     :type identity_data: pandas.Series
-    :param features_data: data for the examination sessions and features of the subjects
-    :type features_data: dict with pandas.Series
-    :return: None
-    :rtype: None type
+    :param session: existing examination session
+    :type session: ExaminationSession instance, optional
+    :return: (examination session, changed flag)
+    :rtype: tuple
+    """
+
+    # Get the examination's timestamp
+    field_name = f'{session_prefix} {import_configuration["date_of_examination"]}'
+    field_data = identity_data[field_name] if field_name in identity_data.index else None
+
+    # Prepare the fields
+    fields = {
+        'internal_prefix': session_prefix,
+        'examined_on': parse_date(field_data)
+    }
+
+    # Make the timestamp comparable with the stored one
+    if settings.USE_TZ and fields['examined_on'] and timezone.is_naive(fields['examined_on']):
+        fields['examined_on'] = timezone.make_aware(fields['examined_on'])
+
+    # Create the examination session
+    if not session:
+        return ExaminationSession(subject=subject, session_number=session_number, **fields), True
+
+    # Update the examination session
+    changed = any(getattr(session, field) != value for field, value in fields.items())
+    for field, value in fields.items():
+        setattr(session, field, value)
+
+    # Return the examination session
+    return session, changed
+
+
+def prepare_session_data(model, session, session_prefix, features_data, data=None):
     """
+    Prepares the examination session data (new or updated) from the data provided from the external source.
 
-    # Create/update the examination session
+    :param model: model of the examination session data
+    :type model: child class of CommonExaminationSessionData
+    :param session: examination session
+    :type session: ExaminationSession instance
+    :param session_prefix: session prefix
+    :type session_prefix: str
+    :param features_data: data for the features of the subject (for the given model)
+    :type features_data: pandas.Series (indexed by session prefix and feature)
+    :param data: existing examination session data
+    :type data: child instance of CommonExaminationSessionData, optional
+    :return: (examination session data, changed flag)
+    :rtype: tuple
+    """
+
+    # Get the features for the given examination session (group lookup in the reshaped features data)
     try:
-        session = ExaminationSession.objects.get(subject=subject, session_number=session_number)
-        setattr(session, 'subject', subject)
-        setattr(session, 'session_number', session_number)
-    except ObjectDoesNotExist:
-        session = ExaminationSession(subject=subject, session_number=session_number)
+        s = features_data.xs(session_prefix, level=0)
+    except KeyError:
+        s = pandas.Series([], dtype=object)
 
-    # Update the examination's internal prefix
-    session.internal_prefix = session_prefix
+    # Get features to import (in the order of the configuration)
+    features_to_import = model.CONFIGURATION.get_available_feature_names()
 
-    # Update the examination's timestamp
-    field_name = f'{session_prefix} {import_configuration["date_of_examination"]}'
-    field_data = identity_data[field_name] if field_name in identity_data.index else None
-    session.examined_on = parse_date(field_data)
+    # Prepare the fields
+    fields = s[~s.index.duplicated()].reindex(features_to_import).to_dict()
 
-    # Save the session instance
-    session.save()
+    # Get the features from the session data
+    features = [{
+        FeaturesFormatter.FEATURE_LABEL_FIELD: feature,
+        FeaturesFormatter.FEATURE_VALUE_FIELD: fields[feature]}
+        for feature in features_to_import
+    ]
 
-    # Create/update the examination session data
-    for label in ExaminationSession.EXAMINATION_DATA_SEQUENCE:
+    # Adjust the features
+    features = FeaturesFormatter(model).prepare_computable(features=features)
+    features = FeaturesFormatter.get_features_as_kwargs(features)
 
-        # Get the pandas.DataFrame with the features for the given examination session
-        s = features_data[label]
-        s = {feature: s.loc[feature] for feature in s.index if feature.startswith(session_prefix)}
+    # Prepare the examination session data for the non-serialized features
+    if not model.CONFIGURATION.serialized_features:
+        if not data:
+            return model(examination_session=session, **features), True
 
-        # Get the available features
-        available_features = s.keys()
+        changed = any(getattr(data, label) != value for label, value in features.items())
+        for label, value in features.items():
+            setattr(data, label, value)
+        return data, changed
 
-        # Get the model class from the data to model class mapping
-        model = DATA_TO_MODEL_CLASS_MAPPING[label]
+    # Prepare the examination session data for the serialized features
+    content = pandas.DataFrame([features]).to_csv(index=False, line_terminator='\r')
 
-        # Get features to import (add the examination session prefix)
-        features_to_import = [
-            f'{session_prefix} {feature}'
-            for feature in model.CONFIGURATION.get_available_feature_names()
-        ]
+    # Store the serialized features in the database (typed exactly as if read from the file)
+    if model.CONFIGURATION.features_storage == 'database':
+        features = model.read_features_as_mapping(file=ContentFile(content.encode('utf-8'), name='features.csv'))
 
-        # Prepare the fields
-        fields = {
-            feature: s[feature] if feature in available_features else None
-            for feature in features_to_import
-        }
+        # Skip the examination session data that did not change
+        if data and data.features == features:
+            return data, False
 
-        # Get the features from the session data
-        features = [{
-            FeaturesFormatter.FEATURE_LABEL_FIELD: feature.replace(session_prefix, '').strip(),
-            FeaturesFormatter.FEATURE_VALUE_FIELD: fields[feature]}
-            for feature in features_to_import
-        ]
+        # Store the features
+        data = data if data else model(examination_session=session)
+        setattr(data, model.CONFIGURATION.features_field, features)
+        return data, True
 
-        # Adjust the features
-        features = FeaturesFormatter(model).prepare_computable(features=features)
-        features = FeaturesFormatter.get_features_as_kwargs(features)
+    # Skip the examination session data that did not change
+    if data and read_session_data_file(data) == content.encode('utf-8'):
+        return data, False
 
-        # Prepare the features for the serialized/non-serialized features
-        field, value = None, None
-        if model.CONFIGURATION.serialized_features:
-            field = model.CONFIGURATION.data_field
-            value = ContentFile(pandas.DataFrame([features]).to_csv(index=False, line_terminator='\r'), 'features.csv')
+    # Store the serialized features (and drop the features stored in the database)
+    data = data if data else model(examination_session=session)
+    getattr(data, model.CONFIGURATION.data_field).save('features.csv', ContentFile(content), save=False)
+    setattr(data, model.CONFIGURATION.features_field, None)
 
-        # Create/update the examination session data
-        try:
-            data = model.objects.get(examination_session=session)
-            if model.CONFIGURATION.serialized_features:
-                setattr(data, field, value)
-            else:
-                for feature_label, feature_value in features.items():
-                    setattr(data, feature_label, feature_value)
+    # Return the examination session data
+    return data, True
 
-        except ObjectDoesNotExist:
-            if model.CONFIGURATION.serialized_features:
-                data = model(examination_session=session, **{field: value})
-            else:
-                data = model(examination_session=session, **features)
 
-        # Save the data instance
-        data.save()
+def read_session_data_file(data):
+    """Reads the raw content of the serialized features of the examination session data (None if not readable)"""
+    try:
+        with getattr(data, data.CONFIGURATION.data_field).open('rb') as f:
+            return f.read()
+    except (OSError, ValueError):
+        return None
 
 
-def import_sessions_data(user, subject, identity_data, features_data):
+def get_session_prefixes(features_data):
     """
-    Imports the sessions from the data provided from the external source.
+    Gets the session prefixes of the examination sessions present in the data from the external source.
 
-    :param user: logged-in user
-    :type user: User instance
-    :param subject: subject
-    :type subject: Subject instance
-    :param identity_data: data for the identity of the subjects
-    :type identity_data: pandas.Series
-    :param features_data: data for the examination sessions and features of the subjects
-    :type features_data: dict with pandas.Series
-    :return: None
-    :rtype: None type
+    :param features_data: data for the examination sessions and features of the subject
+    :type features_data: dict with pandas.Series (indexed by session prefix and feature)
+    :return: session prefixes (in the order of the examination sessions)
+    :rtype: list
     """
 
-    # Get the subject feature names
-    feature_names = list(set(chain.from_iterable(s.dropna().index.tolist() for s in features_data.values())))
+    # Get the session prefixes with any filled feature
+    available_prefixes = set(chain.from_iterable(
+        s.dropna().index.get_level_values(0)
+        for s in features_data.values()
+        if not s.empty))
+
+    # Return the session prefixes (before sessions and normal sessions)
+    return [
+        session_prefix
+        for session_prefix in get_configured_session_prefixes()
+        if session_prefix in available_prefixes
+    ]
 
-    # Get the session information (before session and normal sessions)
-    before_sessions = import_configuration.get('before_sessions', [])
-    normal_sessions = import_configuration.get('normal_sessions', [])
-    if not any((before_sessions, normal_sessions)):
-        return
 
-    # Prepare the session iterator
-    session_iterator = []
+def get_configured_session_prefixes():
+    """Gets the configured session prefixes (before sessions and normal sessions)"""
+    return import_configuration.get('before_sessions', []) + import_configuration.get('normal_sessions', [])
 
-    # Fill the session iterator
-    for s in before_sessions:
-        if any(True if c.startswith(s) else False for c in feature_names):
-            session_iterator.append(s)
-    for s in normal_sessions:
-        if any(True if c.startswith(s) else False for c in feature_names):
-            session_iterator.append(s)
 
-    # Import the sessions
-    for session_number, session_prefix in enumerate(session_iterator, 1):
-        import_session_data(user, subject, session_number, session_prefix, identity_data, features_data)
+def reshape_features_data(df):
+    """
+    Reshapes the features data from the external source (columns: '<session prefix> <feature>') into
+    the data with the (session prefix, feature) columns. The columns without a configured session
+    prefix are dropped.
+
+    :param df: data for the examination sessions and features of the subjects
+    :type df: pandas.DataFrame
+    :return: reshaped data
+    :rtype: pandas.DataFrame
+    """
+
+    # Split the columns into the session prefixes and the features (vectorized)
+    columns = df.columns.astype(str).str.extract(r'^\s*(\[[^\]]*\])\s*(.*?)\s*$')
+    mask = columns[0].isin(get_configured_session_prefixes()).to_numpy()
+
+    # Return the reshaped data
+    df = df.loc[:, mask]
+    df.columns = pandas.MultiIndex.from_arrays([columns[0][mask], columns[1][mask]], names=['session', 'feature'])
+    return df
 
 
-def import_subject_data(user, subject_code, df_identity, df_features):
+def get_subject_data(subject_code, df_identity, df_features):
     """
-    Imports the subject from the data provided from the external source.
+    Gets the data of the subject from the data provided from the external source.
 
-    :param user: logged-in user
-    :type user: User instance
     :param subject_code: code of the subject
     :type subject_code: str
     :param df_identity: data for the identity of the subjects
     :type df_identity: pandas.DataFrame
-    :param df_features: data for the examination sessions and features of the subjects
+    :param df_features: data for the examination sessions and features of the subjects (reshaped)
     :type df_features: dict with pandas.Dataframes
-    :return: None
-    :rtype: None type
+    :return: (identity data, features data)
+    :rtype: tuple
     """
 
     # Get the subject's data
     identity_data = df_identity.loc[subject_code]
     features_data = {
-        k: (v.loc[subject_code] if subject_code in v.index else pandas.Series([]))
+        k: (v.loc[subject_code] if subject_code in v.index else pandas.Series([], index=v.columns[:0], dtype=object))
         for k, v in df_features.items()
     }
 
-    # Prepare the fields
-    fields = {
-        'code': subject_code,
-        'sex': parse_sex(identity_data['Sex']),
-        'year_of_birth': parse_year(identity_data['Date of birth'])
-    }
+    # Return the subject's data
+    return identity_data, features_data
 
-    # Create/update the subject
-    try:
-        subject = Subject.objects.get(code=fields['code'])
-        setattr(subject, 'year_of_birth', fields['year_of_birth'])
-        setattr(subject, 'sex', fields['sex'])
-    except ObjectDoesNotExist:
-        subject = Subject(organization=user.organization, **fields)
 
-    # Save the subject instance
-    subject.save()
+def get_fields(instance, fields):
+    """Gets the fields of the model instance (e.g. to be restored later)"""
+    return {field: getattr(instance, field) for field in fields}
 
-    # Import the sessions
-    import_sessions_data(user, subject, identity_data, features_data)
 
+def rollback_subjects(subjects, created_subjects, originals, sessions, session_originals):
+    """
+    Rolls back the written records of the subjects that failed to be imported (the created subjects and
+    examination sessions are deleted, the updated ones are restored).
+
+    :param subjects: subjects to be rolled back
+    :type subjects: list of Subject instances
+    :param created_subjects: codes of the subjects created by the import
+    :type created_subjects: set
+    :param originals: original fields of the existing subjects ({code: {field: value}})
+    :type originals: dict
+    :param sessions: examination sessions of the subjects
+    :type sessions: list of ExaminationSession instances
+    :param session_originals: original fields of the existing sessions ({(subject ID, session number): {...}})
+    :type session_originals: dict
+    :return: None
+    :rtype: None type
+    """
 
-def import_subjects_data(user, df_identity, df_features):
+    # Delete the created examination sessions and subjects
+    ExaminationSession.objects.filter(pk__in=[
+        session.pk for session in sessions
+        if (session.subject_id, session.session_number) not in session_originals
+    ]).delete()
+    Subject.objects.filter(pk__in=[subject.pk for subject in subjects if subject.code in created_subjects]).delete()
+
+    # Restore the updated examination sessions and subjects
+    restored = []
+    for session in sessions:
+        if (session.subject_id, session.session_number) in session_originals:
+            for field, value in session_originals[(session.subject_id, session.session_number)].items():
+                setattr(session, field, value)
+            restored.append(session)
+    ExaminationSession.objects.bulk_update(restored, SESSION_FIELDS, batch_size=BULK_BATCH_SIZE)
+
+    restored = []
+    for subject in subjects:
+        if subject.code in originals:
+            for field, value in originals[subject.code].items():
+                setattr(subject, field, value)
+            restored.append(subject)
+    Subject.objects.bulk_update(restored, SUBJECT_FIELDS, batch_size=BULK_BATCH_SIZE)
+
+
+def import_subjects_data(user, df_identity, df_features, progress=None):
     """
     Imports the subjects from the data provided from the external source.
 
+    The import is diffed against the existing records, and only the new/changed records are written
+    via the bulk operations (inside a single transaction). The model signals are not sent; instead,
+    the cached LBD predictions are invalidated in a single batch after the transaction is committed.
+
     :param user: logged-in user
     :type user: User instance
     :param df_identity: data for the identity of the subjects
     :type df_identity: pandas.DataFrame
     :param df_features: data for the examination sessions and features of the subjects
     :type df_features: dict with pandas.Dataframes
-    :return: None
-    :rtype: None type
+    :param progress: progress callback called as progress(subjects done, subjects total, errors per subject)
+    :type progress: callable, optional
+    :return: errors per subject (the subjects with errors are skipped, i.e. their written records are rolled
+             back)
+    :rtype: dict
     """
 
     # Get the list of subjects
-    subjects = list(set(code for code in df_identity.index if code and isinstance(code, str)))
+    codes = sorted(set(code for code in df_identity.index if code and isinstance(code, str)))
+    if not codes:
+        return {}
 
-    # Import the sessions for every subject
-    for code in subjects:
-        import_subject_data(user, code, df_identity, df_features)
+    # Prepare the errors per subject
+    errors = {}
 
+    # Reshape the features data (the session prefixes are split from the features once per sheet)
+    df_features = {label: reshape_features_data(df) for label, df in df_features.items()}
 
-def import_subjects_from_external_source(user, form):
-    """Imports the subjects with the data from the external file"""
+    # Prepare the progress reporting
+    def report(done):
+        if progress:
+            progress(done, len(codes), errors)
 
-    # Get the file from the uploaded form
-    file = form.cleaned_data['file']
+    # Get the subjects' data
+    subjects_data = {}
+    for code in codes:
+        try:
+            subjects_data[code] = get_subject_data(code, df_identity, df_features)
+        except Exception as e:
+            errors[code] = f'{type(e).__name__}: {e}'
 
-    with open_excel_file(file=file, path=None) as f:
+    # Report the start of the import
+    report(0)
+
+    with transaction.atomic():
+        timestamp = timezone.now()
+
+        # --
+        # 1. subjects
+        # --
+
+        # Get the existing subjects (and keep their original fields to be restored on failure)
+        subjects = {subject.code: subject for subject in Subject.objects.filter(code__in=subjects_data.keys())}
+        originals = {code: get_fields(subject, SUBJECT_FIELDS) for code, subject in subjects.items()}
+
+        # Prepare the subjects
+        created, updated = [], []
+        for code in list(subjects_data.keys()):
+            try:
+                subject, changed = prepare_subject(user, code, subjects_data[code][0], subject=subjects.get(code))
+            except Exception as e:
+                errors[code] = f'{type(e).__name__}: {e}'
+                del subjects_data[code]
+                continue
+            if not subject.pk:
+                created.append(subject)
+            elif changed:
+                subject.updated_on = timestamp
+                updated.append(subject)
+
+        # Create/update the subjects (and get the subjects with the primary keys)
+        Subject.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        Subject.objects.bulk_update(updated, SUBJECT_FIELDS, batch_size=BULK_BATCH_SIZE)
+        created_subjects = {subject.code for subject in created}
+        subjects = {subject.code: subject for subject in Subject.objects.filter(code__in=subjects_data.keys())}
+
+        # Get the updated subjects (their predictions are to be invalidated)
+        invalidated_subjects = [subjects[subject.code] for subject in updated]
+
+        # --
+        # 2. examination sessions
+        # --
+
+        # Get the existing examination sessions (and keep their original fields to be restored on failure)
+        sessions = {
+            (session.subject_id, session.session_number): session
+            for session in ExaminationSession.objects.filter(subject__in=subjects.values())
+        }
+        session_originals = {key: get_fields(session, SESSION_FIELDS) for key, session in sessions.items()}
+
+        # Prepare the examination sessions (and remember the session prefixes per subject)
+        created, updated, imported, failed = [], [], {}, set()
+        for code in list(subjects_data.keys()):
+            subject = subjects[code]
+            identity_data, features_data = subjects_data[code]
 
-        # Read the identities of the subjects
-        try:
-            df_identity = pandas.read_excel(
-                io=f,
-                sheet_name=import_configuration['identity_sheet'],
-                index_col=import_configuration['index_column'],
-                skiprows=import_configuration['skip_rows'])
-        except ValueError:
-            return
-
-        # Prepare the dict of pandas.DataFrames for features
-        df_features = {}
-
-        # Read the examination sessions and features
-        for feature_sheet in import_configuration['feature_sheets']:
             try:
-                data = pandas.read_excel(
-                    io=f,
-                    sheet_name=feature_sheet,
-                    index_col=import_configuration['index_column'],
-                    skiprows=import_configuration['skip_rows'])
-            except ValueError:
+                prepared = [
+                    prepare_session(
+                        subject,
+                        session_number,
+                        session_prefix,
+                        identity_data,
+                        session=sessions.get((subject.pk, session_number))) + (session_number, session_prefix)
+                    for session_number, session_prefix in enumerate(get_session_prefixes(features_data), 1)
+                ]
+            except Exception as e:
+                errors[code] = f'{type(e).__name__}: {e}'
+                del subjects_data[code]
+                failed.add(code)
                 continue
 
-            if not data.empty:
-                df_features[import_configuration['feature_sheets_mapping'][feature_sheet]] = data
+            for session, changed, session_number, session_prefix in prepared:
+                if not session.pk:
+                    created.append(session)
+                elif changed:
+                    session.updated_on = timestamp
+                    updated.append(session)
+            imported[code] = [(session_number, session_prefix) for _, _, session_number, session_prefix in prepared]
+
+        # Create/update the examination sessions (and get the sessions with the primary keys)
+        ExaminationSession.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        ExaminationSession.objects.bulk_update(updated, SESSION_FIELDS, batch_size=BULK_BATCH_SIZE)
+        sessions = {
+            (session.subject_id, session.session_number): session
+            for session in ExaminationSession.objects.filter(subject__in=subjects.values()).select_related('subject')
+        }
+
+        # Get the updated examination sessions (their normative strata might have changed)
+        restratified_sessions = [sessions[(session.subject_id, session.session_number)] for session in updated]
+
+        # --
+        # 3. examination session data
+        # --
+
+        # Get the models of the examination session data to be imported
+        models = {
+            label: DATA_TO_MODEL_CLASS_MAPPING[label]
+            for label in ExaminationSession.EXAMINATION_DATA_SEQUENCE
+            if label in df_features
+        }
+
+        # Get the existing examination session data
+        existing = {
+            label: {
+                data.examination_session_id: data
+                for data in model.objects.filter(examination_session__in=sessions.values())
+            }
+            for label, model in models.items()
+        }
+
+        # Prepare the examination session data (and the sessions whose predictions are to be invalidated)
+        created = {label: [] for label in models}
+        updated = {label: [] for label in models}
+        invalidated_sessions = {}
+
+        for done, code in enumerate(imported, 1):
+            try:
+                prepared = []
+                for session_number, session_prefix in imported[code]:
+                    session = sessions[(subjects[code].pk, session_number)]
+                    for label, model in models.items():
+                        data, changed = prepare_session_data(
+                            model,
+                            session,
+                            session_prefix,
+                            subjects_data[code][1][label],
+                            data=existing[label].get(session.pk))
+                        prepared.append((label, session, data, changed))
+            except Exception as e:
+                errors[code] = f'{type(e).__name__}: {e}'
+                failed.add(code)
+                report(done)
+                continue
+
+            for label, session, data, changed in prepared:
+                if session.pk not in existing[label]:
+                    created[label].append(data)
+                elif changed:
+                    updated[label].append(data)
+                if changed:
+                    invalidated_sessions[session.pk] = session
+
+            # Report the progress
+            report(done)
+
+        # Roll back the subjects that failed after they were written (no partially imported subjects)
+        if failed:
+            rollback_subjects(
+                [subjects[code] for code in failed],
+                created_subjects,
+                originals,
+                [session for session in sessions.values() if session.subject.code in failed],
+                session_originals)
+            subjects = {code: subject for code, subject in subjects.items() if code not in failed}
+            invalidated_subjects = [subject for subject in invalidated_subjects if subject.code not in failed]
+            restratified_sessions = [session for session in restratified_sessions if session.subject.code not in failed]
+
+        # Create/update the examination session data
+        for label, model in models.items():
+            if model.CONFIGURATION.serialized_features and model.CONFIGURATION.features_storage == 'database':
+                fields = [model.CONFIGURATION.features_field]
+            elif model.CONFIGURATION.serialized_features:
+                fields = [model.CONFIGURATION.data_field, model.CONFIGURATION.features_field]
+            else:
+                fields = model.CONFIGURATION.get_available_feature_names()
+
+            model.objects.bulk_create(created[label], batch_size=BULK_BATCH_SIZE)
+            model.objects.bulk_update(updated[label], fields, batch_size=BULK_BATCH_SIZE)
+
+        # --
+        # 4. last examined on (of the subjects)
+        # --
+
+        # Get the timestamps of the latest examination sessions
+        last_examined_on = dict(
+            ExaminationSession.objects
+            .filter(subject__in=subjects.values())
+            .values('subject')
+            .annotate(last_examined_on=Max('examined_on'))
+            .values_list('subject', 'last_examined_on'))
+
+        # Update the subjects
+        updated = []
+        for subject in subjects.values():
+            if last_examined_on.get(subject.pk) and subject.last_examined_on != last_examined_on[subject.pk]:
+                subject.last_examined_on = last_examined_on[subject.pk]
+                updated.append(subject)
+
+        Subject.objects.bulk_update(updated, ['last_examined_on'], batch_size=BULK_BATCH_SIZE)
+
+        # --
+        # 5. invalidate the cached LBD predictions and update the normative data (single batch after the commit)
+        # --
+
+        transaction.on_commit(lambda: invalidate_cached_lbd_predictions(
+            subjects=invalidated_subjects,
+            sessions=invalidated_sessions.values()))
+        transaction.on_commit(lambda: update_normative_data(
+            subjects=invalidated_subjects,
+            sessions=list(invalidated_sessions.values()) + restratified_sessions))
+
+    # Report the end of the import
+    report(len(codes))
+
+    # Return the errors per subject
+    return errors
+
+
+def import_subjects_from_external_source(user, form):
+    """Imports the subjects with the data from the external file"""
+    return import_subjects_from_file(user, form.cleaned_data['file'])
+
+
+def import_subjects_from_file(user, file, progress=None):
+    """
+    Imports the subjects with the data from the external file.
+
+    :param user: logged-in user
+    :type user: User instance
+    :param file: uploaded/stored file with the data of the subjects
+    :type file: File
+    :param progress: progress callback (see import_subjects_data)
+    :type progress: callable, optional
+    :return: errors per subject
+    :rtype: dict
+    """
+
+    # Read the identity and feature sheets (the workbook is parsed once)
+    sheets, timings = read_sheets_from_excel(
+        file=file,
+        sheet_names=[import_configuration['identity_sheet']] + import_configuration['feature_sheets'],
+        index_col=import_configuration['index_column'],
+        skiprows=import_configuration['skip_rows'])
+
+    # Log the parse timings
+    logger.info('Parsed the workbook %s: %s', getattr(file, 'name', file), ', '.join(
+        f'{sheet_name}: {timing:.3f}s' for sheet_name, timing in timings.items()))
+
+    # Get the identities of the subjects
+    df_identity = sheets.get(import_configuration['identity_sheet'])
+    if df_identity is None:
+        return {}
+
+    # Get the dict of pandas.DataFrames for features (examination sessions and features)
+    df_features = {
+        import_configuration['feature_sheets_mapping'][feature_sheet]: sheets[feature_sheet]
+        for feature_sheet in import_configuration['feature_sheets']
+        if feature_sheet in sheets and not sheets[feature_sheet].empty
+    }
+
+    # Import the subjects with the data (examination sessions and data)
+    if df_features:
+        return import_subjects_data(user, df_identity, df_features, progress=progress)
 
-        # Import the subjects with the data (examination sessions and data)
-        if df_features:
-            import_subjects_data(user, df_identity, df_features)
+    # Return no errors (nothing imported)
+    return {}
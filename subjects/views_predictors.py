@@ -1,8 +1,16 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connections
 from django.conf import settings
-from predictor import predict_lbd_probability
-from predictor.processors import process_features
-from .models import ExaminationSession
-from .models_cache import SubjectCache, ExaminationSessionCache
+from predictor import predict_lbd_probability, predict_lbd_probabilities
+from predictor.breaker import predictor_breaker
+from predictor.processors import process_features, hash_features
+from .models import PredictionJob
+from .models_cache import SubjectCache, ExaminationSessionCache, PredictionCache
+
+
+# Get the module-level logger instance
+logger = logging.getLogger(__name__)
 
 
 class BaseLBDPredictor(object):
@@ -11,6 +19,9 @@ class BaseLBDPredictor(object):
     # Define the predictor model identifier
     predictor = getattr(settings, 'PREDICTOR_CONFIGURATION')['model_identifier']
 
+    # Define the precomputation of the predictions (computed by the prediction worker, not on request)
+    precomputed = getattr(settings, 'PREDICTOR_CONFIGURATION').get('use_prediction_worker', False) is True
+
     @classmethod
     def predict_lbd_probability(cls, user, instance):
         """
@@ -25,6 +36,20 @@ class BaseLBDPredictor(object):
         """
         return None
 
+    @classmethod
+    def predict_lbd_probability_many(cls, user, instances):
+        """
+        Predicts the LBD probabilities for multiple model instances.
+
+        :param user: logged-in user
+        :type user: User instance
+        :param instances: model instances
+        :param instances: iterable of objects
+        :return: predicted LBD probabilities (in the order of the instances)
+        :rtype: list
+        """
+        return [cls.predict_lbd_probability(user, instance) for instance in instances]
+
 
 class SubjectLBDPredictor(BaseLBDPredictor):
     """Class implementing the LBD predictor for subjects"""
@@ -39,11 +64,8 @@ class SubjectLBDPredictor(BaseLBDPredictor):
         # Prepare the model cache instance
         cache_instance = cls.model_cache(instance)
 
-        # Get the examination sessions of a subject (order from newest to oldest)
-        sessions = ExaminationSession.get_sessions(subject=instance, order_by=('-session_number', ))
-
         # Get the latest examination session
-        latest_session = sessions.first()
+        latest_session = instance.get_latest_session()
         if not latest_session:
             return None
 
@@ -57,6 +79,38 @@ class SubjectLBDPredictor(BaseLBDPredictor):
         # Predict the LBD probability
         return lbd_probability
 
+    @classmethod
+    def predict_lbd_probability_many(cls, user, instances):
+        """Predicts the LBD probabilities for multiple subject instances (single predictor call)"""
+
+        # Get the latest examination session of every subject
+        instances = list(instances)
+        latest_sessions = [instance.get_latest_session() for instance in instances]
+
+        # Get the LBD probabilities for the latest examination sessions
+        sessions = [session for session in latest_sessions if session]
+        predicted = dict(zip(
+            [session.id for session in sessions],
+            ExaminationSessionLBDPredictor.predict_lbd_probability_many(user, sessions)))
+
+        # Prepare the LBD probabilities of the subjects
+        probabilities = [
+            predicted.get(session.id) if session else None
+            for session in latest_sessions
+        ]
+
+        # Cache the predicted LBD probabilities (if not None; single cache round trip)
+        cached = [
+            (instance, lbd_probability)
+            for instance, lbd_probability in zip(instances, probabilities)
+            if lbd_probability is not None
+        ]
+        if cached:
+            cls.model_cache.set_many_cached_lbd_probabilities(*zip(*cached))
+
+        # Return the predicted LBD probabilities
+        return probabilities
+
 
 class ExaminationSessionLBDPredictor(BaseLBDPredictor):
     """Class implementing the LBD predictor for examination sessions"""
@@ -64,6 +118,9 @@ class ExaminationSessionLBDPredictor(BaseLBDPredictor):
     # Define the model cache object
     model_cache = ExaminationSessionCache
 
+    # Define the executor of the background revalidations of the stale LBD probabilities
+    revalidation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='revalidation')
+
     @classmethod
     def predict_lbd_probability(cls, user, instance):
         """Predicts the LBD probability for an examination session instance"""
@@ -73,15 +130,177 @@ class ExaminationSessionLBDPredictor(BaseLBDPredictor):
 
         # Try to get the cached LBD probability (if not in the cache, compute it and cache it)
         lbd_probability = cache_instance.get_cached_lbd_probability()
-        if lbd_probability:
+        if lbd_probability is not cache_instance.MISSING:
             return lbd_probability
 
-        # Predict the LBD probability
-        lbd_probability = predict_lbd_probability(user, process_features(instance), cls.predictor)
+        # Leave the computation to the prediction worker (if the predictions are precomputed)
+        if cls.precomputed:
+            PredictionJob.enqueue([instance], requeue=False)
+            return cache_instance.get_stale_lbd_probability() if cache_instance.STALE_WHILE_REVALIDATE else None
 
-        # Cache the predicted LBD probability (if not None)
+        # Serve the stale LBD probability (revalidated in the background)
+        lbd_probability = cls.get_stale_lbd_probability_many(user, [instance])[0]
         if lbd_probability is not None:
-            cache_instance.set_cached_lbd_probability(lbd_probability)
+            return lbd_probability
+
+        # Predict the LBD probability
+        return cls.compute_lbd_probability(user, instance)
+
+    @classmethod
+    def predict_lbd_probability_many(cls, user, instances):
+        """Predicts the LBD probabilities for multiple examination session instances (single predictor call)"""
+
+        # Try to get the cached LBD probabilities (single cache round trip)
+        instances = list(instances)
+        probabilities = cls.model_cache.get_many_cached_lbd_probabilities(instances)
+
+        # Get the examination sessions that are not in the cache
+        missing = [i for i, probability in enumerate(probabilities) if probability is cls.model_cache.MISSING]
+        if not missing:
+            return probabilities
+
+        # Leave the computation to the prediction worker (if the predictions are precomputed)
+        if cls.precomputed:
+            PredictionJob.enqueue([instances[i] for i in missing], requeue=False)
+            for i in missing:
+                probabilities[i] = cls.model_cache(instances[i]).get_stale_lbd_probability() \
+                    if cls.model_cache.STALE_WHILE_REVALIDATE else None
+            return probabilities
+
+        # Serve the stale LBD probabilities (revalidated in the background)
+        stale = cls.get_stale_lbd_probability_many(user, [instances[i] for i in missing])
+        for i, lbd_probability in zip(missing, stale):
+            probabilities[i] = lbd_probability
+
+        # Get the examination sessions with no stale LBD probability
+        missing = [i for i in missing if probabilities[i] is None]
+        if not missing:
+            return probabilities
+
+        # Predict the LBD probabilities (single predictor call for all the missing examination sessions)
+        predicted = cls.compute_lbd_probability_many(user, [instances[i] for i in missing])
+        for i, lbd_probability in zip(missing, predicted):
+            probabilities[i] = lbd_probability
+
+        # Return the predicted LBD probabilities
+        return probabilities
+
+    @classmethod
+    def compute_lbd_probability(cls, user, instance):
+        """Computes (and caches) the LBD probability for an examination session instance"""
+
+        # Prepare the model cache instance and the prediction cache
+        cache_instance = cls.model_cache(instance)
+        prediction_cache = PredictionCache(cls.predictor)
+
+        # Get the features (and try to get the prediction of the identical features from the cache)
+        features = process_features(instance)
+        features_hash = hash_features(features)
+        lbd_probability = prediction_cache.get_cached_predictions([features_hash])[0]
+
+        # Predict the LBD probability (and cache it by the features hash)
+        if lbd_probability is None:
+            lbd_probability = predict_lbd_probability(user, features, cls.predictor)
+            prediction_cache.set_cached_predictions([features_hash], [lbd_probability])
+
+        # Cache the predicted LBD probability (None is cached as no data if there are no features)
+        if lbd_probability is not None or features[1].size == 0:
+            cache_instance.set_cached_lbd_probability(lbd_probability, features_hash=features_hash)
 
         # Predict the LBD probability
         return lbd_probability
+
+    @classmethod
+    def compute_lbd_probability_many(cls, user, instances):
+        """Computes (and caches) the LBD probabilities for multiple examination session instances"""
+
+        # Prepare the prediction cache
+        prediction_cache = PredictionCache(cls.predictor)
+
+        # Get the features (and try to get the predictions of the identical features from the cache)
+        features = [process_features(instance) for instance in instances]
+        features_hashes = [hash_features(data) for data in features]
+        probabilities = prediction_cache.get_cached_predictions(features_hashes)
+
+        # Predict the missing LBD probabilities (single predictor call, identical features predicted once)
+        missing = {}
+        for i, (features_hash, lbd_probability) in enumerate(zip(features_hashes, probabilities)):
+            if lbd_probability is None:
+                missing.setdefault(features_hash, i)
+        if missing:
+            predicted = dict(zip(
+                missing.keys(),
+                predict_lbd_probabilities(user, [features[i] for i in missing.values()], cls.predictor)))
+            prediction_cache.set_cached_predictions(list(predicted.keys()), list(predicted.values()))
+            probabilities = [
+                predicted.get(features_hash) if lbd_probability is None else lbd_probability
+                for features_hash, lbd_probability in zip(features_hashes, probabilities)
+            ]
+
+        # Cache the predicted LBD probabilities (None is cached as no data if there are no features)
+        cached = [
+            (instance, lbd_probability, features_hash)
+            for instance, (_, values), features_hash, lbd_probability
+            in zip(instances, features, features_hashes, probabilities)
+            if lbd_probability is not None or values.size == 0
+        ]
+        if cached:
+            cls.model_cache.set_many_cached_lbd_probabilities(*zip(*cached))
+
+        # Return the predicted LBD probabilities
+        return probabilities
+
+    @classmethod
+    def get_stale_lbd_probability_many(cls, user, instances):
+        """
+        Gets the stale LBD probabilities for multiple examination session instances (stale-while-revalidate).
+
+        The stale LBD probabilities are served if the stale-while-revalidate mode is on or if the predictor API
+        is failing (circuit breaker is open), and they are revalidated in the background (unless the predictor
+        API is failing).
+
+        :param user: logged-in user
+        :type user: User instance
+        :param instances: model instances
+        :param instances: iterable of objects
+        :return: stale LBD probabilities (None if there is no stale LBD probability)
+        :rtype: list
+        """
+
+        # Check if the stale LBD probabilities are to be served
+        instances = list(instances)
+        breaker_open = predictor_breaker.is_open()
+        if not (cls.model_cache.STALE_WHILE_REVALIDATE or breaker_open):
+            return [None] * len(instances)
+
+        # Get the stale LBD probabilities
+        probabilities = [cls.model_cache(instance).get_stale_lbd_probability() for instance in instances]
+
+        # Revalidate the stale LBD probabilities in the background (single revalidation in flight per instance)
+        if not breaker_open:
+            revalidated = [
+                instance for instance, lbd_probability in zip(instances, probabilities)
+                if lbd_probability is not None and cls.model_cache(instance).claim_revalidation()
+            ]
+            if revalidated:
+                cls.revalidation_executor.submit(cls.revalidate_lbd_probability_many, user, revalidated)
+
+        # Return the stale LBD probabilities
+        return probabilities
+
+    @classmethod
+    def revalidate_lbd_probability_many(cls, user, instances):
+        """Revalidates (computes and caches) the stale LBD probabilities (run in the background)"""
+        try:
+            cls.compute_lbd_probability_many(user, instances)
+        except Exception as e:
+            logger.exception(f'Revalidation of the LBD probabilities failed: {type(e).__name__}: {e}')
+        finally:
+            for instance in instances:
+                cls.model_cache(instance).release_revalidation()
+            connections.close_all()
+
+    @classmethod
+    def get_pending_session_ids(cls, instances):
+        """Returns the IDs of the examination sessions whose LBD probabilities are still being precomputed"""
+        return PredictionJob.get_pending_session_ids(instances) if cls.precomputed else set()
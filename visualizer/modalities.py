@@ -7,19 +7,14 @@ import plotly.figure_factory as ff
 from plotly.offline import plot
 from itertools import chain
 from django.conf import settings
-from subjects.models_utils import compute_difference_from_norm
+from subjects.models_utils import get_most_differentiating_features
 
 
-def get_most_differentiating_features_graph(session_data, norm_data, modality, top_n=10):
+def get_most_differentiating_features_graph(comparison, modality, top_n=10):
     """Gets the most differentiating features of a given modality (in a given session)"""
 
-    # Prepare the comparison of the features to the norm
-    comparison = compute_difference_from_norm(session_data, norm_data, modality)
-    comparison = [c for c in comparison if c['orig value'] and c['norm value']]
-
-    # Get the most discriminating features
-    comparison = list(sorted(comparison, key=lambda x: x['difference'], reverse=True))
-    comparison = comparison[:top_n] if top_n < len(comparison) else comparison
+    # Get the most discriminating features (ranked by the comparison of the features to the norm)
+    comparison = get_most_differentiating_features(comparison, top_n)
 
     # Prepare the comparison
     comparison = list(chain.from_iterable([
@@ -65,21 +60,21 @@ def get_most_differentiating_features_graph(session_data, norm_data, modality, t
     return fig
 
 
-def visualize_most_differentiating_features(session_data, norm_data, modality, top_n=10):
+def visualize_most_differentiating_features(comparison, modality, top_n=10):
     """Gets the visualization of the most differentiating features of a given modality (in a given session)"""
 
     # Get the most differentiating features of a given modality (in a given session)
-    fig = get_most_differentiating_features_graph(session_data, norm_data, modality, top_n)
+    fig = get_most_differentiating_features_graph(comparison, modality, top_n)
 
     # Return the prepared graph object (as a DIV element)
     return plot(fig, output_type='div', include_plotlyjs=False, show_link=False, link_text='') if fig else ''
 
 
-def save_most_differentiating_features(session_data, norm_data, modality, top_n=10):
+def save_most_differentiating_features(comparison, modality, top_n=10):
     """Saves the most differentiating features of a given modality (in a given session)"""
 
     # Get the most differentiating features of a given modality (in a given session)
-    fig = get_most_differentiating_features_graph(session_data, norm_data, modality, top_n)
+    fig = get_most_differentiating_features_graph(comparison, modality, top_n)
     if not fig:
         return ''
 
@@ -93,19 +88,11 @@ def save_most_differentiating_features(session_data, norm_data, modality, top_n=
     return save_path
 
 
-def get_most_differentiating_features_graph_and_table(session_data, norm_data, modality, top_n=10):
+def get_most_differentiating_features_graph_and_table(comparison, modality, top_n=10):
     """Gets the most differentiating features of a given modality (in a given session)"""
 
-    # Prepare the comparison of the features to the norm
-    comparison = compute_difference_from_norm(session_data, norm_data, modality)
-    comparison = [c for c in comparison if c['orig value'] and c['norm value']]
-
-    # Get the most discriminating features
-    comparison = list(sorted(comparison, key=lambda x: x['difference'], reverse=True))
-    comparison = comparison[:top_n] if top_n < len(comparison) else comparison
-
-    # work only features with a reasonable data
-    comparison = [c for c in comparison if c['orig value'] and c['norm value'] and c['difference']]
+    # Get the most discriminating features (ranked by the comparison of the features to the norm)
+    comparison = get_most_differentiating_features(comparison, top_n)
     if not comparison:
         return None
 
@@ -199,21 +186,21 @@ def get_most_differentiating_features_graph_and_table(session_data, norm_data, m
     return fig
 
 
-def visualize_most_differentiating_features_and_table(session_data, norm_data, modality, top_n=10):
+def visualize_most_differentiating_features_and_table(comparison, modality, top_n=10):
     """Gets the visualization of the most differentiating features of a given modality (in a given session)"""
 
     # Get the most differentiating features of a given modality (in a given session)
-    fig = get_most_differentiating_features_graph_and_table(session_data, norm_data, modality, top_n)
+    fig = get_most_differentiating_features_graph_and_table(comparison, modality, top_n)
 
     # Return the prepared graph object (as a DIV element)
     return plot(fig, output_type='div', include_plotlyjs=False, show_link=False, link_text='') if fig else ''
 
 
-def save_most_differentiating_features_and_table(session_data, norm_data, modality, top_n=10):
+def save_most_differentiating_features_and_table(comparison, modality, top_n=10):
     """Saves the most differentiating features of a given modality (in a given session)"""
 
     # Get the most differentiating features of a given modality (in a given session)
-    fig = get_most_differentiating_features_graph_and_table(session_data, norm_data, modality, top_n)
+    fig = get_most_differentiating_features_graph_and_table(comparison, modality, top_n)
     if not fig:
         return ''
 
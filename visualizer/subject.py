@@ -4,20 +4,24 @@ import pandas as pd
 import plotly.express as px
 from plotly.offline import plot
 from django.conf import settings
-from subjects.models import ExaminationSession
 from subjects.views_predictors import ExaminationSessionLBDPredictor
 
 
 def compute_evolution_of_predictions(user, subject):
     """Computes the evolution of preDLB of a subject"""
 
-    # Compute the predicted probabilities (per session)
+    # Get the examination sessions (prefetched if available)
+    sessions = list(subject.examination_sessions.all())
+
+    # Compute the predicted probabilities (per session; the sessions are predicted at once)
     probabilities = [
         {
             'examination session': s.session_number,
-            'preDLB probability': ExaminationSessionLBDPredictor.predict_lbd_probability(user, s)
+            'preDLB probability': lbd_probability
         }
-        for s in ExaminationSession.objects.filter(subject=subject)
+        for s, lbd_probability in zip(
+            sessions,
+            ExaminationSessionLBDPredictor.predict_lbd_probability_many(user, sessions))
     ]
 
     # Return the predicted probabilities